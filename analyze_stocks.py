@@ -6,6 +6,13 @@ from loguru import logger
 from datetime import datetime
 from dotenv import load_dotenv
 
+# 可选依赖：polars的calamine后端（Rust实现）读取XLSX比openpyxl快数倍
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    POLARS_AVAILABLE = False
+
 class DeepseekAnalyzer:
     def __init__(self, api_key, api_url, system_prompt_file="system_prompt.md"):
         self.api_key = api_key
@@ -264,9 +271,19 @@ def main():
     reports_dir = "analysis_reports"
     os.makedirs(reports_dir, exist_ok=True)
     
-    # 读取Excel文件
+    # 读取Excel文件（优先使用calamine后端加速）
     try:
-        df = pd.read_excel('stock_analysis_data.xlsx')
+        df = None
+        if POLARS_AVAILABLE:
+            # polars的calamine引擎在调用时还需要fastexcel；
+            # 缺包或读取失败都退回pandas，不让加速路径变成硬依赖
+            try:
+                df = pl.read_excel('stock_analysis_data.xlsx',
+                                   engine='calamine').to_pandas()
+            except Exception as e:
+                logger.warning(f"polars读取失败，退回pandas: {e}")
+        if df is None:
+            df = pd.read_excel('stock_analysis_data.xlsx')
         logger.info(f"成功读取Excel文件，共{len(df)}只股票")
     except Exception as e:
         logger.error(f"读取Excel文件失败: {e}")
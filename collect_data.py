@@ -9,11 +9,51 @@ from loguru import logger
 import argparse
 from tqdm import tqdm
 import json
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment
 from dotenv import load_dotenv
 import config
 
+# 可选依赖：calamine(Rust实现)解析XLSX比默认的openpyxl快数倍
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# 可选依赖：orjson(Rust实现)批次缓存序列化/解析比标准库快数倍
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 可选依赖：numba把按行的最新值/均值归约JIT编译为多核SIMD循环
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _reduce_latest_mean(a):
+        """逐行扫描float64矩阵，返回(最后一个非NaN值, 非NaN均值)两个数组"""
+        n = a.shape[0]
+        latest = np.empty(n)
+        mean = np.empty(n)
+        for i in prange(n):
+            s = 0.0
+            c = 0
+            last = np.nan
+            for j in range(a.shape[1]):
+                v = a[i, j]
+                if v == v:
+                    s += v
+                    c += 1
+                    last = v
+            latest[i] = last
+            mean[i] = s / c if c else np.nan
+        return latest, mean
+
 class TokenManager:
     """管理多个Tushare token的切换和重试逻辑"""
     
@@ -169,18 +209,27 @@ class StockDataCollector:
             
         cache_path = self._get_batch_cache_path(batch_index)
         try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(batch_data, f, ensure_ascii=False, indent=2)
+            # 紧凑格式写入（不带缩进），文件体积小、重读解析也更快
+            if ORJSON_AVAILABLE:
+                with open(cache_path, 'wb') as f:
+                    f.write(orjson.dumps(batch_data))
+            else:
+                with open(cache_path, 'w', encoding='utf-8') as f:
+                    json.dump(batch_data, f, ensure_ascii=False,
+                              separators=(',', ':'))
         except Exception as e:
             logger.error(f"保存批次缓存失败 {cache_path}: {e}")
-            
+
     def _load_batch_from_cache(self, batch_index):
         """从缓存加载批次数据"""
         cache_path = self._get_batch_cache_path(batch_index)
         if not os.path.exists(cache_path):
             return None
-            
+
         try:
+            if ORJSON_AVAILABLE:
+                with open(cache_path, 'rb') as f:
+                    return orjson.loads(f.read())
             with open(cache_path, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
@@ -392,191 +441,217 @@ class StockDataCollector:
 
 class ExcelOptimizer:
     """Excel数据优化器"""
+
+    # 多年指标列的前缀
+    METRIC_PREFIXES = ('roe', 'gross_margin', 'net_margin', 'pe', 'pb', 'dividend', 'total_assets')
+
+    # 基础信息列（各视图都会用到）
+    BASE_COLUMNS = ('stock_code', 'stock_name', 'industry', 'need_analysis')
+
     def __init__(self, df):
         self.df = df
-        
+        # 指标列分组只在初始化时扫描一次，各视图方法直接复用
+        self._col_groups = {}
+        # 按指标切出的子DataFrame缓存，避免各视图重复切片拷贝
+        self._block_cache = {}
+        if df is not None:
+            for prefix in self.METRIC_PREFIXES:
+                self._col_groups[prefix] = [c for c in df.columns if c.startswith(prefix + '_')]
+
+    @classmethod
+    def from_excel(cls, excel_file='stock_analysis_data.xlsx', cache_dir='.cache',
+                   metrics_only=False):
+        """从Excel文件加载数据（calamine引擎加速，parquet缓存避免重复解析）
+
+        metrics_only=True时只加载基础列+各指标年度列，宽表内存占用按列数比例下降
+        """
+        parquet_path = os.path.join(
+            cache_dir, os.path.splitext(os.path.basename(excel_file))[0] + '.parquet')
+
+        # 列投影：先只读标题行，算出视图真正需要的列
+        columns = None
+        if metrics_only:
+            header = pd.read_excel(excel_file, nrows=0).columns
+            prefixes = tuple(p + '_' for p in cls.METRIC_PREFIXES)
+            columns = [c for c in header
+                       if c in cls.BASE_COLUMNS or c.startswith(prefixes)]
+
+        # parquet缓存比xlsx新时直接读缓存（保留列dtype，且支持文件层列投影）
+        try:
+            if (os.path.exists(parquet_path)
+                    and os.path.getmtime(parquet_path) > os.path.getmtime(excel_file)):
+                return cls(pd.read_parquet(parquet_path, columns=columns))
+        except Exception as e:
+            logger.warning(f"读取parquet缓存失败，回退到Excel: {e}")
+
+        if CALAMINE_AVAILABLE:
+            df = pd.read_excel(excel_file, engine='calamine', usecols=columns)
+        else:
+            df = pd.read_excel(excel_file, usecols=columns)
+
+        # 写回parquet缓存供下次加载；只缓存全量数据，避免缓存缺列
+        if columns is None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                df.to_parquet(parquet_path)
+            except Exception as e:
+                logger.warning(f"写入parquet缓存失败: {e}")
+
+        return cls(df)
+
+    def _metric_block(self, prefix):
+        """按指标前缀取多年数据块（O(1)缓存命中，代替重复列扫描+切片）"""
+        block = self._block_cache.get(prefix)
+        if block is None:
+            block = self.df[self._col_groups[prefix]]
+            self._block_cache[prefix] = block
+        return block
+
+
     def create_summary_view(self):
         """创建汇总视图 - 只显示关键信息"""
         if self.df is None:
             return None
-            
-        # 基本信息列
+
+        # 先在dict里攒好所有列数组，最后一次性构造DataFrame
+        # （避免逐列插入的碎片化和list-of-dicts的dtype推断）
         basic_cols = ['stock_code', 'stock_name', 'industry', 'need_analysis']
-        
-        # 计算各指标的最新值和平均值
-        summary_data = []
-        
-        for _, row in self.df.iterrows():
-            summary_row = {}
-            
-            # 基本信息
-            for col in basic_cols:
-                if col in row:
-                    summary_row[col] = row[col]
-            
-            # ROE汇总
-            roe_cols = [col for col in self.df.columns if col.startswith('roe_')]
-            roe_values = [row[col] for col in roe_cols if pd.notna(row[col])]
-            if roe_values:
-                summary_row['roe_最新'] = roe_values[-1]
-                summary_row['roe_平均'] = np.mean(roe_values)
-                summary_row['roe_趋势'] = '上升' if len(roe_values) > 1 and roe_values[-1] > roe_values[0] else '下降'
-            
-            # 毛利率汇总
-            gm_cols = [col for col in self.df.columns if col.startswith('gross_margin_')]
-            gm_values = [row[col] for col in gm_cols if pd.notna(row[col])]
-            if gm_values:
-                summary_row['毛利率_最新'] = gm_values[-1]
-                summary_row['毛利率_平均'] = np.mean(gm_values)
-            
-            # 净利率汇总
-            nm_cols = [col for col in self.df.columns if col.startswith('net_margin_')]
-            nm_values = [row[col] for col in nm_cols if pd.notna(row[col])]
-            if nm_values:
-                summary_row['净利率_最新'] = nm_values[-1]
-                summary_row['净利率_平均'] = np.mean(nm_values)
-            
-            # PE汇总
-            pe_cols = [col for col in self.df.columns if col.startswith('pe_')]
-            pe_values = [row[col] for col in pe_cols if pd.notna(row[col])]
-            if pe_values:
-                summary_row['PE_最新'] = pe_values[-1]
-                summary_row['PE_平均'] = np.mean(pe_values)
-            
-            # 股息率汇总
-            div_cols = [col for col in self.df.columns if col.startswith('dividend_')]
-            div_values = [row[col] for col in div_cols if pd.notna(row[col])]
-            if div_values:
-                summary_row['股息率_最新'] = div_values[-1]
-                summary_row['股息率_平均'] = np.mean(div_values)
-            
-            # 综合评分（简单评分逻辑）
-            score = 0
-            if 'roe_平均' in summary_row and summary_row['roe_平均'] > 15:
-                score += 20
-            if '毛利率_平均' in summary_row and summary_row['毛利率_平均'] > 30:
-                score += 20
-            if '净利率_平均' in summary_row and summary_row['净利率_平均'] > 10:
-                score += 20
-            if 'PE_平均' in summary_row and 10 < summary_row['PE_平均'] < 25:
-                score += 20
-            if '股息率_平均' in summary_row and summary_row['股息率_平均'] > 2:
-                score += 20
-            
-            summary_row['综合评分'] = score
-            summary_data.append(summary_row)
-        
-        return pd.DataFrame(summary_data)
+        data = {c: self.df[c].to_numpy() for c in basic_cols if c in self.df.columns}
+
+        # 各指标的最新值/平均值（整列向量化计算，避免逐行iterrows）
+        metric_groups = [
+            ('roe', 'roe_最新', 'roe_平均'),
+            ('gross_margin', '毛利率_最新', '毛利率_平均'),
+            ('net_margin', '净利率_最新', '净利率_平均'),
+            ('pe', 'PE_最新', 'PE_平均'),
+            ('dividend', '股息率_最新', '股息率_平均'),
+        ]
+
+        for prefix, latest_name, avg_name in metric_groups:
+            cols = self._col_groups[prefix]
+            if not cols:
+                continue
+            block = self._metric_block(prefix)
+            # 最新值 = 每行最后一个非空值；平均值 = 行均值
+            if NUMBA_AVAILABLE:
+                latest, mean = _reduce_latest_mean(block.to_numpy(dtype=np.float64))
+            else:
+                latest = block.ffill(axis=1).iloc[:, -1].to_numpy(dtype=np.float64)
+                mean = block.mean(axis=1).to_numpy(dtype=np.float64)
+            data[latest_name] = latest
+            data[avg_name] = mean
+
+        # ROE趋势：最新非空值高于最早非空值视为上升
+        if 'roe_最新' in data:
+            roe_first = self._metric_block('roe').bfill(axis=1).iloc[:, 0].to_numpy(dtype=np.float64)
+            latest_roe = data['roe_最新']
+            trend = pd.Series(np.where(latest_roe > roe_first, '上升', '下降'))
+            data['roe_趋势'] = trend.where(~np.isnan(latest_roe)).to_numpy()
+
+        # 综合评分（每项20分，向量化布尔求和）
+        score = np.zeros(len(self.df), dtype=int)
+        score_rules = [
+            ('roe_平均', lambda s: s > 15),
+            ('毛利率_平均', lambda s: s > 30),
+            ('净利率_平均', lambda s: s > 10),
+            ('PE_平均', lambda s: (s > 10) & (s < 25)),
+            ('股息率_平均', lambda s: s > 2),
+        ]
+        for col, rule in score_rules:
+            if col in data:
+                score += rule(data[col]) * 20
+        data['综合评分'] = score
+
+        return pd.DataFrame(data, index=self.df.index)
     
     def create_sector_analysis(self):
         """创建行业分析视图"""
         if self.df is None:
             return None
-            
-        # 按行业分组统计
-        sector_stats = []
-        
-        for industry in self.df['industry'].unique():
-            if pd.isna(industry):
-                continue
-                
-            industry_data = self.df[self.df['industry'] == industry]
-            
-            # 计算行业平均指标
-            roe_cols = [col for col in self.df.columns if col.startswith('roe_')]
-            pe_cols = [col for col in self.df.columns if col.startswith('pe_')]
-            
-            sector_row = {
-                '行业': industry,
-                '公司数量': len(industry_data),
-                '平均ROE': industry_data[roe_cols].mean().mean(),
-                '平均PE': industry_data[pe_cols].mean().mean(),
-                '高ROE公司数': (industry_data[roe_cols].mean(axis=1) > 15).sum(),
-                '需要分析数': (industry_data['need_analysis'] == True).sum()
-            }
-            sector_stats.append(sector_row)
-        
-        return pd.DataFrame(sector_stats).sort_values('平均ROE', ascending=False)
+
+        roe_cols = self._col_groups['roe']
+        pe_cols = self._col_groups['pe']
+
+        # 先算每只股票的ROE/PE均值，再用一次groupby完成全部行业聚合
+        stats = pd.DataFrame({
+            'industry': self.df['industry'],
+            '_roe': self._metric_block('roe').mean(axis=1),
+            '_pe': self._metric_block('pe').mean(axis=1),
+            '_need': self.df['need_analysis'] == True,
+        })
+
+        sector_df = stats.dropna(subset=['industry']).groupby('industry').agg(
+            公司数量=('_roe', 'size'),
+            平均ROE=('_roe', 'mean'),
+            平均PE=('_pe', 'mean'),
+            高ROE公司数=('_roe', lambda s: (s > 15).sum()),
+            需要分析数=('_need', 'sum'),
+        ).reset_index().rename(columns={'industry': '行业'})
+
+        return sector_df.sort_values('平均ROE', ascending=False)
     
     def create_filtered_views(self):
         """创建筛选视图"""
         if self.df is None:
             return {}
             
-        views = {}
-        
-        # 高ROE股票（ROE均值>15%）
-        roe_cols = [col for col in self.df.columns if col.startswith('roe_')]
-        high_roe_mask = self.df[roe_cols].mean(axis=1) > 15
-        views['高ROE股票'] = self.df[high_roe_mask][['stock_code', 'stock_name', 'industry'] + roe_cols]
-        
-        # 低PE股票（PE均值<20）
-        pe_cols = [col for col in self.df.columns if col.startswith('pe_')]
-        low_pe_mask = self.df[pe_cols].mean(axis=1) < 20
-        views['低PE股票'] = self.df[low_pe_mask][['stock_code', 'stock_name', 'industry'] + pe_cols]
-        
-        # 高股息股票（股息率均值>3%）
-        div_cols = [col for col in self.df.columns if col.startswith('dividend_')]
-        high_div_mask = self.df[div_cols].mean(axis=1) > 3
-        views['高股息股票'] = self.df[high_div_mask][['stock_code', 'stock_name', 'industry'] + div_cols]
-        
-        # 稳定盈利股票（净利率连续正值）
-        nm_cols = [col for col in self.df.columns if col.startswith('net_margin_')]
-        stable_profit_mask = (self.df[nm_cols] > 0).all(axis=1)
-        views['稳定盈利股票'] = self.df[stable_profit_mask][['stock_code', 'stock_name', 'industry'] + nm_cols]
-        
+        base_cols = ['stock_code', 'stock_name', 'industry']
+
+        # 四个筛选条件的统计量一次算齐，每个指标块只扫描一遍
+        # min(skipna=False)：任一年缺失或非正即出局，与逐年(>0).all等价
+        stats = pd.DataFrame({
+            'mean_roe': self._metric_block('roe').mean(axis=1),
+            'mean_pe': self._metric_block('pe').mean(axis=1),
+            'mean_div': self._metric_block('dividend').mean(axis=1),
+            'min_nm': self._metric_block('net_margin').min(axis=1, skipna=False),
+        })
+
+        views = {
+            # 高ROE股票（ROE均值>15%）
+            '高ROE股票': self.df.loc[stats['mean_roe'] > 15, base_cols + self._col_groups['roe']],
+            # 低PE股票（PE均值<20）
+            '低PE股票': self.df.loc[stats['mean_pe'] < 20, base_cols + self._col_groups['pe']],
+            # 高股息股票（股息率均值>3%）
+            '高股息股票': self.df.loc[stats['mean_div'] > 3, base_cols + self._col_groups['dividend']],
+            # 稳定盈利股票（净利率连续正值）
+            '稳定盈利股票': self.df.loc[stats['min_nm'] > 0, base_cols + self._col_groups['net_margin']],
+        }
+
         return views
     
-    def _apply_styles(self, excel_file):
-        """应用Excel样式"""
-        try:
-            wb = load_workbook(excel_file)
-            
-            # 为每个工作表添加样式
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                
-                # 设置标题行样式
-                header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                header_font = Font(color="FFFFFF", bold=True)
-                
-                for col in range(1, ws.max_column + 1):
-                    cell = ws.cell(row=1, column=col)
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = Alignment(horizontal="center")
-                
-                # 设置数据行样式
-                for row in range(2, ws.max_row + 1):
-                    for col in range(1, ws.max_column + 1):
-                        cell = ws.cell(row=row, column=col)
-                        cell.alignment = Alignment(horizontal="center")
-                        
-                        # 为数值类型的单元格设置条件格式
-                        if isinstance(cell.value, (int, float)):
-                            if cell.value is not None and cell.value < 0:
-                                cell.font = Font(color="FF0000")  # 负值显示红色
-                            elif cell.value is not None and cell.value > 20:
-                                cell.font = Font(color="008000")  # 高值显示绿色
-                
-                # 自动调整列宽
-                for column in ws.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 20)
-                    ws.column_dimensions[column_letter].width = adjusted_width
-            
-            wb.save(excel_file)
-            
-        except Exception as e:
-            logger.error(f"应用样式失败: {e}")
-    
+    def _write_styled_sheet(self, writer, df_out, sheet_name):
+        """用共享格式对象流式写入一个工作表（标题行+条件格式+列宽）"""
+        workbook = writer.book
+
+        # constant_memory模式下行必须顺序写入：先手工写标题行，再写数据
+        ws = workbook.add_worksheet(sheet_name)
+        writer.sheets[sheet_name] = ws
+        ws.write_row(0, 0, [str(c) for c in df_out.columns], self._header_fmt)
+        df_out.to_excel(writer, sheet_name=sheet_name, startrow=1, header=False, index=False)
+
+        nrows, ncols = df_out.shape
+        # 条件格式代替逐单元格字体设置：负值红色，>20绿色
+        ws.conditional_format(1, 0, nrows, ncols - 1,
+                              {'type': 'cell', 'criteria': '<', 'value': 0, 'format': self._neg_fmt})
+        ws.conditional_format(1, 0, nrows, ncols - 1,
+                              {'type': 'cell', 'criteria': '>', 'value': 20, 'format': self._high_fmt})
+
+        # 列宽取列名与数据的最大显示长度（向量化str.len代替逐单元格len）
+        data_widths = df_out.astype(str).apply(lambda s: s.str.len().max()).fillna(0)
+        for i, col in enumerate(df_out.columns):
+            width = min(max(len(str(col)), int(data_widths.iloc[i])) + 2, 20)
+            ws.set_column(i, i, width, self._center_fmt)
+
+    def _init_formats(self, workbook):
+        """注册全工作簿共享的格式对象，避免逐单元格样式分配"""
+        self._header_fmt = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#366092',
+            'align': 'center', 'valign': 'vcenter'
+        })
+        self._center_fmt = workbook.add_format({'align': 'center'})
+        self._neg_fmt = workbook.add_format({'font_color': '#FF0000'})
+        self._high_fmt = workbook.add_format({'font_color': '#008000'})
+
     def generate_analysis_suggestions(self):
         """生成分析建议"""
         if self.df is None:
@@ -610,41 +685,42 @@ class ExcelOptimizer:
         return '\n'.join(suggestions)
     
     def save_optimized_excel(self, output_file='stock_analysis_optimized.xlsx'):
-        """保存优化后的Excel文件"""
+        """保存优化后的Excel文件（xlsxwriter流式写入，单遍完成样式）"""
         if self.df is None:
             logger.error("没有数据可保存")
             return False
-            
+
         try:
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+            with pd.ExcelWriter(output_file, engine='xlsxwriter',
+                                engine_kwargs={'options': {'constant_memory': True}}) as writer:
+                self._init_formats(writer.book)
+
                 # 1. 汇总视图
                 summary_df = self.create_summary_view()
                 if summary_df is not None:
-                    summary_df.to_excel(writer, sheet_name='汇总视图', index=False)
+                    self._write_styled_sheet(writer, summary_df, '汇总视图')
                     logger.info(f"汇总视图已创建，包含{len(summary_df)}行数据")
-                
+
                 # 2. 行业分析
                 sector_df = self.create_sector_analysis()
                 if sector_df is not None:
-                    sector_df.to_excel(writer, sheet_name='行业分析', index=False)
+                    self._write_styled_sheet(writer, sector_df, '行业分析')
                     logger.info(f"行业分析已创建，包含{len(sector_df)}个行业")
-                
+
                 # 3. 筛选视图
                 filtered_views = self.create_filtered_views()
                 for view_name, view_df in filtered_views.items():
                     if not view_df.empty:
-                        view_df.to_excel(writer, sheet_name=view_name, index=False)
+                        self._write_styled_sheet(writer, view_df, view_name)
                         logger.info(f"{view_name}已创建，包含{len(view_df)}只股票")
-                
+
                 # 4. 原始数据（可选）
-                self.df.to_excel(writer, sheet_name='原始数据', index=False)
+                self._write_styled_sheet(writer, self.df, '原始数据')
                 logger.info("原始数据已保留")
-            
-            # 添加样式
-            self._apply_styles(output_file)
+
             logger.info(f"优化后的Excel文件已保存: {output_file}")
             return True
-            
+
         except Exception as e:
             logger.error(f"保存Excel文件失败: {e}")
             return False
@@ -731,21 +807,34 @@ def create_sqlite_database(db_path='stock_analysis.db'):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS financial_metrics (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            stock_code TEXT,
+            stock_code TEXT NOT NULL,
             year INTEGER,
-            metric_name TEXT,
+            metric_name TEXT NOT NULL,
             metric_value REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (stock_code) REFERENCES stocks (stock_code)
         )
     ''')
-    
-    # 创建索引提高查询性能
+
+    # 旧库没有唯一约束，可能已积累重复(股票, 年份, 指标)行；
+    # 建唯一索引前先按每组保留最新一条去重，否则建索引直接报
+    # UNIQUE constraint failed
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_stock_year 
-        ON financial_metrics (stock_code, year)
+        DELETE FROM financial_metrics
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM financial_metrics
+            GROUP BY stock_code, year, metric_name
+        )
     ''')
-    
+    if cursor.rowcount > 0:
+        logger.info(f"已清理 {cursor.rowcount} 条重复的财务指标记录")
+
+    # 唯一索引：写入时即去重，同时覆盖(stock_code, year)前缀查询
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_metric
+        ON financial_metrics (stock_code, year, metric_name)
+    ''')
+
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_metric_name 
         ON financial_metrics (metric_name)
@@ -757,36 +846,48 @@ def create_sqlite_database(db_path='stock_analysis.db'):
 
 def save_to_sqlite(data, db_path='stock_analysis.db'):
     """保存数据到SQLite数据库"""
-    conn = sqlite3.connect(db_path)
-    
-    for _, row in data.iterrows():
-        # 插入股票基本信息
-        conn.execute('''
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    base_cols = {'stock_code', 'stock_name', 'industry', 'need_analysis'}
+
+    # 先在内存里攒好两张表的行，再单事务executemany写入：
+    # 逐行execute每条都要重复解析SQL，攒批后只剩一次语句准备
+    stock_rows = list(data[['stock_code', 'stock_name', 'industry']]
+                      .itertuples(index=False, name=None))
+
+    # 按列解析指标名/年份（每列只拆一次），列内按值过滤NaN
+    codes = data['stock_code']
+    metric_rows = []
+    for col in data.columns:
+        if col in base_cols or '_' not in col:
+            continue
+        parts = col.split('_')
+        metric_name = '_'.join(parts[:-1])
+        year = parts[-1]
+        if not year.isdigit():
+            continue
+        year = int(year)
+        for code, value in zip(codes, data[col]):
+            if pd.notna(value):
+                metric_rows.append((code, year, metric_name, float(value)))
+
+    try:
+        conn.execute('BEGIN')
+        conn.executemany('''
             INSERT OR REPLACE INTO stocks (stock_code, stock_name, industry)
             VALUES (?, ?, ?)
-        ''', (row['stock_code'], row['stock_name'], row['industry']))
-        
-        # 插入财务指标数据
-        for col in row.index:
-            if col in ['stock_code', 'stock_name', 'industry', 'need_analysis']:
-                continue
-                
-            # 解析指标名称和年份
-            if '_' in col:
-                parts = col.split('_')
-                if len(parts) >= 2:
-                    metric_name = '_'.join(parts[:-1])
-                    year = parts[-1]
-                    
-                    if pd.notna(row[col]) and year.isdigit():
-                        conn.execute('''
-                            INSERT OR REPLACE INTO financial_metrics 
-                            (stock_code, year, metric_name, metric_value)
-                            VALUES (?, ?, ?, ?)
-                        ''', (row['stock_code'], int(year), metric_name, float(row[col])))
-    
-    conn.commit()
-    conn.close()
+        ''', stock_rows)
+        conn.executemany('''
+            INSERT OR REPLACE INTO financial_metrics
+            (stock_code, year, metric_name, metric_value)
+            VALUES (?, ?, ?, ?)
+        ''', metric_rows)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
     logger.info(f"数据已保存到SQLite数据库: {db_path}")
 
 def main():
@@ -852,12 +953,13 @@ def main():
         
         all_results = []
         
-        # 按批次处理
-        for i in tqdm(range(total_batches), desc="处理批次"):
-            start_idx = i * args.batch_size
-            end_idx = min((i + 1) * args.batch_size, len(stocks))
-            stocks_batch = stocks.iloc[start_idx:end_idx]
-            
+        # 按批次处理：边界直接由range步进给出，免去每轮乘法+min截断；
+        # iloc越界切片本身安全，尾批自动取到末尾
+        batch_starts = range(0, len(stocks), args.batch_size)
+        for i, start_idx in enumerate(tqdm(batch_starts, desc="处理批次",
+                                           total=total_batches)):
+            stocks_batch = stocks.iloc[start_idx:start_idx + args.batch_size]
+
             # 处理当前批次
             batch_data = collector.process_batch(
                 stocks_batch,
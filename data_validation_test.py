@@ -96,69 +96,80 @@ class DataValidator:
             logger.error(f"获取股票 {stock_code} 数据库数据失败: {e}")
             return {}
     
-    def get_online_data(self, stock_code: str) -> Dict:
-        """从网上获取股票实时数据"""
-        try:
-            # 转换股票代码格式
-            if stock_code.endswith('.SZ'):
-                code = '0' + stock_code.replace('.SZ', '')
-            elif stock_code.endswith('.SH'):
-                code = '1' + stock_code.replace('.SH', '')
-            else:
-                return {}
-            
-            # 使用新浪财经API获取实时数据
-            url = f"http://hq.sinajs.cn/list={code}"
-            
-            response = self.session.get(url, timeout=10)
-            response.encoding = 'gbk'
-            
-            if response.status_code == 200:
-                content = response.text
-                if 'var hq_str_' in content:
-                    # 解析新浪财经数据
-                    data_str = content.split('"')[1]
-                    if data_str:
-                        data_parts = data_str.split(',')
-                        if len(data_parts) >= 10:
+    def _fetch_sina(self, stock_code: str) -> Optional[Dict]:
+        """从新浪财经API获取实时数据，失败返回None"""
+        # 转换股票代码格式
+        if stock_code.endswith('.SZ'):
+            code = '0' + stock_code.replace('.SZ', '')
+        elif stock_code.endswith('.SH'):
+            code = '1' + stock_code.replace('.SH', '')
+        else:
+            return None
+
+        url = f"http://hq.sinajs.cn/list={code}"
+
+        response = self.session.get(url, timeout=10)
+        response.encoding = 'gbk'
+
+        if response.status_code == 200:
+            content = response.text
+            if 'var hq_str_' in content:
+                # 解析新浪财经数据
+                data_str = content.split('"')[1]
+                if data_str:
+                    data_parts = data_str.split(',')
+                    if len(data_parts) >= 10:
+                        return {
+                            'name': data_parts[0],
+                            'current_price': float(data_parts[3]) if data_parts[3] else 0,
+                            'volume': float(data_parts[8]) if data_parts[8] else 0,
+                            'market_cap': float(data_parts[3]) * float(data_parts[8]) if data_parts[3] and data_parts[8] else 0
+                        }
+
+        return None
+
+    def _fetch_tencent(self, stock_code: str) -> Optional[Dict]:
+        """从腾讯财经API获取实时数据，失败返回None"""
+        tencent_code = stock_code.replace('.SZ', '').replace('.SH', '')
+        if stock_code.endswith('.SZ'):
+            tencent_code = 'sz' + tencent_code
+        elif stock_code.endswith('.SH'):
+            tencent_code = 'sh' + tencent_code
+
+        tencent_url = f"http://qt.gtimg.cn/q={tencent_code}"
+        response = self.session.get(tencent_url, timeout=10)
+        response.encoding = 'gbk'
+
+        if response.status_code == 200:
+            content = response.text
+            if 'v_' in content:
+                data_str = content.split('"')[1]
+                if data_str:
+                    data_parts = data_str.split('~')
+                    if len(data_parts) >= 47:  # 确保数据足够长
+                        try:
                             return {
-                                'name': data_parts[0],
-                                'current_price': float(data_parts[3]) if data_parts[3] else 0,
-                                'volume': float(data_parts[8]) if data_parts[8] else 0,
-                                'market_cap': float(data_parts[3]) * float(data_parts[8]) if data_parts[3] and data_parts[8] else 0
+                                'name': data_parts[1],
+                                'current_price': float(data_parts[3]) if data_parts[3] and data_parts[3] != '0' else None,
+                                'pe_ratio': float(data_parts[39]) if len(data_parts) > 39 and data_parts[39] and data_parts[39] != '0' else None,
+                                'pb_ratio': float(data_parts[46]) if len(data_parts) > 46 and data_parts[46] and data_parts[46] != '0' else None
                             }
-            
-            # 备选：使用腾讯财经API
+                        except (ValueError, IndexError):
+                            pass
+
+        return None
+
+    def get_online_data(self, stock_code: str) -> Dict:
+        """从网上获取股票实时数据（新浪成功时直接返回，不再请求腾讯）"""
+        try:
+            sina_data = self._fetch_sina(stock_code)
+            if sina_data:
+                return sina_data
+
+            # 备选：使用腾讯财经API（仅在新浪失败时请求）
             time.sleep(0.5)  # 避免请求过快
-            tencent_code = stock_code.replace('.SZ', '').replace('.SH', '')
-            if stock_code.endswith('.SZ'):
-                tencent_code = 'sz' + tencent_code
-            elif stock_code.endswith('.SH'):
-                tencent_code = 'sh' + tencent_code
-            
-            tencent_url = f"http://qt.gtimg.cn/q={tencent_code}"
-            response = self.session.get(tencent_url, timeout=10)
-            response.encoding = 'gbk'
-            
-            if response.status_code == 200:
-                content = response.text
-                if 'v_' in content:
-                    data_str = content.split('"')[1]
-                    if data_str:
-                        data_parts = data_str.split('~')
-                        if len(data_parts) >= 47:  # 确保数据足够长
-                            try:
-                                return {
-                                    'name': data_parts[1],
-                                    'current_price': float(data_parts[3]) if data_parts[3] and data_parts[3] != '0' else None,
-                                    'pe_ratio': float(data_parts[39]) if len(data_parts) > 39 and data_parts[39] and data_parts[39] != '0' else None,
-                                    'pb_ratio': float(data_parts[46]) if len(data_parts) > 46 and data_parts[46] and data_parts[46] != '0' else None
-                                }
-                            except (ValueError, IndexError):
-                                pass
-            
-            return {}
-            
+            return self._fetch_tencent(stock_code) or {}
+
         except Exception as e:
             logger.warning(f"获取股票 {stock_code} 在线数据失败: {e}")
             return {}
@@ -199,24 +210,39 @@ class DataValidator:
             }
         }
         
-        # 检查名称匹配
-        if comparison['db_name'] != 'N/A' and comparison['online_name'] != 'N/A':
-            comparison['name_match'] = comparison['db_name'] in comparison['online_name'] or comparison['online_name'] in comparison['db_name']
-        
-        # 计算PE差异
-        if (isinstance(comparison['db_pe'], (int, float)) and 
-            isinstance(comparison['online_pe'], (int, float)) and
-            comparison['db_pe'] > 0 and comparison['online_pe'] > 0):
-            comparison['pe_diff'] = abs(comparison['db_pe'] - comparison['online_pe'])
-        
-        # 计算PB差异
-        if (isinstance(comparison['db_pb'], (int, float)) and 
-            isinstance(comparison['online_pb'], (int, float)) and
-            comparison['db_pb'] > 0 and comparison['online_pb'] > 0):
-            comparison['pb_diff'] = abs(comparison['db_pb'] - comparison['online_pb'])
-        
         return comparison
-    
+
+    def _postprocess_results(self, results: List[Dict]) -> List[Dict]:
+        """向量化计算名称匹配和PE/PB差异（避免逐股票的Python分支判断）"""
+        if not results:
+            return results
+
+        res_df = pd.DataFrame(results)
+
+        # 数值列转换（'N/A'等非数值变为NaN）
+        db_pe = pd.to_numeric(res_df['db_pe'], errors='coerce')
+        online_pe = pd.to_numeric(res_df['online_pe'], errors='coerce')
+        db_pb = pd.to_numeric(res_df['db_pb'], errors='coerce')
+        online_pb = pd.to_numeric(res_df['online_pb'], errors='coerce')
+
+        # PE/PB差异：仅在双方都为正数时有效
+        pe_diff = (db_pe - online_pe).abs().where((db_pe > 0) & (online_pe > 0))
+        pb_diff = (db_pb - online_pb).abs().where((db_pb > 0) & (online_pb > 0))
+
+        # 名称匹配：互为子串即认为匹配
+        valid_names = (res_df['db_name'] != 'N/A') & (res_df['online_name'] != 'N/A')
+        name_match = valid_names & res_df.apply(
+            lambda r: r['db_name'] in r['online_name'] or r['online_name'] in r['db_name'], axis=1
+        )
+
+        # 写回结果字典，保持'N/A'约定供报告使用
+        for i, result in enumerate(results):
+            result['pe_diff'] = pe_diff.iloc[i] if pd.notna(pe_diff.iloc[i]) else 'N/A'
+            result['pb_diff'] = pb_diff.iloc[i] if pd.notna(pb_diff.iloc[i]) else 'N/A'
+            result['name_match'] = bool(name_match.iloc[i])
+
+        return results
+
     def run_validation(self, count: int = 25) -> List[Dict]:
         """运行数据验证"""
         logger.info(f"开始随机验证 {count} 只股票的数据准确性")
@@ -239,8 +265,9 @@ class DataValidator:
             # 每5个股票暂停一下
             if i % 5 == 0:
                 time.sleep(2)
-        
-        return results
+
+        # 统一向量化计算差异和名称匹配
+        return self._postprocess_results(results)
     
     def generate_report(self, results: List[Dict]) -> str:
         """生成验证报告"""
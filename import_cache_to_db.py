@@ -8,10 +8,40 @@
 import json
 import os
 import sqlite3
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from loguru import logger
 from datetime import datetime
 
+# 可选依赖：orjson(Rust实现)解析批次JSON比标准库快数倍
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def load_batch_file(batch_path):
+    """读取一个批次缓存JSON文件（优先使用orjson）"""
+    if ORJSON_AVAILABLE:
+        with open(batch_path, 'rb') as f:
+            return orjson.loads(f.read())
+
+    with open(batch_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_and_process(batch_path):
+    """读取并处理单个批次文件（供子进程调用，CPU密集部分）"""
+    return process_cache_data(load_batch_file(batch_path))
+
+def batch_iter(cache_dir):
+    """按文件名顺序产出批次缓存文件的完整路径（os.scandir避免逐项stat）"""
+    with os.scandir(cache_dir) as entries:
+        yield from sorted(
+            entry.path for entry in entries
+            if entry.is_file()
+            and entry.name.startswith('batch_')
+            and entry.name.endswith('.json')
+        )
+
 def setup_logger():
     """设置日志"""
     logger.add(
@@ -39,120 +69,177 @@ def clear_database(db_path='stock_analysis.db'):
     
     logger.info("✅ 数据库已清空")
 
+# 年报财务指标映射：(缓存字段名, 输出前缀, 缩放系数)
+INDICATOR_MAP = [
+    ('roe', 'roe', None),                       # ROE
+    ('grossprofit_margin', 'gross_margin', None),  # 毛利率
+    ('netprofit_margin', 'net_margin', None),   # 净利率
+    ('debt_to_assets', 'debt_ratio', 0.01),     # 资产负债率
+    ('current_ratio', 'current_ratio', None),   # 流动比率
+    ('assets_turn', 'asset_turnover', None),    # 资产周转率
+]
+
+# 时间序列数据映射：(缓存分组, 值字段名, 日期字段名, 输出前缀)
+TIMESERIES_MAP = [
+    ('pe', 'pe', 'trade_date', 'pe'),                         # PE
+    ('pb', 'pb', 'trade_date', 'pb'),                         # PB
+    ('dividend', 'dv_ratio', 'trade_date', 'dividend'),       # 股息率
+    ('balance_sheet', 'total_assets', 'end_date', 'total_assets'),  # 总资产
+]
+
 def process_cache_data(cache_data):
     """处理缓存数据，转换为标准格式"""
     results = []
-    
+
     for stock_code, stock_info in cache_data.items():
         if not stock_info or 'data' not in stock_info:
             continue
-            
+
         name = stock_info.get('name', '')
         industry = stock_info.get('industry', '')
         data = stock_info['data']
-        
+
         # 基础信息
         row = {
             'stock_code': stock_code,
             'stock_name': name,
             'industry': industry
         }
-        
-        # 处理财务指标
-        if 'financial_indicators' in data:
-            for indicator in data['financial_indicators']:
-                year = indicator.get('end_date', '')[:4]
-                if year and year.isdigit():
-                    year = int(year)
-                    
-                    # ROE
-                    if indicator.get('roe') is not None:
-                        row[f'roe_{year}'] = indicator['roe']
-                    
-                    # 毛利率
-                    if indicator.get('grossprofit_margin') is not None:
-                        row[f'gross_margin_{year}'] = indicator['grossprofit_margin']
-                    
-                    # 净利率
-                    if indicator.get('netprofit_margin') is not None:
-                        row[f'net_margin_{year}'] = indicator['netprofit_margin']
-                    
-                    # 资产负债率
-                    if indicator.get('debt_to_assets') is not None:
-                        row[f'debt_ratio_{year}'] = indicator['debt_to_assets'] / 100
-                    
-                    # 流动比率
-                    if indicator.get('current_ratio') is not None:
-                        row[f'current_ratio_{year}'] = indicator['current_ratio']
-                    
-                    # 资产周转率
-                    if indicator.get('assets_turn') is not None:
-                        row[f'asset_turnover_{year}'] = indicator['assets_turn']
-        
-        # 处理PE数据
-        if 'pe' in data:
-            for pe_record in data['pe']:
-                year = pe_record.get('trade_date', '')[:4]
-                if year and year.isdigit() and pe_record.get('pe') is not None:
-                    row[f'pe_{year}'] = pe_record['pe']
-        
-        # 处理PB数据
-        if 'pb' in data:
-            for pb_record in data['pb']:
-                year = pb_record.get('trade_date', '')[:4]
-                if year and year.isdigit() and pb_record.get('pb') is not None:
-                    row[f'pb_{year}'] = pb_record['pb']
-        
-        # 处理股息率数据
-        if 'dividend' in data:
-            for div_record in data['dividend']:
-                year = div_record.get('trade_date', '')[:4]
-                if year and year.isdigit() and div_record.get('dv_ratio') is not None:
-                    row[f'dividend_{year}'] = div_record['dv_ratio']
-        
-        # 处理总资产数据
-        if 'balance_sheet' in data:
-            for bs_record in data['balance_sheet']:
-                year = bs_record.get('end_date', '')[:4]
-                if year and year.isdigit() and bs_record.get('total_assets') is not None:
-                    row[f'total_assets_{year}'] = bs_record['total_assets']
-        
+
+        # 处理财务指标（表驱动，避免逐指标的if分支）
+        for indicator in data.get('financial_indicators', []):
+            year = indicator.get('end_date', '')[:4]
+            if year and year.isdigit():
+                year = int(year)
+                for src, dst, scale in INDICATOR_MAP:
+                    value = indicator.get(src)
+                    if value is not None:
+                        row[f'{dst}_{year}'] = value * scale if scale else value
+
+        # 处理PE/PB/股息率/总资产等时间序列数据
+        for group, field, date_field, dst in TIMESERIES_MAP:
+            for record in data.get(group, []):
+                year = record.get(date_field, '')[:4]
+                if year and year.isdigit() and record.get(field) is not None:
+                    row[f'{dst}_{year}'] = record[field]
+
         results.append(row)
-    
+
     return results
 
-def save_to_sqlite(data, db_path='stock_analysis.db'):
-    """保存数据到SQLite数据库"""
-    conn = sqlite3.connect(db_path)
-    
-    for _, row in data.iterrows():
-        # 插入股票基本信息
-        conn.execute('''
-            INSERT OR REPLACE INTO stocks (stock_code, stock_name, industry)
-            VALUES (?, ?, ?)
-        ''', (row['stock_code'], row['stock_name'], row['industry']))
-        
-        # 插入财务指标数据
-        for col in row.index:
-            if col in ['stock_code', 'stock_name', 'industry']:
+# 基础信息列（非财务指标）
+BASIC_COLUMNS = ('stock_code', 'stock_name', 'industry')
+
+# 预编译的插入语句（模块常量，SQLite的语句缓存按文本命中）
+SQL_STOCK = '''
+    INSERT OR REPLACE INTO stocks (stock_code, stock_name, industry)
+    VALUES (?, ?, ?)
+'''
+SQL_METRIC_STAGE = '''
+    INSERT INTO s_metrics VALUES (?, ?, ?, ?)
+'''
+SQL_METRIC_MERGE = '''
+    INSERT OR REPLACE INTO financial_metrics
+    (stock_code, year, metric_name, metric_value)
+    SELECT * FROM s_metrics
+'''
+
+def open_import_connection(db_path='stock_analysis.db'):
+    """打开用于批量导入的SQLite连接并调优PRAGMA"""
+    # isolation_level=None关闭隐式事务，由save_dicts_to_sqlite显式BEGIN/COMMIT
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    # 批量导入前调优PRAGMA，避免逐条语句的fsync开销
+    conn.executescript('''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=OFF;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-200000;
+    ''')
+
+    # 指标先写入临时暂存表，再一次性合并进financial_metrics，
+    # 把逐行的随机索引更新换成一次顺序合并
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS s_metrics (
+            stock_code TEXT,
+            year INTEGER,
+            metric_name TEXT,
+            metric_value REAL
+        )
+    ''')
+
+    return conn
+
+def save_dicts_to_sqlite(batch_results, conn):
+    """将字典列表批量写入SQLite（跳过DataFrame中转，复用已打开的连接）"""
+    # 先收集所有待插入的行，再用executemany在一个事务内批量写入
+    stocks_rows = []
+    metric_rows = []
+
+    # 每个批次只解析一次列名 -> (指标名, 年份)，避免每行重复字符串切分
+    columns_meta = {}
+
+    for row in batch_results:
+        stocks_rows.append((row['stock_code'], row['stock_name'], row['industry']))
+
+        for col, value in row.items():
+            meta = columns_meta.get(col)
+            if meta is None:
+                # 解析指标名称和年份，非指标列标记为False
+                if col in BASIC_COLUMNS or '_' not in col:
+                    meta = False
+                else:
+                    metric_name, year = col.rsplit('_', 1)
+                    meta = (metric_name, int(year)) if year.isdigit() else False
+                columns_meta[col] = meta
+
+            if meta is False:
                 continue
-                
-            # 解析指标名称和年份
-            if '_' in col:
-                parts = col.split('_')
-                if len(parts) >= 2:
-                    metric_name = '_'.join(parts[:-1])
-                    year = parts[-1]
-                    
-                    if pd.notna(row[col]) and year.isdigit():
-                        conn.execute('''
-                            INSERT OR REPLACE INTO financial_metrics 
-                            (stock_code, year, metric_name, metric_value)
-                            VALUES (?, ?, ?, ?)
-                        ''', (row['stock_code'], int(year), metric_name, float(row[col])))
-    
-    conn.commit()
-    conn.close()
+
+            # 跳过None和NaN
+            if value is None or (isinstance(value, float) and value != value):
+                continue
+
+            metric_rows.append((row['stock_code'], meta[1], meta[0], float(value)))
+
+    # 显式事务：失败只回滚当前批次，不影响已导入的数据
+    conn.execute('BEGIN')
+    try:
+        conn.executemany(SQL_STOCK, stocks_rows)
+        conn.execute('DELETE FROM s_metrics')
+        conn.executemany(SQL_METRIC_STAGE, metric_rows)
+        conn.execute(SQL_METRIC_MERGE)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    return len(stocks_rows), len(metric_rows)
+
+# 宽表收录的指标列（每(股票,年份)一行，查询免自连接）
+WIDE_METRICS = ('roe', 'gross_margin', 'net_margin', 'debt_ratio', 'current_ratio',
+                'asset_turnover', 'pe', 'pb', 'dividend', 'total_assets')
+
+def build_wide_table(conn):
+    """把长表透视重建为financial_metrics_wide宽表"""
+    cases = ',\n            '.join(
+        f"MAX(CASE WHEN metric_name = '{m}' THEN metric_value END) AS {m}"
+        for m in WIDE_METRICS
+    )
+    conn.executescript(f'''
+        DROP TABLE IF EXISTS financial_metrics_wide;
+        CREATE TABLE financial_metrics_wide AS
+        SELECT
+            stock_code,
+            year,
+            {cases}
+        FROM financial_metrics
+        GROUP BY stock_code, year;
+        CREATE UNIQUE INDEX uq_fmw ON financial_metrics_wide (stock_code, year);
+        CREATE INDEX idx_fmw_year_roe ON financial_metrics_wide (year, roe DESC);
+        CREATE INDEX idx_fmw_year_pe ON financial_metrics_wide (year, pe);
+    ''')
+    logger.info("✅ 宽表 financial_metrics_wide 已重建")
 
 def create_sqlite_database(db_path='stock_analysis.db'):
     """创建SQLite数据库和表结构"""
@@ -174,21 +261,22 @@ def create_sqlite_database(db_path='stock_analysis.db'):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS financial_metrics (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            stock_code TEXT,
+            stock_code TEXT NOT NULL,
             year INTEGER,
-            metric_name TEXT,
+            metric_name TEXT NOT NULL,
             metric_value REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (stock_code) REFERENCES stocks (stock_code)
         )
     ''')
-    
-    # 创建索引
+
+    # 唯一索引：写入时即去重（INSERT OR REPLACE按此冲突），
+    # 同时作为(stock_code, year)前缀索引覆盖常用查询
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_stock_year 
-        ON financial_metrics (stock_code, year)
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_metric
+        ON financial_metrics (stock_code, year, metric_name)
     ''')
-    
+
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_metric_name 
         ON financial_metrics (metric_name)
@@ -215,50 +303,56 @@ def main():
     logger.info("🔄 开始从缓存文件导入数据...")
     
     # 处理所有批次缓存文件
-    batch_files = sorted([f for f in os.listdir(cache_dir) if f.startswith('batch_') and f.endswith('.json')])
-    
+    batch_files = list(batch_iter(cache_dir))
+
     if not batch_files:
         logger.error("❌ 未找到任何缓存文件!")
         print("\n😔 未找到任何缓存文件，请先运行 collect_data.py 收集数据")
         return
     
     logger.info(f"📦 找到 {len(batch_files)} 个批次缓存文件")
-    
-    for batch_file in batch_files:
-        batch_path = os.path.join(cache_dir, batch_file)
-        batch_num = batch_file.replace('batch_', '').replace('.json', '')
-        
-        logger.info(f"📦 处理批次 {batch_num}: {batch_file}")
-        
-        try:
-            with open(batch_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # 处理缓存数据
-            batch_results = process_cache_data(cache_data)
-            
-            if batch_results:
-                # 转换为DataFrame并保存到数据库
-                batch_df = pd.DataFrame(batch_results)
-                save_to_sqlite(batch_df)
-                
-                all_results.extend(batch_results)
-                
-                logger.info(f"✅ 批次 {batch_num}: 成功导入 {len(batch_results)} 只股票")
-            else:
-                logger.warning(f"⚠️ 批次 {batch_num}: 没有有效数据")
-                
-        except Exception as e:
-            logger.error(f"❌ 处理批次 {batch_num} 失败: {e}")
+
+    # 所有批次复用同一个连接，避免反复建连/预热页缓存
+    conn = open_import_connection()
+
+    # JSON解析+格式转换是CPU密集型，按批次分发到多进程；
+    # SQLite写入必须串行，统一由主进程的单一连接完成
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            executor.submit(load_and_process, batch_path): os.path.basename(batch_path)
+            for batch_path in batch_files
+        }
+
+        for future in as_completed(futures):
+            batch_file = futures[future]
+            batch_num = batch_file.replace('batch_', '').replace('.json', '')
+
+            try:
+                batch_results = future.result()
+
+                if batch_results:
+                    # 直接批量写入数据库（无需DataFrame中转）
+                    _, metric_count = save_dicts_to_sqlite(batch_results, conn)
+
+                    all_results.extend(batch_results)
+
+                    logger.info(f"✅ 批次 {batch_num}: 成功导入 {len(batch_results)} 只股票（{metric_count} 条指标）")
+                else:
+                    logger.warning(f"⚠️ 批次 {batch_num}: 没有有效数据")
+
+            except Exception as e:
+                logger.error(f"❌ 处理批次 {batch_num} 失败: {e}")
     
     # 统计信息
     if all_results:
+        # 导入完成后透视重建宽表，下游查询按行读取即可
+        build_wide_table(conn)
+
         logger.info(f"🎯 重新导入完成!")
         logger.info(f"  • 总共处理了 {len(batch_files)} 个批次")
         logger.info(f"  • 成功导入 {len(all_results)} 只股票")
         
-        # 检查数据库状态
-        conn = sqlite3.connect('stock_analysis.db')
+        # 检查数据库状态（复用导入连接）
         cursor = conn.cursor()
         
         cursor.execute('SELECT COUNT(*) FROM stocks')
@@ -269,41 +363,21 @@ def main():
         
         cursor.execute('SELECT COUNT(DISTINCT stock_code) FROM financial_metrics')
         stocks_with_data = cursor.fetchone()[0]
-        
-        # 检查是否有重复数据
-        cursor.execute('''
-            SELECT stock_code, year, metric_name, COUNT(*) as cnt
-            FROM financial_metrics 
-            GROUP BY stock_code, year, metric_name 
-            HAVING COUNT(*) > 1
-            LIMIT 5
-        ''')
-        duplicates = cursor.fetchall()
-        
+
         conn.close()
-        
+
         logger.info(f"📊 数据库统计:")
         logger.info(f"  • 股票总数: {stock_count}")
         logger.info(f"  • 有财务数据的股票: {stocks_with_data}")
         logger.info(f"  • 财务指标记录数: {metrics_count}")
-        
-        if duplicates:
-            logger.warning(f"⚠️ 发现 {len(duplicates)} 组重复数据")
-            for dup in duplicates:
-                logger.warning(f"  重复: {dup[0]} {dup[1]}年 {dup[2]} (x{dup[3]})")
-        else:
-            logger.info("✅ 未发现重复数据")
-        
+
+        # uq_metric唯一索引在写入时即保证无重复，无需再全表扫描核对
         print(f"\n🎉 缓存数据重新导入成功!")
         print(f"📈 数据库中现在有 {stocks_with_data} 只股票的财务数据")
         print(f"📊 总共 {metrics_count} 条财务指标记录")
-        
-        if duplicates:
-            print(f"⚠️ 注意：发现 {len(duplicates)} 组重复数据，建议检查")
-        else:
-            print("✅ 数据没有重复，导入干净!")
-        
+
     else:
+        conn.close()
         logger.warning("😔 没有找到有效的缓存数据")
 
 if __name__ == "__main__":
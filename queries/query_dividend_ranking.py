@@ -5,9 +5,73 @@
 """
 
 import sqlite3
-import pandas as pd
+import sys
 import os
 
+# SQL文本置于模块级：同一字符串对象重复执行时命中sqlite3的语句缓存
+Q_TOP_DIVIDEND = '''
+    SELECT
+        s.stock_code,
+        s.stock_name,
+        fm.metric_value as dividend,
+        fm.year
+    FROM financial_metrics fm
+    JOIN stocks s ON fm.stock_code = s.stock_code
+    WHERE fm.metric_name = 'dividend'
+        AND fm.metric_value > 0
+    ORDER BY fm.metric_value DESC
+    LIMIT 20
+    '''
+
+Q_TOP_DIVIDEND_2024 = '''
+    SELECT
+        s.stock_code,
+        s.stock_name,
+        fm.metric_value as dividend
+    FROM financial_metrics fm
+    JOIN stocks s ON fm.stock_code = s.stock_code
+    WHERE fm.metric_name = 'dividend'
+        AND fm.year = 2024
+        AND fm.metric_value > 0
+    ORDER BY fm.metric_value DESC
+    LIMIT 10
+    '''
+
+def open_query_connection(db_path):
+    """打开查询连接并一次性调优PRAGMA（脚本内所有查询复用）"""
+    conn = sqlite3.connect(db_path)
+    # 按列名取值，避免手工解包元组
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA cache_size=-65536;
+    ''')
+    return conn
+
+def ensure_ranking_index(conn):
+    """确保排名查询的覆盖索引存在（幂等）
+
+    (metric_name, year, metric_value DESC, stock_code)让WHERE条件
+    走索引范围扫描，ORDER BY ... DESC LIMIT直接按索引顺序输出，
+    无需临时B树排序
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fm_name_year_val
+        ON financial_metrics (metric_name, year, metric_value DESC, stock_code)
+    ''')
+    # 部分降序索引只收录正值行：全年份排名LIMIT 20只需按索引顺序
+    # 读前20条，无需排序整个过滤集
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fm_div_val
+        ON financial_metrics (metric_name, metric_value DESC)
+        WHERE metric_value > 0
+    ''')
+    conn.execute('ANALYZE financial_metrics')
+    conn.commit()
+
 def query_dividend_ranking():
     """查询股息排名"""
     # 获取脚本所在目录的上级目录（项目根目录）
@@ -15,69 +79,43 @@ def query_dividend_ranking():
     project_root = os.path.dirname(current_dir)
     db_path = os.path.join(project_root, 'stock_analysis.db')
     
-    conn = sqlite3.connect(db_path)
-    
+    conn = open_query_connection(db_path)
+    ensure_ranking_index(conn)
+
     # 查询股息排名前20的公司
-    query = '''
-    SELECT 
-        s.stock_code, 
-        s.stock_name, 
-        fm.metric_value as dividend, 
-        fm.year 
-    FROM financial_metrics fm 
-    JOIN stocks s ON fm.stock_code = s.stock_code 
-    WHERE fm.metric_name = "dividend" 
-        AND fm.metric_value > 0 
-    ORDER BY fm.metric_value DESC 
-    LIMIT 20
-    '''
-    
-    results = cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    
+    cursor = conn.cursor()
+    cursor.execute(Q_TOP_DIVIDEND)
+
     print("🎯 股息排名前二十的公司:")
     print("=" * 80)
     print(f"{'排名':>4} | {'股票代码':>10} | {'股票名称':>12} | {'股息(元)':>10} | {'年份':>6}")
     print("-" * 80)
-    
-    for i, (code, name, dividend, year) in enumerate(results, 1):
-        name = name if name else "未知公司"
-        print(f"{i:4d} | {code:>10} | {name:>12} | {dividend:>10.3f} | {year:>6}")
-    
-    conn.close()
-    
-    # 也查询最新年份的股息排名
+
+    # 流式迭代游标，整屏拼好后一次写出
+    lines = []
+    for i, row in enumerate(cursor, 1):
+        name = row['stock_name'] if row['stock_name'] else "未知公司"
+        lines.append(f"{i:4d} | {row['stock_code']:>10} | {name:>12} | "
+                     f"{row['dividend']:>10.3f} | {row['year']:>6}")
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+    # 也查询最新年份的股息排名（复用同一个连接，页缓存保持热态）
     print("\n" + "=" * 80)
     print("🎯 2024年股息排名前十的公司:")
     print("=" * 80)
-    
-    conn = sqlite3.connect(db_path)
-    query_2024 = '''
-    SELECT 
-        s.stock_code, 
-        s.stock_name, 
-        fm.metric_value as dividend 
-    FROM financial_metrics fm 
-    JOIN stocks s ON fm.stock_code = s.stock_code 
-    WHERE fm.metric_name = "dividend" 
-        AND fm.metric_value > 0 
-        AND fm.year = 2024
-    ORDER BY fm.metric_value DESC 
-    LIMIT 10
-    '''
-    
+
     cursor = conn.cursor()
-    cursor.execute(query_2024)
-    results_2024 = cursor.fetchall()
-    
+    cursor.execute(Q_TOP_DIVIDEND_2024)
+
     print(f"{'排名':>4} | {'股票代码':>10} | {'股票名称':>12} | {'股息(元)':>10}")
     print("-" * 60)
-    
-    for i, (code, name, dividend) in enumerate(results_2024, 1):
-        name = name if name else "未知公司"
-        print(f"{i:4d} | {code:>10} | {name:>12} | {dividend:>10.3f}")
-    
+
+    lines = []
+    for i, row in enumerate(cursor, 1):
+        name = row['stock_name'] if row['stock_name'] else "未知公司"
+        lines.append(f"{i:4d} | {row['stock_code']:>10} | {name:>12} | {row['dividend']:>10.3f}")
+    sys.stdout.write('\n'.join(lines) + '\n')
+
     conn.close()
 
 if __name__ == "__main__":
@@ -3,6 +3,9 @@ import pandas as pd
 import numpy as np
 from loguru import logger
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -17,19 +20,58 @@ except:
     logger.warning("无法设置中文字体，图表中的中文可能无法正常显示")
 
 class StockAnalyzer:
-    def __init__(self):
+
+    # 磁盘缓存有效期：财务报表数据一天内不重复拉取
+    CACHE_TTL_SECONDS = 24 * 3600
+
+    def __init__(self, cache_dir='cache/tushare'):
         # 初始化Tushare
         ts.set_token(TUSHARE_TOKEN)
         self.pro = ts.pro_api()
-        
+
         # 创建报告目录
         os.makedirs(REPORT_SAVE_PATH, exist_ok=True)
-        
+
+        # Tushare响应缓存：进程内memo + 磁盘parquet
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._stock_info_cache = {}
+
+        # pyplot是全局状态，多线程绘图需串行化
+        self._plot_lock = threading.Lock()
+
+    def _cached_fetch(self, api_name, fetch_func, stock_code, start_date, end_date):
+        """按(股票, 接口, 区间)做磁盘缓存，命中时本地读取代替网络往返"""
+        path = os.path.join(
+            self.cache_dir, f"{stock_code}_{api_name}_{start_date}_{end_date}.parquet")
+
+        try:
+            if (os.path.exists(path)
+                    and time.time() - os.path.getmtime(path) < self.CACHE_TTL_SECONDS):
+                return pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f"读取缓存失败 {path}: {e}")
+
+        df = fetch_func(ts_code=stock_code, start_date=start_date, end_date=end_date)
+
+        if df is not None:
+            try:
+                df.to_parquet(path)
+            except Exception as e:
+                logger.warning(f"写入缓存失败 {path}: {e}")
+
+        return df
+
     def get_stock_info(self, stock_code):
         """获取股票基本信息"""
+        if stock_code in self._stock_info_cache:
+            return self._stock_info_cache[stock_code]
+
         try:
             stock_info = self.pro.stock_basic(ts_code=stock_code)
-            return stock_info.iloc[0] if not stock_info.empty else None
+            result = stock_info.iloc[0] if not stock_info.empty else None
+            self._stock_info_cache[stock_code] = result
+            return result
         except Exception as e:
             logger.error(f"获取股票信息失败: {e}")
             return None
@@ -38,26 +80,17 @@ class StockAnalyzer:
         """获取财务数据"""
         try:
             # 获取资产负债表
-            balance_sheet = self.pro.balancesheet(
-                ts_code=stock_code,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
+            balance_sheet = self._cached_fetch(
+                'balancesheet', self.pro.balancesheet, stock_code, start_date, end_date)
+
             # 获取利润表
-            income = self.pro.income(
-                ts_code=stock_code,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
+            income = self._cached_fetch(
+                'income', self.pro.income, stock_code, start_date, end_date)
+
             # 获取现金流量表
-            cashflow = self.pro.cashflow(
-                ts_code=stock_code,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
+            cashflow = self._cached_fetch(
+                'cashflow', self.pro.cashflow, stock_code, start_date, end_date)
+
             return balance_sheet, income, cashflow
         except Exception as e:
             logger.error(f"获取财务数据失败: {e}")
@@ -81,21 +114,37 @@ class StockAnalyzer:
         income = income.loc[common_dates]
         
         ratios = pd.DataFrame(index=common_dates)
-        
+
+        # 取出底层ndarray一次性计算，np.divide(where=)跳过pandas逐列对齐
+        # 并在分母为0时保持NaN；财务比率~4位有效数字，float32精度足够，
+        # 内存流量减半
+        ni = income['n_income'].to_numpy(dtype=np.float32)
+        revenue = income['revenue'].to_numpy(dtype=np.float32)
+        oper_cost = income['oper_cost'].to_numpy(dtype=np.float32)
+        equity = balance_sheet['total_hldr_eqy_exc_min_int'].to_numpy(dtype=np.float32)
+        total_assets = balance_sheet['total_assets'].to_numpy(dtype=np.float32)
+        total_liab = balance_sheet['total_liab'].to_numpy(dtype=np.float32)
+
+        def _pct_ratio(numer, denom):
+            out = np.full_like(numer, np.nan)
+            np.divide(numer, denom, out=out, where=denom != 0)
+            out *= 100
+            return out
+
         # ROE = 净利润 / 股东权益
-        ratios['roe'] = income['n_income'] / balance_sheet['total_hldr_eqy_exc_min_int'] * 100
-        
+        ratios['roe'] = _pct_ratio(ni, equity)
+
         # ROA = 净利润 / 总资产
-        ratios['roa'] = income['n_income'] / balance_sheet['total_assets'] * 100
-        
+        ratios['roa'] = _pct_ratio(ni, total_assets)
+
         # 毛利率 = （营业收入 - 营业成本）/ 营业收入
-        ratios['gross_profit_margin'] = (income['revenue'] - income['oper_cost']) / income['revenue'] * 100
-        
+        ratios['gross_profit_margin'] = _pct_ratio(revenue - oper_cost, revenue)
+
         # 净利率 = 净利润 / 营业收入
-        ratios['net_profit_margin'] = income['n_income'] / income['revenue'] * 100
-        
+        ratios['net_profit_margin'] = _pct_ratio(ni, revenue)
+
         # 资产负债率 = 总负债 / 总资产
-        ratios['debt_to_assets'] = balance_sheet['total_liab'] / balance_sheet['total_assets'] * 100
+        ratios['debt_to_assets'] = _pct_ratio(total_liab, total_assets)
         
         # 按时间排序
         ratios = ratios.sort_index()
@@ -111,14 +160,23 @@ class StockAnalyzer:
         income = income.set_index('end_date')
         
         growth = pd.DataFrame(index=income.index)
-        
+
+        # np.diff在连续float64缓冲上一次算出环比，跳过pct_change的逐元素掩码
+        def _growth_pct(series):
+            # 同比率计算：float32精度足够，减半内存流量
+            x = series.to_numpy(dtype=np.float32)
+            g = np.full_like(x, np.nan)
+            if len(x) > 1:
+                prev = x[:-1]
+                np.divide(np.diff(x), prev, out=g[1:], where=prev != 0)
+                g[1:] *= 100
+            return g
+
         # 计算营收增长率
-        revenue = income['revenue']
-        growth['revenue_growth'] = revenue.pct_change() * 100
-        
+        growth['revenue_growth'] = _growth_pct(income['revenue'])
+
         # 计算净利润增长率
-        net_income = income['n_income']
-        growth['profit_growth'] = net_income.pct_change() * 100
+        growth['profit_growth'] = _growth_pct(income['n_income'])
         
         # 按时间排序
         growth = growth.sort_index()
@@ -133,11 +191,12 @@ class StockAnalyzer:
         report.append(f"# {stock_code} 基本面分析报告")
         report.append(f"\n## 生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        # 财务比率分析
+        # 财务比率分析（最后一期只取一次，循环内查dict代替逐列iloc）
         report.append("\n## 财务比率分析")
+        last = ratios.iloc[-1].to_dict()
         for indicator in ANALYSIS_INDICATORS:
-            if indicator in ratios.columns:
-                latest_value = ratios[indicator].iloc[-1]
+            if indicator in last:
+                latest_value = last[indicator]
                 threshold = THRESHOLDS.get(indicator)
                 if pd.notna(latest_value) and threshold is not None:
                     status = "高于" if latest_value > threshold else "低于"
@@ -162,6 +221,32 @@ class StockAnalyzer:
         
         return report_path
 
+    def analyze_one(self, stock_code, start_date, end_date):
+        """单只股票的完整分析流程：取数→比率→增长→报告→图表"""
+        balance_sheet, income, cashflow = self.get_financial_data(
+            stock_code, start_date, end_date)
+
+        ratios = self.calculate_financial_ratios(balance_sheet, income)
+        growth = self.analyze_growth(income)
+
+        report_path = self.generate_report(stock_code, ratios, growth)
+        with self._plot_lock:
+            plot_path = self.plot_financial_trends(stock_code, ratios, growth)
+
+        return report_path, plot_path
+
+    def analyze_many(self, stock_codes, start_date, end_date, max_workers=8):
+        """线程池并发分析多只股票
+
+        Tushare调用阻塞在网络上，pandas/numpy的C路径会释放GIL，
+        线程池能把每只股票的网络等待重叠起来；绘图经锁串行
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda code: self.analyze_one(code, start_date, end_date),
+                stock_codes
+            ))
+
     def plot_financial_trends(self, stock_code, ratios, growth):
         """绘制财务趋势图"""
         if ratios is None or growth is None:
@@ -169,10 +254,11 @@ class StockAnalyzer:
             
         plt.figure(figsize=(15, 10))
         
-        # 绘制财务比率趋势
+        # 绘制财务比率趋势（报告期只解析一次，所有曲线共用DatetimeIndex）
+        x_ratios = pd.to_datetime(ratios.index)
         plt.subplot(2, 1, 1)
         for col in ratios.columns:
-            plt.plot(pd.to_datetime(ratios.index), ratios[col], label=col, marker='o')
+            plt.plot(x_ratios, ratios[col], label=col, marker='o')
         plt.title('财务比率趋势')
         plt.xlabel('报告期')
         plt.ylabel('比率 (%)')
@@ -181,9 +267,10 @@ class StockAnalyzer:
         plt.xticks(rotation=45)
         
         # 绘制增长率趋势
+        x_growth = pd.to_datetime(growth.index)
         plt.subplot(2, 1, 2)
         for col in growth.columns:
-            plt.plot(pd.to_datetime(growth.index), growth[col], label=col, marker='o')
+            plt.plot(x_growth, growth[col], label=col, marker='o')
         plt.title('增长率趋势')
         plt.xlabel('报告期')
         plt.ylabel('增长率 (%)')
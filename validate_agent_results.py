@@ -3,15 +3,104 @@
 
 import sqlite3
 import random
+import io
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-import pandas as pd
+import threading
+from collections import deque
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
+from dataclasses import dataclass, asdict
 import json
 from loguru import logger
 from value_investment_agent import ValueInvestmentAgent
 
+# 可选依赖：orjson(Rust实现)序列化/解析结果行比标准库快数倍
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _dumps_line(obj) -> bytes:
+    """结果dict序列化为一行JSON字节（优先orjson）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode('utf-8')
+
+def _to_float(field: bytes) -> Optional[float]:
+    """腾讯行情字节字段转float，空串/0视为缺失"""
+    return float(field) if field and field != b'0' else None
+
+def _fnum(x, p: int = 2) -> str:
+    """数值定点格式化，非数值统一占位'N/A'"""
+    return f"{x:.{p}f}" if isinstance(x, (int, float)) else "N/A"
+
+# 数值字段在取不到时沿用'N/A'占位，报告层按类型分流格式化
+Number = Union[float, str]
+
+@dataclass(slots=True)
+class Comparison:
+    """单只股票的验证比较记录
+
+    slots实例比20键dict体量小得多、属性访问也更快，
+    批量验证放大后差异可观
+    """
+    stock_code: str
+    agent_success: bool = False
+    online_success: bool = False
+    agent_name: str = 'N/A'
+    online_name: str = 'N/A'
+    name_match: bool = False
+    agent_pe: Number = 'N/A'
+    agent_pe_source: str = 'historical'
+    tushare_pe: Number = 'N/A'
+    online_pe: Number = 'N/A'
+    pe_diff_tushare: Number = 'N/A'
+    pe_diff_online: Number = 'N/A'
+    agent_pb: Number = 'N/A'
+    online_pb: Number = 'N/A'
+    pb_diff: Number = 'N/A'
+    agent_roe: Number = 'N/A'
+    agent_debt_ratio: Number = 'N/A'
+    agent_current_ratio: Number = 'N/A'
+    agent_score: Number = 'N/A'
+    agent_grade: str = 'N/A'
+
+    def as_dict(self) -> Dict:
+        """转为普通dict，供JSONL落盘"""
+        return asdict(self)
+
+class _RateLimiter:
+    """滑动窗口限流器：按配额放行，只在真正超限时才等待
+
+    固定time.sleep是按最坏情况猜的静态节流，配额富余时也在干等；
+    这里用deque记录周期内的请求时刻，线程安全，供线程池内共用
+    """
+
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._stamps and now - self._stamps[0] >= self.period:
+                    self._stamps.popleft()
+                if len(self._stamps) < self.max_calls:
+                    self._stamps.append(now)
+                    return
+                wait = self.period - (now - self._stamps[0])
+            time.sleep(wait)
+
 class AgentResultValidator:
     def __init__(self, db_path='stock_analysis.db'):
         self.db_path = db_path
@@ -20,27 +109,102 @@ class AgentResultValidator:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
-        
-    def get_random_stocks(self, count: int = 25) -> List[str]:
-        """从数据库中随机获取股票代码列表"""
-        try:
+        # 连接池放大到线程池规模以上（默认仅10），TCP连接在各工作线程
+        # 间复用；瞬时故障/限流由适配器层退避重试，避免整只股票重验
+        adapter = HTTPAdapter(
+            pool_connections=32, pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3,
+                              status_forcelist=(429, 502, 503, 504)))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # get_stock_metrics结果按股票缓存：评估内部已经查过同样的数据，
+        # 验证层不再重复打DB/API
+        self._metrics_cache: Dict[str, Dict] = {}
+
+        # 长连接惰性打开，PRAGMA只在建连时调一次
+        self.conn: Optional[sqlite3.Connection] = None
+
+        # 旁路线程池：让Tushare实时PE与腾讯行情两笔独立请求并发
+        self._quote_pool = ThreadPoolExecutor(max_workers=8)
+
+        # 按Tushare配额(约500次/分钟)限流，取代每股固定sleep
+        self._rate_limiter = _RateLimiter(max_calls=500, period=60.0)
+
+        # 逐股增量落盘的结果文件；重跑时据此跳过已完成的股票
+        self.results_path = 'validation_results.jsonl'
+
+    def _open_conn(self) -> sqlite3.Connection:
+        """打开并复用单条查询连接，建连时一次性调优PRAGMA"""
+        if self.conn is None:
             conn = sqlite3.connect(self.db_path)
-            
-            query = """
-            SELECT DISTINCT stock_code 
-            FROM stocks 
-            WHERE stock_code NOT LIKE '%.BJ' 
+            conn.executescript('''
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            ''')
+            # 覆盖索引让过滤谓词只扫索引页；建连时建一次即可
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_stocks_filter
+                ON stocks(stock_code, stock_name)
+            ''')
+            self.conn = conn
+        return self.conn
+
+    def __del__(self):
+        if getattr(self, 'conn', None) is not None:
+            self.conn.close()
+
+    def _get_stock_metrics_cached(self, stock_code: str) -> Dict:
+        """带memo的指标获取，同一股票只查一次"""
+        stock_data = self._metrics_cache.get(stock_code)
+        if stock_data is None:
+            stock_data = self.agent.get_stock_metrics(stock_code)
+            self._metrics_cache[stock_code] = stock_data
+        return stock_data
+
+    # 过滤条件在计数和取样两条SQL间共享，保证行号口径一致。
+    # SQL文本做成类常量：同一连接上重复执行相同文本时命中
+    # sqlite3的语句缓存，免去每次调用的parse+plan
+    _STOCK_FILTER = """
+            WHERE stock_code NOT LIKE '%.BJ'
             AND stock_name NOT LIKE '%ST%'
             AND stock_name NOT LIKE '%退%'
-            ORDER BY RANDOM() 
-            LIMIT ?
-            """
-            
-            df = pd.read_sql_query(query, conn, params=(count,))
-            conn.close()
-            
-            return df['stock_code'].tolist()
-            
+    """
+
+    _SQL_COUNT = f"SELECT COUNT(*) FROM stocks {_STOCK_FILTER}"
+
+    # 占位符段运行时填充；count不变时文本稳定，同样能命中语句缓存
+    _SQL_SAMPLE = f"""
+            WITH f AS (
+                SELECT stock_code, ROW_NUMBER() OVER () AS rn
+                FROM stocks
+                {_STOCK_FILTER}
+            )
+            SELECT stock_code FROM f WHERE rn IN ({{placeholders}})
+    """
+
+    def get_random_stocks(self, count: int = 25) -> List[str]:
+        """从数据库中随机获取股票代码列表
+
+        ORDER BY RANDOM()要对整个过滤集做临时B树排序（O(N log N)）；
+        改为先COUNT一次，在Python侧抽样行号，再按ROW_NUMBER点查
+        """
+        try:
+            conn = self._open_conn()
+
+            total = conn.execute(self._SQL_COUNT).fetchone()[0]
+            if total == 0:
+                return []
+
+            picks = random.sample(range(1, total + 1), min(count, total))
+            query = self._SQL_SAMPLE.format(
+                placeholders=', '.join('?' * len(picks)))
+            rows = conn.execute(query, picks).fetchall()
+
+            return [row[0] for row in rows]
+
         except Exception as e:
             logger.error(f"获取随机股票失败: {e}")
             return []
@@ -58,13 +222,12 @@ class AgentResultValidator:
     def get_online_realtime_data(self, stock_code: str) -> Dict:
         """从网上获取股票实时数据"""
         try:
-            # 先尝试通过Tushare API获取实时PE
-            realtime_pe = self.agent.get_realtime_pe(stock_code)
-            
-            result = {'realtime_pe': realtime_pe}
-            
+            # Tushare实时PE与腾讯行情互相独立：PE请求丢进旁路线程，
+            # 腾讯请求在当前线程发出，两段网络等待重叠；
+            # session的keep-alive复用TCP连接，无需逐次握手
+            pe_future = self._quote_pool.submit(self.agent.get_realtime_pe, stock_code)
+
             # 使用腾讯财经API获取更多实时数据
-            time.sleep(0.5)
             tencent_code = stock_code.replace('.SZ', '').replace('.SH', '')
             if stock_code.endswith('.SZ'):
                 tencent_code = 'sz' + tencent_code
@@ -73,25 +236,28 @@ class AgentResultValidator:
             
             tencent_url = f"http://qt.gtimg.cn/q={tencent_code}"
             response = self.session.get(tencent_url, timeout=10)
-            response.encoding = 'gbk'
-            
+
+            result = {'realtime_pe': pe_future.result()}
+
             if response.status_code == 200:
-                content = response.text
-                if 'v_' in content:
-                    data_str = content.split('"')[1]
-                    if data_str:
-                        data_parts = data_str.split('~')
-                        if len(data_parts) >= 47:
-                            try:
-                                result.update({
-                                    'name': data_parts[1],
-                                    'current_price': float(data_parts[3]) if data_parts[3] and data_parts[3] != '0' else None,
-                                    'online_pe': float(data_parts[39]) if len(data_parts) > 39 and data_parts[39] and data_parts[39] != '0' else None,
-                                    'online_pb': float(data_parts[46]) if len(data_parts) > 46 and data_parts[46] and data_parts[46] != '0' else None,
-                                    'market_cap': float(data_parts[45]) if len(data_parts) > 45 and data_parts[45] and data_parts[45] != '0' else None
-                                })
-                            except (ValueError, IndexError):
-                                pass
+                # 整包只用到5个字段：按字节定位引号区间切分，
+                # 仅对股票名称做GBK解码，跳过全文decode
+                raw = response.content
+                start = raw.find(b'"') + 1
+                end = raw.find(b'"', start)
+                if start > 0 and end > start:
+                    parts = raw[start:end].split(b'~')
+                    if len(parts) >= 47:
+                        try:
+                            result.update({
+                                'name': parts[1].decode('gbk'),
+                                'current_price': _to_float(parts[3]),
+                                'online_pe': _to_float(parts[39]),
+                                'online_pb': _to_float(parts[46]),
+                                'market_cap': _to_float(parts[45])
+                            })
+                        except (ValueError, IndexError):
+                            pass
             
             return result
             
@@ -99,106 +265,103 @@ class AgentResultValidator:
             logger.warning(f"获取股票 {stock_code} 在线数据失败: {e}")
             return {}
     
-    def validate_single_stock(self, stock_code: str) -> Dict:
+    def validate_single_stock(self, stock_code: str) -> Comparison:
         """验证单个股票的agent结果与在线数据"""
         logger.info(f"验证股票: {stock_code}")
-        
+
+        # 限流器按实际配额放行，配额富余时不再干等
+        self._rate_limiter.acquire()
+
         # 获取agent分析结果
         agent_result = self.get_agent_analysis(stock_code)
-        
+
         # 获取在线实时数据
         online_data = self.get_online_realtime_data(stock_code)
-        
-        # 等待避免请求过快
-        time.sleep(1)
-        
+
         # 构建比较结果
-        comparison = {
-            'stock_code': stock_code,
-            'agent_success': bool(agent_result and 'error' not in agent_result),
-            'online_success': bool(online_data),
-            
+        comparison = Comparison(
+            stock_code=stock_code,
+            agent_success=bool(agent_result and 'error' not in agent_result),
+            online_success=bool(online_data),
+
             # 基本信息
-            'agent_name': agent_result.get('stock_name', 'N/A'),
-            'online_name': online_data.get('name', 'N/A'),
-            'name_match': False,
-            
+            agent_name=agent_result.get('stock_name', 'N/A'),
+            online_name=online_data.get('name', 'N/A'),
+
             # PE对比
-            'agent_pe': agent_result.get('realtime_pe', agent_result.get('pe_ratio', 'N/A')),
-            'agent_pe_source': 'realtime' if agent_result.get('realtime_pe') else 'historical',
-            'tushare_pe': online_data.get('realtime_pe', 'N/A'),
-            'online_pe': online_data.get('online_pe', 'N/A'),
-            'pe_diff_tushare': 'N/A',
-            'pe_diff_online': 'N/A',
-            
+            agent_pe=agent_result.get('realtime_pe', agent_result.get('pe_ratio', 'N/A')),
+            agent_pe_source='realtime' if agent_result.get('realtime_pe') else 'historical',
+            tushare_pe=online_data.get('realtime_pe', 'N/A'),
+            online_pe=online_data.get('online_pe', 'N/A'),
+
             # PB对比
-            'agent_pb': 'N/A',
-            'online_pb': online_data.get('online_pb', 'N/A'),
-            'pb_diff': 'N/A',
-            
+            online_pb=online_data.get('online_pb', 'N/A'),
+
             # 财务指标
-            'agent_roe': 'N/A',
-            'agent_debt_ratio': 'N/A',
-            'agent_current_ratio': 'N/A',
-            'agent_score': agent_result.get('total_score', 'N/A'),
-            'agent_grade': agent_result.get('grade', 'N/A'),
-        }
-        
+            agent_score=agent_result.get('total_score', 'N/A'),
+            agent_grade=agent_result.get('grade', 'N/A'),
+        )
+
         # 从agent结果中提取财务指标
         if agent_result:
-            stock_data = self.agent.get_stock_metrics(stock_code)
+            stock_data = self._get_stock_metrics_cached(stock_code)
             if stock_data and 'metrics' in stock_data:
                 metrics = stock_data['metrics']
                 
-                # ROE
-                roe_data = metrics.get('roe', {})
-                if roe_data:
-                    latest_year = max(roe_data.keys())
-                    comparison['agent_roe'] = roe_data[latest_year]
-                
-                # PB
-                pb_data = metrics.get('pb', {})
-                if pb_data:
-                    latest_year = max(pb_data.keys())
-                    comparison['agent_pb'] = pb_data[latest_year]
-                
-                # 债务比率
-                debt_data = metrics.get('debt_ratio', {})
-                if debt_data:
-                    latest_year = max(debt_data.keys())
-                    comparison['agent_debt_ratio'] = debt_data[latest_year]
-                
-                # 流动比率
-                current_data = metrics.get('current_ratio', {})
-                if current_data:
-                    latest_year = max(current_data.keys())
-                    comparison['agent_current_ratio'] = current_data[latest_year]
-        
+                # ROE/PB/债务比率/流动比率共享同一组年份键：
+                # 最新年份只在年份并集上求一次，不再逐指标max扫描
+                wanted = (('roe', 'agent_roe'),
+                          ('pb', 'agent_pb'),
+                          ('debt_ratio', 'agent_debt_ratio'),
+                          ('current_ratio', 'agent_current_ratio'))
+                all_years = set().union(
+                    *(metrics.get(k, {}).keys() for k, _ in wanted))
+                latest_year = max(all_years) if all_years else None
+
+                for key, attr in wanted:
+                    data = metrics.get(key, {})
+                    if data:
+                        # 个别指标缺最新年份时退回自己的最新一年
+                        setattr(comparison, attr,
+                                data.get(latest_year, data[max(data)]))
+
         # 检查名称匹配
-        if comparison['agent_name'] != 'N/A' and comparison['online_name'] != 'N/A':
-            comparison['name_match'] = comparison['agent_name'] in comparison['online_name'] or comparison['online_name'] in comparison['agent_name']
-        
-        # 计算PE差异（agent vs tushare实时PE）
-        if (isinstance(comparison['agent_pe'], (int, float)) and 
-            isinstance(comparison['tushare_pe'], (int, float)) and
-            comparison['agent_pe'] > 0 and comparison['tushare_pe'] > 0):
-            comparison['pe_diff_tushare'] = abs(comparison['agent_pe'] - comparison['tushare_pe'])
-        
-        # 计算PE差异（agent vs 在线PE）
-        if (isinstance(comparison['agent_pe'], (int, float)) and 
-            isinstance(comparison['online_pe'], (int, float)) and
-            comparison['agent_pe'] > 0 and comparison['online_pe'] > 0):
-            comparison['pe_diff_online'] = abs(comparison['agent_pe'] - comparison['online_pe'])
-        
-        # 计算PB差异
-        if (isinstance(comparison['agent_pb'], (int, float)) and 
-            isinstance(comparison['online_pb'], (int, float)) and
-            comparison['agent_pb'] > 0 and comparison['online_pb'] > 0):
-            comparison['pb_diff'] = abs(comparison['agent_pb'] - comparison['online_pb'])
-        
+        if comparison.agent_name != 'N/A' and comparison.online_name != 'N/A':
+            comparison.name_match = (comparison.agent_name in comparison.online_name
+                                     or comparison.online_name in comparison.agent_name)
+
+        # PE/PB差异推迟到run_validation收齐全部结果后统一向量化回填
         return comparison
+
+    @staticmethod
+    def _fill_diffs(results: List[Comparison]) -> None:
+        """收齐全部结果后一趟向量化回填PE/PB差异
+
+        把散在每只股票上的isinstance+abs计算合并成三次ufunc；
+        缺失值转NaN后，(a > 0) & (b > 0)掩码天然排除NaN对
+        """
+        if not results:
+            return
+        n = len(results)
+
+        def col(attr):
+            return np.fromiter(
+                (v if isinstance(v := getattr(r, attr), (int, float)) else np.nan
+                 for r in results),
+                dtype=np.float64, count=n)
+
+        agent_pe = col('agent_pe')
+        for attr, a, b in (
+                ('pe_diff_tushare', agent_pe, col('tushare_pe')),
+                ('pe_diff_online', agent_pe, col('online_pe')),
+                ('pb_diff', col('agent_pb'), col('online_pb'))):
+            diff = np.abs(a - b)
+            valid = (a > 0) & (b > 0)
+            for r, d, ok in zip(results, diff, valid):
+                if ok:
+                    setattr(r, attr, float(d))
     
-    def run_validation(self, count: int = 25) -> List[Dict]:
+    def run_validation(self, count: int = 25) -> List[Comparison]:
         """运行验证"""
         logger.info(f"开始验证价值投资agent的 {count} 只股票分析结果")
         
@@ -209,160 +372,227 @@ class AgentResultValidator:
             return []
         
         logger.info(f"获取到 {len(stocks)} 只随机股票")
-        
-        # 验证每只股票
-        results = []
-        for i, stock_code in enumerate(stocks, 1):
-            logger.info(f"进度: {i}/{len(stocks)} - {stock_code}")
-            result = self.validate_single_stock(stock_code)
-            results.append(result)
-            
-            # 每5个股票暂停一下
-            if i % 5 == 0:
-                logger.info(f"已完成 {i} 只股票，暂停2秒...")
-                time.sleep(2)
-        
+
+        # 断点续跑：上次已落盘的股票直接复用结果，不再重验。
+        # 只认本次抽样内的代码，样本外的旧行不得混进报告
+        stock_set = set(stocks)
+        prev_results, prev_codes = self._load_previous_results()
+        prev_results = [r for r in prev_results if r.stock_code in stock_set]
+        prev_codes &= stock_set
+        pending = [code for code in stocks if code not in prev_codes]
+        if prev_codes:
+            logger.info(f"检测到 {len(prev_codes)} 只股票的历史结果，跳过重验")
+
+        # 验证是纯I/O型工作（Tushare/腾讯HTTP + SQLite读），
+        # 线程池把各股票的网络等待重叠起来，取代逐只串行+定时暂停
+        done = 0
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {
+                executor.submit(self.validate_single_stock, stock_code): stock_code
+                for stock_code in pending
+            }
+
+            with open(self.results_path, 'ab') as out:
+                for future in as_completed(futures):
+                    done += 1
+                    logger.info(f"进度: {done}/{len(pending)} - {futures[future]}")
+                    # 每只完成即追加一行，中断不丢已付出的网络工作
+                    out.write(_dumps_line(future.result().as_dict()))
+                    out.write(b'\n')
+                    out.flush()
+
+        # 按提交顺序汇总，报告输出保持确定性
+        results = prev_results + [future.result() for future in futures]
+        self._fill_diffs(results)
+        # 整轮跑完即轮转断点文件，旧样本不会泄漏进下一次验证
+        self._rotate_results_file()
         return results
+
+    def _rotate_results_file(self) -> None:
+        """验证完整跑完后把断点文件归档为带时间戳的副本"""
+        if not os.path.exists(self.results_path):
+            return
+        try:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            os.replace(self.results_path, f"{self.results_path}.{stamp}")
+        except OSError as e:
+            logger.warning(f"轮转验证结果文件失败: {e}")
+
+    def _load_previous_results(self):
+        """读取results_path里上次运行落盘的结果行，返回(结果列表, 代码集合)"""
+        results: List[Comparison] = []
+        codes = set()
+        if not os.path.exists(self.results_path):
+            return results, codes
+        try:
+            with open(self.results_path, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    r = orjson.loads(line) if ORJSON_AVAILABLE else json.loads(line)
+                    codes.add(r['stock_code'])
+                    results.append(Comparison(**r))
+        except Exception as e:
+            logger.warning(f"读取历史验证结果失败 {self.results_path}: {e}")
+        return results, codes
     
-    def generate_report(self, results: List[Dict]) -> str:
+    def generate_report(self, results: List[Comparison]) -> str:
         """生成验证报告"""
         if not results:
             return "无验证结果"
-        
-        report = []
-        report.append("# 📊 价值投资Agent结果验证报告")
-        report.append(f"**验证时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        report.append(f"**验证样本**: {len(results)} 只股票")
-        report.append("")
-        
-        # 统计信息
+
+        # 单个StringIO缓冲逐段write，避免list append+最终join的双份拷贝
+        buf = io.StringIO()
+        w = buf.write
+        w("# 📊 价值投资Agent结果验证报告\n")
+        w(f"**验证时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        w(f"**验证样本**: {len(results)} 只股票\n\n")
+
+
+        # 统计信息：一趟融合扫描收齐所有计数与数值列表，
+        # 代替每个指标各自过一遍results的生成器求和
         total_stocks = len(results)
-        agent_success = sum(1 for r in results if r['agent_success'])
-        online_success = sum(1 for r in results if r['online_success'])
-        name_matches = sum(1 for r in results if r['name_match'])
-        pe_tushare_available = sum(1 for r in results if isinstance(r['pe_diff_tushare'], (int, float)))
-        pe_online_available = sum(1 for r in results if isinstance(r['pe_diff_online'], (int, float)))
-        pb_available = sum(1 for r in results if isinstance(r['pb_diff'], (int, float)))
-        
-        report.append("## 📈 验证统计")
-        report.append(f"- 总验证股票: {total_stocks} 只")
-        report.append(f"- Agent分析成功: {agent_success} 只 ({agent_success/total_stocks*100:.1f}%)")
-        report.append(f"- 在线数据获取成功: {online_success} 只 ({online_success/total_stocks*100:.1f}%)")
-        report.append(f"- 股票名称匹配: {name_matches} 只 ({name_matches/total_stocks*100:.1f}%)")
-        report.append(f"- PE数据可对比(Tushare): {pe_tushare_available} 只 ({pe_tushare_available/total_stocks*100:.1f}%)")
-        report.append(f"- PE数据可对比(在线): {pe_online_available} 只 ({pe_online_available/total_stocks*100:.1f}%)")
-        report.append(f"- PB数据可对比: {pb_available} 只 ({pb_available/total_stocks*100:.1f}%)")
-        report.append("")
-        
+        agent_success = online_success = name_matches = 0
+        agent_with_realtime_pe = agent_with_historical_pe = 0
+        pe_t_vals, pe_o_vals, pb_vals, score_vals = [], [], [], []
+        baked_rows = []
+        for r in results:
+            agent_success += bool(r.agent_success)
+            online_success += bool(r.online_success)
+            name_matches += bool(r.name_match)
+            if r.agent_pe_source == 'realtime':
+                agent_with_realtime_pe += 1
+            elif r.agent_pe_source == 'historical':
+                agent_with_historical_pe += 1
+            v = r.pe_diff_tushare
+            if isinstance(v, (int, float)):
+                pe_t_vals.append(v)
+            v = r.pe_diff_online
+            if isinstance(v, (int, float)):
+                pe_o_vals.append(v)
+            v = r.pb_diff
+            if isinstance(v, (int, float)):
+                pb_vals.append(v)
+            v = r.agent_score
+            if isinstance(v, (int, float)):
+                score_vals.append(v)
+
+            # 表格单元格在本趟顺手格式化好，行输出循环零isinstance
+            baked_rows.append((
+                r.stock_code,
+                r.agent_name[:8],
+                r.online_name[:8],
+                "✅" if r.name_match else "❌",
+                _fnum(r.agent_pe),
+                r.agent_pe_source,
+                _fnum(r.tushare_pe),
+                _fnum(r.online_pe),
+                _fnum(r.pe_diff_tushare),
+                _fnum(r.pe_diff_online),
+                _fnum(r.agent_pb),
+                _fnum(r.online_pb),
+                _fnum(r.pb_diff),
+                _fnum(r.agent_score, 1),
+            ))
+
+        # 均值/最大值/阈值计数仍在数组上向量化完成
+        pe_t_diffs = np.asarray(pe_t_vals, dtype=np.float64)
+        pe_o_diffs = np.asarray(pe_o_vals, dtype=np.float64)
+        scores = np.asarray(score_vals, dtype=np.float64)
+        pe_tushare_available = pe_t_diffs.size
+        pe_online_available = pe_o_diffs.size
+        pb_available = len(pb_vals)
+        
+        w("## 📈 验证统计\n")
+        w(f"- 总验证股票: {total_stocks} 只\n")
+        w(f"- Agent分析成功: {agent_success} 只 ({agent_success/total_stocks*100:.1f}%)\n")
+        w(f"- 在线数据获取成功: {online_success} 只 ({online_success/total_stocks*100:.1f}%)\n")
+        w(f"- 股票名称匹配: {name_matches} 只 ({name_matches/total_stocks*100:.1f}%)\n")
+        w(f"- PE数据可对比(Tushare): {pe_tushare_available} 只 ({pe_tushare_available/total_stocks*100:.1f}%)\n")
+        w(f"- PE数据可对比(在线): {pe_online_available} 只 ({pe_online_available/total_stocks*100:.1f}%)\n")
+        w(f"- PB数据可对比: {pb_available} 只 ({pb_available/total_stocks*100:.1f}%)\n\n")
+
         # PE差异分析（Tushare）
         if pe_tushare_available > 0:
-            pe_diffs = [r['pe_diff_tushare'] for r in results if isinstance(r['pe_diff_tushare'], (int, float))]
-            avg_pe_diff = sum(pe_diffs) / len(pe_diffs)
-            max_pe_diff = max(pe_diffs)
-            large_pe_diffs = sum(1 for diff in pe_diffs if diff > 5)
-            
-            report.append("## 🎯 PE数据对比分析 (Agent vs Tushare)")
-            report.append(f"- 平均PE差异: {avg_pe_diff:.2f}")
-            report.append(f"- 最大PE差异: {max_pe_diff:.2f}")
-            report.append(f"- PE差异>5的股票: {large_pe_diffs} 只 ({large_pe_diffs/pe_tushare_available*100:.1f}%)")
-            report.append("")
-        
+            avg_pe_diff = pe_t_diffs.mean()
+            max_pe_diff = pe_t_diffs.max()
+            large_pe_diffs = int((pe_t_diffs > 5).sum())
+
+            w("## 🎯 PE数据对比分析 (Agent vs Tushare)\n")
+            w(f"- 平均PE差异: {avg_pe_diff:.2f}\n")
+            w(f"- 最大PE差异: {max_pe_diff:.2f}\n")
+            w(f"- PE差异>5的股票: {large_pe_diffs} 只 ({large_pe_diffs/pe_tushare_available*100:.1f}%)\n\n")
+
         # PE差异分析（在线）
         if pe_online_available > 0:
-            pe_diffs = [r['pe_diff_online'] for r in results if isinstance(r['pe_diff_online'], (int, float))]
-            avg_pe_diff = sum(pe_diffs) / len(pe_diffs)
-            max_pe_diff = max(pe_diffs)
-            large_pe_diffs = sum(1 for diff in pe_diffs if diff > 5)
-            
-            report.append("## 🎯 PE数据对比分析 (Agent vs 在线)")
-            report.append(f"- 平均PE差异: {avg_pe_diff:.2f}")
-            report.append(f"- 最大PE差异: {max_pe_diff:.2f}")
-            report.append(f"- PE差异>5的股票: {large_pe_diffs} 只 ({large_pe_diffs/pe_online_available*100:.1f}%)")
-            report.append("")
-        
+            avg_pe_diff = pe_o_diffs.mean()
+            max_pe_diff = pe_o_diffs.max()
+            large_pe_diffs = int((pe_o_diffs > 5).sum())
+
+            w("## 🎯 PE数据对比分析 (Agent vs 在线)\n")
+            w(f"- 平均PE差异: {avg_pe_diff:.2f}\n")
+            w(f"- 最大PE差异: {max_pe_diff:.2f}\n")
+            w(f"- PE差异>5的股票: {large_pe_diffs} 只 ({large_pe_diffs/pe_online_available*100:.1f}%)\n\n")
+
         # 详细对比表
-        report.append("## 📋 详细验证结果")
-        report.append("")
-        report.append("| 序号 | 股票代码 | Agent名称 | 在线名称 | 名称匹配 | Agent PE | PE来源 | Tushare PE | 在线PE | PE差异(T) | PE差异(O) | Agent PB | 在线PB | PB差异 | Agent评分 |")
-        report.append("|------|----------|-----------|----------|----------|----------|--------|------------|--------|-----------|-----------|----------|--------|--------|-----------|")
-        
-        for i, result in enumerate(results, 1):
-            name_match_str = "✅" if result['name_match'] else "❌"
-            
-            agent_pe_str = f"{result['agent_pe']:.2f}" if isinstance(result['agent_pe'], (int, float)) else "N/A"
-            tushare_pe_str = f"{result['tushare_pe']:.2f}" if isinstance(result['tushare_pe'], (int, float)) else "N/A"
-            online_pe_str = f"{result['online_pe']:.2f}" if isinstance(result['online_pe'], (int, float)) else "N/A"
-            
-            pe_diff_t_str = f"{result['pe_diff_tushare']:.2f}" if isinstance(result['pe_diff_tushare'], (int, float)) else "N/A"
-            pe_diff_o_str = f"{result['pe_diff_online']:.2f}" if isinstance(result['pe_diff_online'], (int, float)) else "N/A"
-            
-            agent_pb_str = f"{result['agent_pb']:.2f}" if isinstance(result['agent_pb'], (int, float)) else "N/A"
-            online_pb_str = f"{result['online_pb']:.2f}" if isinstance(result['online_pb'], (int, float)) else "N/A"
-            pb_diff_str = f"{result['pb_diff']:.2f}" if isinstance(result['pb_diff'], (int, float)) else "N/A"
-            
-            agent_score_str = f"{result['agent_score']:.1f}" if isinstance(result['agent_score'], (int, float)) else "N/A"
-            
-            pe_source = result['agent_pe_source']
-            
-            report.append(f"| {i} | {result['stock_code']} | {result['agent_name'][:8]} | {result['online_name'][:8]} | {name_match_str} | {agent_pe_str} | {pe_source} | {tushare_pe_str} | {online_pe_str} | {pe_diff_t_str} | {pe_diff_o_str} | {agent_pb_str} | {online_pb_str} | {pb_diff_str} | {agent_score_str} |")
-        
-        report.append("")
-        
-        # 数据质量分析
-        report.append("## 🔍 Agent性能分析")
-        
-        agent_with_realtime_pe = sum(1 for r in results if r['agent_pe_source'] == 'realtime')
-        agent_with_historical_pe = sum(1 for r in results if r['agent_pe_source'] == 'historical')
-        
-        report.append("### PE数据源分布")
-        report.append(f"- 使用实时PE: {agent_with_realtime_pe}/{agent_success} ({agent_with_realtime_pe/agent_success*100:.1f}%)" if agent_success > 0 else "- 使用实时PE: 0")
-        report.append(f"- 使用历史PE: {agent_with_historical_pe}/{agent_success} ({agent_with_historical_pe/agent_success*100:.1f}%)" if agent_success > 0 else "- 使用历史PE: 0")
-        report.append("")
-        
+        w("## 📋 详细验证结果\n\n")
+        w("| 序号 | 股票代码 | Agent名称 | 在线名称 | 名称匹配 | Agent PE | PE来源 | Tushare PE | 在线PE | PE差异(T) | PE差异(O) | Agent PB | 在线PB | PB差异 | Agent评分 |\n")
+        w("|------|----------|-----------|----------|----------|----------|--------|------------|--------|-----------|-----------|----------|--------|--------|-----------|\n")
+
+        for i, row in enumerate(baked_rows, 1):
+            w(f"| {i} | " + " | ".join(row) + " |\n")
+
+        w("\n")
+
+        # 数据质量分析（计数来自上面的融合扫描）
+        w("## 🔍 Agent性能分析\n")
+
+        w("### PE数据源分布\n")
+        w(f"- 使用实时PE: {agent_with_realtime_pe}/{agent_success} ({agent_with_realtime_pe/agent_success*100:.1f}%)\n" if agent_success > 0 else "- 使用实时PE: 0\n")
+        w(f"- 使用历史PE: {agent_with_historical_pe}/{agent_success} ({agent_with_historical_pe/agent_success*100:.1f}%)\n" if agent_success > 0 else "- 使用历史PE: 0\n")
+        w("\n")
+
         # 评分分布
-        scores = [r['agent_score'] for r in results if isinstance(r['agent_score'], (int, float))]
-        if scores:
-            avg_score = sum(scores) / len(scores)
-            high_scores = sum(1 for s in scores if s >= 70)
-            medium_scores = sum(1 for s in scores if 50 <= s < 70)
-            
-            report.append("### Agent评分分布")
-            report.append(f"- 平均评分: {avg_score:.1f}")
-            report.append(f"- 高分股票(≥70): {high_scores} 只")
-            report.append(f"- 中等股票(50-69): {medium_scores} 只")
-            report.append("")
-        
+        if scores.size:
+            avg_score = scores.mean()
+            high_scores = int((scores >= 70).sum())
+            medium_scores = int(((scores >= 50) & (scores < 70)).sum())
+
+            w("### Agent评分分布\n")
+            w(f"- 平均评分: {avg_score:.1f}\n")
+            w(f"- 高分股票(≥70): {high_scores} 只\n")
+            w(f"- 中等股票(50-69): {medium_scores} 只\n\n")
+
         # 结论与建议
-        report.append("## 🔍 结论与建议")
-        
+        w("## 🔍 结论与建议\n")
+
         if agent_success / total_stocks < 0.8:
-            report.append("⚠️ **Agent分析成功率较低**，建议检查数据完整性和程序稳定性")
+            w("⚠️ **Agent分析成功率较低**，建议检查数据完整性和程序稳定性\n")
         else:
-            report.append("✅ Agent分析成功率良好")
-        
+            w("✅ Agent分析成功率良好\n")
+
         if name_matches / total_stocks < 0.8:
-            report.append("⚠️ **股票名称匹配率较低**，建议检查股票代码映射")
+            w("⚠️ **股票名称匹配率较低**，建议检查股票代码映射\n")
         else:
-            report.append("✅ 股票名称匹配良好")
-        
+            w("✅ 股票名称匹配良好\n")
+
         if pe_tushare_available > 0:
-            pe_diffs = [r['pe_diff_tushare'] for r in results if isinstance(r['pe_diff_tushare'], (int, float))]
-            avg_pe_diff = sum(pe_diffs) / len(pe_diffs)
+            avg_pe_diff = pe_t_diffs.mean()
             if avg_pe_diff > 10:
-                report.append("⚠️ **PE数据差异较大(vs Tushare)**，建议检查PE获取逻辑")
+                w("⚠️ **PE数据差异较大(vs Tushare)**，建议检查PE获取逻辑\n")
             elif avg_pe_diff > 5:
-                report.append("📊 PE数据与Tushare存在一定差异，可能与数据更新时间有关")
+                w("📊 PE数据与Tushare存在一定差异，可能与数据更新时间有关\n")
             else:
-                report.append("✅ PE数据与Tushare基本一致")
-        
+                w("✅ PE数据与Tushare基本一致\n")
+
         if agent_with_realtime_pe / agent_success < 0.5 if agent_success > 0 else False:
-            report.append("📊 **实时PE获取率较低**，建议优化实时数据获取策略")
-        
-        report.append("")
-        report.append("---")
-        report.append("*注：Agent使用的PE数据可能是实时获取或历史数据，与不同在线数据源存在差异是正常的。*")
-        
-        return "\n".join(report)
+            w("📊 **实时PE获取率较低**，建议优化实时数据获取策略\n")
+
+        w("\n---\n")
+        w("*注：Agent使用的PE数据可能是实时获取或历史数据，与不同在线数据源存在差异是正常的。*")
+
+        return buf.getvalue()
 
 def main():
     logger.info("开始Agent结果验证测试")
@@ -386,19 +616,18 @@ def main():
         print("="*80)
         print(f"验证样本: {len(results)} 只股票")
         
-        agent_success = sum(1 for r in results if r['agent_success'])
+        agent_success = sum(1 for r in results if r.agent_success)
         print(f"Agent成功分析: {agent_success}/{len(results)} ({agent_success/len(results)*100:.1f}%)")
-        
-        name_matches = sum(1 for r in results if r['name_match'])
+
+        name_matches = sum(1 for r in results if r.name_match)
         print(f"名称匹配: {name_matches}/{len(results)} ({name_matches/len(results)*100:.1f}%)")
-        
-        pe_tushare_available = sum(1 for r in results if isinstance(r['pe_diff_tushare'], (int, float)))
-        if pe_tushare_available > 0:
-            pe_diffs = [r['pe_diff_tushare'] for r in results if isinstance(r['pe_diff_tushare'], (int, float))]
+
+        pe_diffs = [r.pe_diff_tushare for r in results if isinstance(r.pe_diff_tushare, (int, float))]
+        if pe_diffs:
             avg_pe_diff = sum(pe_diffs) / len(pe_diffs)
-            print(f"PE数据对比(Tushare): {pe_tushare_available} 只，平均差异: {avg_pe_diff:.2f}")
-        
-        scores = [r['agent_score'] for r in results if isinstance(r['agent_score'], (int, float))]
+            print(f"PE数据对比(Tushare): {len(pe_diffs)} 只，平均差异: {avg_pe_diff:.2f}")
+
+        scores = [r.agent_score for r in results if isinstance(r.agent_score, (int, float))]
         if scores:
             avg_score = sum(scores) / len(scores)
             print(f"平均评分: {avg_score:.1f}")
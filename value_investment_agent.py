@@ -8,14 +8,25 @@
 import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 from loguru import logger
-import argparse
+import functools
 import json
+import importlib.util
+import math
+import re
+import os
+import sys
+import hashlib
 import time
 import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Tushare API相关导入
 try:
@@ -25,10 +36,554 @@ except ImportError:
     TUSHARE_AVAILABLE = False
     logger.warning("Tushare未安装，将无法获取实时PE数据")
 
+# 可选依赖：aiohttp（DeepSeek异步并发）与xlsxwriter（常量内存流式写Excel）。
+# 仅用find_spec探测存在性，模块本体推迟到使用处再导入——
+# 单股分析等轻量CLI路径不必为报表/并发功能付启动开销
+AIOHTTP_AVAILABLE = importlib.util.find_spec('aiohttp') is not None
+XLSXWRITER_AVAILABLE = importlib.util.find_spec('xlsxwriter') is not None
+
+# 芒格偏好的优质行业关键词；正则在模块加载时编译一次，
+# 每股判定从20+次Python子串搜索变为单次DFA匹配
+QUALITY_INDUSTRIES = (
+    '银行', '保险', '食品饮料', '白酒', '医药生物', '公用事业',
+    '消费服务', '商业贸易', '家用电器', '餐饮', '乳制品',
+    '调味品', '软饮料', '酿酒', '中药', '生物制药', '医疗器械',
+    '电力', '燃气', '水务', '机场', '高速公路', '港口'
+)
+_QUALITY_RE = re.compile('|'.join(map(re.escape, QUALITY_INDUSTRIES)))
+
+# SoA指标矩阵的行布局（numba核按行号访问，勿改顺序）
+SCORE_METRICS = ('roe', 'debt_ratio', 'net_margin', 'current_ratio', 'pe',
+                 'pb', 'dividend', 'asset_turnover', 'gross_margin', 'total_assets')
+
+# 可选依赖：numba把整池打分的纯算术部分JIT成机器码并跨核并行
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _nb_stats(row, positive):
+        """单遍累加求(计数, 均值, 总体标准差)，NaN视为缺失"""
+        n = 0
+        s = 0.0
+        s2 = 0.0
+        for v in row:
+            if not math.isnan(v) and (not positive or v > 0):
+                n += 1
+                s += v
+                s2 += v * v
+        if n == 0:
+            return 0, 0.0, 0.0
+        mean = s / n
+        var = s2 / n - mean * mean
+        if var < 0.0:
+            var = 0.0
+        return n, mean, math.sqrt(var)
+
+    @njit(cache=True)
+    def _nb_slope(row):
+        """正值序列的最小二乘斜率（与np.polyfit一阶拟合等价）"""
+        n = 0
+        sx = sy = sxy = sx2 = 0.0
+        for v in row:
+            if not math.isnan(v) and v > 0:
+                x = float(n)
+                sx += x
+                sy += v
+                sxy += x * v
+                sx2 += x * x
+                n += 1
+        if n < 2:
+            return 0.0
+        denom = n * sx2 - sx * sx
+        if denom == 0.0:
+            return 0.0
+        return (n * sxy - sx * sy) / denom
+
+    @njit(cache=True)
+    def _nb_trend(row):
+        """仅忽略NaN的最小二乘斜率（口径同_calculate_trend，允许负值）"""
+        n = 0
+        sx = sy = sxy = sx2 = 0.0
+        for v in row:
+            if not math.isnan(v):
+                x = float(n)
+                sx += x
+                sy += v
+                sxy += x * v
+                sx2 += x * x
+                n += 1
+        if n < 2:
+            return 0.0
+        denom = n * sx2 - sx * sx
+        if denom == 0.0:
+            return 0.0
+        return (n * sxy - sx * sy) / denom
+
+    @njit(cache=True)
+    def _nb_cagr(row):
+        """仅忽略NaN的首末复合增长率（口径同_calculate_growth_rate）"""
+        first = 0.0
+        last = 0.0
+        n = 0
+        for v in row:
+            if not math.isnan(v):
+                if n == 0:
+                    first = v
+                last = v
+                n += 1
+        if n < 2 or first <= 0.0:
+            return 0.0
+        return (last / first) ** (1.0 / (n - 1)) - 1.0
+
+    @njit(cache=True)
+    def _nb_growth(row):
+        """正值序列的(计数, 首末复合增长率)"""
+        first = 0.0
+        last = 0.0
+        n = 0
+        for v in row:
+            if not math.isnan(v) and v > 0:
+                if n == 0:
+                    first = v
+                last = v
+                n += 1
+        if n < 2 or first <= 0.0:
+            return n, 0.0
+        return n, (last / first) ** (1.0 / (n - 1)) - 1.0
+
+    @njit(cache=True)
+    def _nb_last_valid(row, last):
+        """从补齐前的最后一列向前找最近的非NaN值（无则返回NaN）"""
+        for j in range(last, -1, -1):
+            v = row[j]
+            if not math.isnan(v):
+                return v
+        return math.nan
+
+    @njit(cache=True)
+    def _nb_score_row(arr, n_years, quality, include_pe):
+        """单股三套标准打分；行序与SCORE_METRICS一致
+
+        n_years是该股的真实年份数：矩阵按最大年份数补NaN对齐，
+        最新值从补齐前的最后一列向前取最近有数的年份，
+        与SQL路径按data[max(keys)]取值的口径一致。
+        """
+        score_b = 0.0
+        score_m = 0.0
+        score_g = 0.0
+        last = n_years - 1
+
+        # ROE（正值）：水平+稳定性（巴菲特）
+        n, mean, std = _nb_stats(arr[0], True)
+        if n >= 3:
+            a = mean / 100.0
+            if a > 0.20:
+                score_b += 25
+            elif a > 0.15:
+                score_b += 15
+            elif a > 0.10:
+                score_b += 5
+            if std < 5.0:
+                score_b += 10
+
+        # 债务比率（巴菲特）
+        n, mean, _ = _nb_stats(arr[1], False)
+        if n > 0:
+            d = mean / 100.0
+            if d < 0.2:
+                score_b += 20
+            elif d < 0.3:
+                score_b += 10
+            elif d > 0.6:
+                score_b -= 10
+
+        # 净利率持续为正（巴菲特）
+        n_all, _, _ = _nb_stats(arr[2], False)
+        n_pos, _, _ = _nb_stats(arr[2], True)
+        if n_all >= 3 and n_pos == n_all:
+            score_b += 15
+
+        # 流动比率（巴菲特+格雷厄姆共用均值）
+        n, cr, _ = _nb_stats(arr[3], False)
+        if n > 0:
+            if cr > 2.0:
+                score_b += 10
+                score_g += 15
+            elif cr > 1.5:
+                score_b += 5
+                score_g += 10
+
+        # 最新PE（三套阈值各不相同）
+        if include_pe and last >= 0:
+            pe = _nb_last_valid(arr[4], last)
+            if not math.isnan(pe) and 0.0 < pe < 100.0:
+                if pe < 15.0:
+                    score_b += 25
+                elif pe < 25.0:
+                    score_b += 15
+                elif pe < 35.0:
+                    score_b += 5
+                elif pe > 50.0:
+                    score_b -= 10
+                if pe < 20.0:
+                    score_m += 15
+                elif pe < 30.0:
+                    score_m += 5
+                elif pe > 60.0:
+                    score_m -= 10
+                if pe < 12.0:
+                    score_g += 25
+                elif pe < 20.0:
+                    score_g += 15
+                elif pe < 30.0:
+                    score_g += 5
+                elif pe > 40.0:
+                    score_g -= 5
+
+        # 最新PB/股息（格雷厄姆）
+        if last >= 0:
+            pb = _nb_last_valid(arr[5], last)
+            if not math.isnan(pb) and pb > 0.0:
+                if pb < 1.0:
+                    score_g += 20
+                elif pb < 2.0:
+                    score_g += 10
+                elif pb < 3.0:
+                    score_g += 5
+            dv = _nb_last_valid(arr[6], last)
+            if not math.isnan(dv) and dv > 0.0:
+                d = dv / 100.0
+                if d > 0.04:
+                    score_g += 15
+                elif d > 0.02:
+                    score_g += 10
+
+        # 资产周转率（芒格）
+        n, at, _ = _nb_stats(arr[7], True)
+        if n > 0:
+            if at > 0.8:
+                score_m += 15
+            elif at > 0.5:
+                score_m += 10
+
+        # 毛利率水平与趋势（芒格）
+        n, gm, _ = _nb_stats(arr[8], True)
+        if n >= 3:
+            g = gm / 100.0
+            if g > 0.40:
+                score_m += 20
+            elif g > 0.25:
+                score_m += 10
+            if _nb_slope(arr[8]) > 0.0:
+                score_m += 10
+
+        # 优质行业（字符串匹配在Python侧预先算好传入）
+        if quality:
+            score_m += 15
+
+        # 总资产增长（格雷厄姆）
+        n, growth = _nb_growth(arr[9])
+        if n >= 3:
+            if growth > 0.1:
+                score_g += 10
+            elif growth > 0.0:
+                score_g += 5
+
+        return min(score_b, 100.0), min(score_m, 100.0), min(score_g, 100.0)
+
+    @njit(cache=True, parallel=True)
+    def _nb_score_batch(mat, n_years, quality, include_pe, out):
+        """整池并行打分：mat形状(股票数, 指标数, 年数)"""
+        for i in prange(mat.shape[0]):
+            b, m, g = _nb_score_row(mat[i], n_years[i], quality[i], include_pe)
+            out[i, 0] = b
+            out[i, 1] = m
+            out[i, 2] = g
+
+    @njit(cache=True)
+    def _nb_prelim_score(roe, cf, revenue, debt, current, pe):
+        """初筛评分核心：输入为已去NaN（revenue/pe并已取正）的float64数组
+
+        返回(总分, roe均值小数, 平均营收增速, 负债率小数, 流动比率,
+        历史PE均值)，缺数的中间量记NaN。阈值阶梯与preliminary_screening
+        的分档表逐一对应
+        """
+        score = 0
+        roe_avg = np.nan
+        avg_growth = np.nan
+        debt_ratio = np.nan
+        current_ratio = np.nan
+        historical_pe = np.nan
+
+        # ROE评分 (15分)
+        if len(roe):
+            roe_avg = roe.mean() / 100.0
+            if roe_avg >= 0.15:
+                score += 15
+            elif roe_avg >= 0.10:
+                score += 10
+            elif roe_avg >= 0.05:
+                score += 5
+
+        # 现金流评分 (10分)
+        if len(cf):
+            cf_count = 0
+            for v in cf:
+                if v > 0:
+                    cf_count += 1
+            if cf_count >= 4:
+                score += 10
+            elif cf_count >= 3:
+                score += 7
+            elif cf_count >= 2:
+                score += 3
+
+        # 营收增长评分 (10分)
+        if len(revenue) >= 3:
+            g_sum = 0.0
+            for i in range(1, len(revenue)):
+                g_sum += (revenue[i] - revenue[i - 1]) / revenue[i - 1]
+            avg_growth = g_sum / (len(revenue) - 1)
+            if avg_growth >= 0.10:
+                score += 10
+            elif avg_growth >= 0.05:
+                score += 7
+            elif avg_growth >= 0.0:
+                score += 3
+
+        # 财务稳定性评分 (10分)
+        if len(debt):
+            debt_ratio = debt.mean() / 100.0
+            if debt_ratio < 0.3:
+                score += 5
+            elif debt_ratio < 0.5:
+                score += 3
+        if len(current):
+            current_ratio = current.mean()
+            if current_ratio > 1.5:
+                score += 5
+            elif current_ratio > 1.0:
+                score += 3
+
+        # 历史PE评分 (15分)
+        if len(pe):
+            historical_pe = pe.mean()
+            if historical_pe <= 10:
+                score += 15
+            elif historical_pe <= 15:
+                score += 12
+            elif historical_pe <= 20:
+                score += 8
+            elif historical_pe <= 30:
+                score += 5
+
+        return score, roe_avg, avg_growth, debt_ratio, current_ratio, historical_pe
+
+    @njit(cache=True)
+    def _nb_potential_score(roe, cf, revenue, debt, current, historical_pe):
+        """潜力评分核心：入参约定同_nb_prelim_score，historical_pe可为NaN
+
+        手写循环算均值/总体标准差/连增计数，阈值阶梯与_assess_potential
+        逐一对应，返回封顶50分的潜力分
+        """
+        score = 0.0
+
+        # ROE稳定性和趋势 (最高15分)
+        if len(roe) >= 3:
+            m = roe.mean()
+            var = 0.0
+            for v in roe:
+                var += (v - m) * (v - m)
+            roe_std = math.sqrt(var / len(roe))
+            if roe_std < 2:
+                score += 8
+            elif roe_std < 5:
+                score += 5
+            elif roe_std < 8:
+                score += 2
+
+            recent = (roe[-1] + roe[-2]) / 2.0
+            early = (roe[0] + roe[1]) / 2.0
+            if recent > early * 1.1:
+                score += 7
+            elif recent > early:
+                score += 4
+
+        # 营收增长一致性 (最高10分)
+        if len(revenue) >= 3:
+            growth_count = 0
+            for i in range(1, len(revenue)):
+                if revenue[i] > revenue[i - 1]:
+                    growth_count += 1
+            if growth_count == len(revenue) - 1:
+                score += 8
+            elif growth_count >= len(revenue) * 0.7:
+                score += 5
+            elif growth_count >= len(revenue) * 0.5:
+                score += 2
+
+        # 现金流质量 (最高8分)
+        if len(cf):
+            positive = 0
+            for v in cf:
+                if v > 0:
+                    positive += 1
+            ratio = positive / len(cf)
+            if ratio >= 0.8:
+                score += 8
+            elif ratio >= 0.6:
+                score += 5
+            elif ratio >= 0.4:
+                score += 2
+
+        # 财务安全边际 (最高7分)
+        debt_ratio = debt.mean() / 100.0 if len(debt) else 1.0
+        current_ratio = current.mean() if len(current) else 0.5
+        if debt_ratio < 0.2:
+            score += 4
+        elif debt_ratio < 0.4:
+            score += 2
+        if current_ratio > 2.0:
+            score += 3
+        elif current_ratio > 1.5:
+            score += 1
+
+        # 历史PE合理性 (最高5分)
+        if not math.isnan(historical_pe) and 5 <= historical_pe <= 25:
+            if historical_pe <= 12:
+                score += 5
+            elif historical_pe <= 18:
+                score += 3
+            else:
+                score += 1
+
+        return min(score, 50.0)
+
+def _warm_numba_kernels():
+    """在后台线程预热全部numba核
+
+    pycc式AOT在新版numba已弃用；这里依赖核上的cache=True磁盘缓存，
+    启动时用微型输入触发一次编译/加载，把首调开销挪出打分热路径
+    （与数据库预加载重叠进行）。
+    """
+    try:
+        row = np.array([1.0, 2.0, np.nan], dtype=np.float64)
+        _nb_stats(row, True)
+        _nb_last_valid(row, 2)
+        _nb_slope(row)
+        _nb_growth(row)
+        _nb_trend(row)
+        _nb_cagr(row)
+        mat = np.full((1, len(SCORE_METRICS), 3), np.nan, dtype=np.float32)
+        _nb_score_batch(mat, np.array([3], dtype=np.int64), np.array([False]),
+                        True, np.empty((1, 3), dtype=np.float32))
+        empty = np.empty(0)
+        _nb_prelim_score(empty, empty, empty, empty, empty, empty)
+        _nb_potential_score(empty, empty, empty, empty, empty, math.nan)
+    except Exception as e:
+        logger.debug(f"numba核预热失败: {e}")
+
+@functools.lru_cache(maxsize=1)
+def _load_system_prompt(path: str = 'system_prompt.md') -> str:
+    """系统提示词整个进程只读一次（循环内反复实例化也不重复IO）"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.warning("未找到system_prompt.md文件，使用默认提示词")
+        return "你是一位专业的价值投资分析师，请对提供的股票数据进行深度分析。"
+
+@functools.lru_cache(maxsize=8)
+def _load_json_config_cached(path: str, mtime: float) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _read_json_config(path: str) -> dict:
+    """读JSON配置，按(绝对路径, mtime)缓存——文件变更自动失效"""
+    abspath = os.path.abspath(path)
+    return _load_json_config_cached(abspath, os.path.getmtime(abspath))
+
+@functools.lru_cache(maxsize=1)
+def _excel_header_styles():
+    """openpyxl表头样式单例：样式对象构建与去重是openpyxl写入的大头，
+    进程内只建一次（懒导入，openpyxl仍是可选依赖）"""
+    from openpyxl.styles import Font, Alignment, PatternFill
+    return (Font(bold=True, color="FFFFFF"),
+            PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+            Alignment(horizontal="center", vertical="center"))
+
+@functools.lru_cache(maxsize=None)
+def _excel_fill(color: str):
+    """按颜色缓存的行底色PatternFill，免去逐单元格新建样式对象"""
+    from openpyxl.styles import PatternFill
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+def _is_num(value) -> bool:
+    """标量有效性判断：NaN是唯一不等于自身的浮点，
+    比pd.notna省掉isinstance分发（报表单元格写入的热路径）"""
+    return value is not None and value == value
+
+class DeepSeekRateLimiter:
+    """DeepSeek调用限速器：RPM令牌桶 + 在途并发上限
+
+    DeepSeek超过未公开的并发阈值后会静默降级直到60s超时，
+    事后重试只是白付超时；这里主动按配额放行，被限流时
+    乘性降速、成功后加性恢复(AIMD)
+    """
+
+    def __init__(self, rpm: int = 60, max_concurrent: int = 8):
+        self.base_rate = rpm / 60.0
+        self.rate = self.base_rate
+        self.capacity = max(1.0, self.base_rate * 5)  # 约5秒的突发容量
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.semaphore = threading.Semaphore(max_concurrent)
+
+    def _reserve(self) -> float:
+        """扣一个令牌，返回透支时需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self):
+        """被限流：放行速率减半（不低于基准的1/8）"""
+        with self._lock:
+            self.rate = max(self.base_rate / 8, self.rate / 2)
+
+    def reward(self):
+        """成功：小步恢复至基准速率"""
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
 class DeepSeekAnalyzer:
     """DeepSeek AI分析器"""
-    
-    def __init__(self, api_key: str = None, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat"):
+
+    # 分析结果磁盘缓存有效期：输入数据一周内未变则复用
+    CACHE_TTL_SECONDS = 7 * 86400
+
+    def __init__(self, api_key: str = None, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat",
+                 rpm: int = 60, max_concurrent: int = 8,
+                 cache_path: str = '.cache/deepseek_cache.db'):
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
@@ -36,71 +591,265 @@ class DeepSeekAnalyzer:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         } if api_key else None
-        
-        # 加载系统提示词
-        self.system_prompt = self.load_system_prompt()
+
+        # 持久Session：keep-alive复用到api.deepseek.com的TCP+TLS连接，
+        # 逐股调用不再重付握手；瞬时故障在适配器层退避重试
+        self.session = requests.Session()
+        if self.headers:
+            self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.5,
+                              status_forcelist=(429, 500, 502, 503, 504)))
+        self.session.mount('https://', adapter)
+
+        # 主动限速：避免触发DeepSeek的静默降级与60s超时
+        self.rate_limiter = DeepSeekRateLimiter(rpm=rpm, max_concurrent=max_concurrent)
+
+        # 磁盘缓存：按(模型+提示词+数据摘要)哈希存储分析结果，
+        # 输入未变的重跑直接命中，不再重付模型调用
+        self.cache_path = cache_path
+        self._cache = None
+        self._cache_lock = threading.Lock()
+
+        # 加载系统提示词（模块级缓存，进程内只读一次文件）
+        self.system_prompt = _load_system_prompt()
+
+    def close(self):
+        """释放连接池"""
+        self.session.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
     
     def load_system_prompt(self) -> str:
-        """加载系统提示词"""
-        try:
-            with open('system_prompt.md', 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            logger.warning("未找到system_prompt.md文件，使用默认提示词")
-            return "你是一位专业的价值投资分析师，请对提供的股票数据进行深度分析。"
+        """加载系统提示词（保留旧接口，内部走模块级缓存）"""
+        return _load_system_prompt()
     
-    def analyze_stock(self, stock_code: str, stock_data: Dict, score_details: Dict) -> Optional[str]:
-        """使用DeepSeek分析单个股票"""
+    def _api_url(self) -> str:
+        """拼出chat/completions完整地址"""
+        api_url = self.base_url
+        if not api_url.endswith('/chat/completions'):
+            api_url = api_url.rstrip('/') + '/chat/completions'
+        return api_url
+
+    def _cache_conn(self) -> sqlite3.Connection:
+        """惰性打开缓存库（单表：key/response/ts）"""
+        if self._cache is None:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    ts INT
+                )
+            ''')
+            self._cache = conn
+        return self._cache
+
+    def _cache_key(self, data_summary: str) -> str:
+        return hashlib.sha256(
+            (self.model + self.system_prompt + data_summary).encode('utf-8')
+        ).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._cache_lock:
+            row = self._cache_conn().execute(
+                'SELECT response, ts FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row and time.time() - row[1] < self.CACHE_TTL_SECONDS:
+            return row[0]
+        return None
+
+    def _cache_put(self, key: str, response: str):
+        with self._cache_lock:
+            conn = self._cache_conn()
+            conn.execute('INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)',
+                         (key, response, int(time.time())))
+            conn.commit()
+
+    def _build_payload(self, data_summary: str) -> Dict:
+        """由数据摘要构建请求体（同步/异步路径共用）"""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self.system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": f"请对以下A股上市公司进行深度价值投资分析：\n\n{data_summary}"
+                }
+            ],
+            "temperature": 0.3,
+            "max_tokens": 3000
+        }
+
+    def analyze_stock_stream(self, stock_code: str, stock_data: Dict, score_details: Dict,
+                             force_refresh: bool = False):
+        """
+        流式分析单个股票：SSE边收边yield内容片段
+
+        整段阻塞到60s超时才拿到完整文本会卡住下游；stream=True下
+        首token即可开始写出，内存里也只保留当前片段。完整文本在
+        流结束后照常写入磁盘缓存。
+        """
         if not self.api_key or not self.headers:
             logger.warning("DeepSeek API Key未配置，跳过AI分析")
-            return None
-        
+            return
+
         try:
-            # 构建分析用的数据摘要
             data_summary = self.format_stock_data(stock_code, stock_data, score_details)
-            
-            # 构建请求
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": self.system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": f"请对以下A股上市公司进行深度价值投资分析：\n\n{data_summary}"
-                    }
-                ],
-                "temperature": 0.3,
-                "max_tokens": 3000
-            }
-            
-            # 发送请求
-            api_url = self.base_url
-            if not api_url.endswith('/chat/completions'):
-                api_url = api_url.rstrip('/') + '/chat/completions'
-            
-            response = requests.post(
-                api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                analysis = result['choices'][0]['message']['content']
+
+            # 输入摘要未变时直接命中磁盘缓存，省掉整次模型调用
+            cache_key = self._cache_key(data_summary)
+            if not force_refresh:
+                cached = self._cache_get(cache_key)
+                if cached is not None:
+                    logger.info(f"命中DeepSeek分析缓存: {stock_code}")
+                    yield cached
+                    return
+
+            payload = self._build_payload(data_summary)
+            payload['stream'] = True
+            api_url = self._api_url()
+
+            self.rate_limiter.acquire()
+            pieces = []
+            with self.rate_limiter.semaphore:
+                with self.session.post(api_url, json=payload, timeout=(5, 60),
+                                       stream=True) as response:
+                    if response.status_code != 200:
+                        if response.status_code == 429:
+                            self.rate_limiter.penalize()
+                        logger.error(f"DeepSeek API请求失败: {response.status_code} - {response.text}")
+                        return
+
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith('data: '):
+                            continue
+                        data = line[6:]
+                        if data == '[DONE]':
+                            break
+                        delta = json.loads(data)['choices'][0].get('delta', {})
+                        content = delta.get('content')
+                        if content:
+                            pieces.append(content)
+                            yield content
+
+            self.rate_limiter.reward()
+            if pieces:
+                self._cache_put(cache_key, ''.join(pieces))
                 logger.info(f"完成{stock_code}的DeepSeek AI分析")
-                return analysis
-            else:
-                logger.error(f"DeepSeek API请求失败: {response.status_code} - {response.text}")
-                return None
-                
+
         except Exception as e:
             logger.error(f"DeepSeek分析{stock_code}时出错: {e}")
+
+    def analyze_stock(self, stock_code: str, stock_data: Dict, score_details: Dict,
+                      force_refresh: bool = False) -> Optional[str]:
+        """使用DeepSeek分析单个股票（汇聚流式结果）"""
+        chunks = list(self.analyze_stock_stream(stock_code, stock_data, score_details,
+                                                force_refresh=force_refresh))
+        return ''.join(chunks) if chunks else None
+
+    async def analyze_stock_async(self, session, sem,
+                                  stock_code: str, stock_data: Dict,
+                                  score_details: Dict) -> Optional[str]:
+        """异步分析单只股票（信号量限制在途并发；429按Retry-After退避重试一次）"""
+        import aiohttp
+
+        async with sem:
+            data_summary = self.format_stock_data(stock_code, stock_data, score_details)
+
+            cache_key = self._cache_key(data_summary)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                logger.info(f"命中DeepSeek分析缓存: {stock_code}")
+                return cached
+
+            payload = self._build_payload(data_summary)
+            try:
+                for attempt in range(2):
+                    await self.rate_limiter.acquire_async()
+                    async with session.post(
+                            self._api_url(), json=payload,
+                            timeout=aiohttp.ClientTimeout(total=60)) as response:
+                        if response.status == 429 and attempt == 0:
+                            retry_after = float(response.headers.get('Retry-After', 1))
+                            self.rate_limiter.penalize()
+                            logger.warning(f"DeepSeek限流，{retry_after}s后重试 {stock_code}")
+                            await asyncio.sleep(retry_after)
+                            continue
+                        if response.status == 200:
+                            result = await response.json()
+                            analysis = result['choices'][0]['message']['content']
+                            self.rate_limiter.reward()
+                            self._cache_put(cache_key, analysis)
+                            logger.info(f"完成{stock_code}的DeepSeek AI分析")
+                            return analysis
+                        logger.error(f"DeepSeek API请求失败: {response.status}")
+                        return None
+            except Exception as e:
+                logger.error(f"DeepSeek分析{stock_code}时出错: {e}")
             return None
-    
+
+    async def _analyze_batch_async(self, items: List[Tuple], concurrency: int) -> List:
+        import aiohttp
+
+        sem = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector,
+                                         headers=self.headers) as session:
+            tasks = [self.analyze_stock_async(session, sem, *item) for item in items]
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def analyze_batch(self, items: List[Tuple], concurrency: int = 8) -> List[Optional[str]]:
+        """批量分析入口：N只股票的模型延迟相互重叠
+
+        items为(stock_code, stock_data, score_details)三元组列表；
+        aiohttp可用时走异步并发，否则退回逐只同步调用
+        """
+        if not self.api_key or not self.headers:
+            logger.warning("DeepSeek API Key未配置，跳过AI分析")
+            return [None] * len(items)
+
+        if not AIOHTTP_AVAILABLE:
+            logger.warning("aiohttp未安装，批量分析退回串行调用")
+            return [self.analyze_stock(*item) for item in items]
+
+        results = asyncio.run(self._analyze_batch_async(items, concurrency))
+        return [r if not isinstance(r, Exception) else None for r in results]
+
+    def analyze_many(self, items: List[Tuple], max_workers: int = 6) -> List[Optional[str]]:
+        """线程池并发的批量分析（同步API的并行版）
+
+        调用全程都在等网络IO，GIL不构成瓶颈：多线程共享连接池化的
+        session即可接近线性提速到并发上限。不依赖aiohttp，
+        适合不便引入异步调用链的调用方。
+
+        items为(stock_code, stock_data, score_details)三元组列表，
+        返回与items等长的结果列表（单只失败记None，不中断整批）
+        """
+        if not self.api_key or not self.headers:
+            logger.warning("DeepSeek API Key未配置，跳过AI分析")
+            return [None] * len(items)
+
+        def safe_analyze(item: Tuple) -> Optional[str]:
+            try:
+                return self.analyze_stock(*item)
+            except Exception as e:
+                logger.error(f"DeepSeek分析{item[0]}时出错: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(safe_analyze, items))
+
     def format_stock_data(self, stock_code: str, stock_data: Dict, score_details: Dict) -> str:
         """格式化股票数据为分析用的文本"""
         basic_info = stock_data.get('basic_info', {})
@@ -147,41 +896,61 @@ class DeepSeekAnalyzer:
             ('净利率(%)', 'net_profit_margin')
         ]
         
+        # 只格式化实际存在的指标，数值压缩到3位有效数字——
+        # 提示词越短，DeepSeek响应越快、费用越低
+        parts = [data_text]
+
         for metric_name, metric_key in key_metrics:
-            if metric_key in metrics:
-                metric_data = metrics[metric_key]
-                values = []
-                for year in sorted(metric_data.keys(), reverse=True)[:5]:  # 最近5年
-                    value = metric_data[year]
-                    if pd.notna(value):
-                        values.append(f"{year}年: {value}")
-                
-                if values:
-                    data_text += f"\n{metric_name}：{' | '.join(values)}"
-        
+            metric_data = metrics.get(metric_key)
+            if not metric_data:
+                continue
+            values = [
+                f"{year}年: {value:.3g}" if isinstance(value, (int, float))
+                else f"{year}年: {value}"
+                for year, value in sorted(metric_data.items(), reverse=True)[:5]  # 最近5年
+                if pd.notna(value)
+            ]
+            if values:
+                parts.append(f"\n{metric_name}：{' | '.join(values)}")
+
         # 添加评分详情
-        data_text += f"\n\n【详细评分分析】"
-        
+        parts.append("\n\n【详细评分分析】")
+
         for strategy, details in score_details.items():
             if strategy in ['buffett', 'munger', 'graham'] and isinstance(details, dict):
-                data_text += f"\n\n{strategy.title()}策略评分详情："
+                parts.append(f"\n\n{strategy.title()}策略评分详情：")
                 for criterion, score in details.get('scores', {}).items():
-                    data_text += f"\n- {criterion}: {score}分"
-        
-        return data_text
+                    parts.append(f"\n- {criterion}: {score}分")
+
+        return ''.join(parts)
 
 class TushareManager:
     """Tushare API管理器 - 支持多token和智能重试"""
     
+    # 全市场daily_basic快照的本地落盘位置（按交易日复用）
+    PE_CACHE_PATH = '.cache/daily_basic_cache.db'
+
+    # token冷却的AIMD参数：限流加倍退避，成功折半恢复
+    BACKOFF_BASE = 2.0
+    BACKOFF_MAX = 60.0
+
     def __init__(self, tokens: List[str]):
         if not TUSHARE_AVAILABLE:
             raise ImportError("需要安装tushare: pip install tushare")
-        
+
         self.tokens = tokens
         self.current_token_index = 0
         self.pro = None
+        # 整市场PE快照：一次HTTP调用服务全部后续查询
+        self._pe_map: Optional[Dict[str, float]] = None
+        self._pe_trade_date: Optional[str] = None
+        # 惰性预取的并发闸：冷缓存时评估线程池的worker会同时触发
+        self._prefetch_lock = threading.Lock()
+        # 各token的冷却截止时刻与当前退避时长（被限流的token先跳过）
+        self._token_cooldown: Dict[int, float] = {}
+        self._token_backoff: Dict[int, float] = {}
         self.init_api()
-        
+
     def init_api(self):
         """初始化API连接"""
         if self.tokens:
@@ -197,39 +966,200 @@ class TushareManager:
             logger.info(f"切换到Token {self.current_token_index + 1}")
             return True
         return False
-    
+
+    def _penalize_token(self, idx: int):
+        """当前token被限流：进入冷却，退避时长加倍（封顶BACKOFF_MAX）"""
+        backoff = self._token_backoff.get(idx, self.BACKOFF_BASE)
+        self._token_cooldown[idx] = time.monotonic() + backoff
+        self._token_backoff[idx] = min(self.BACKOFF_MAX, backoff * 2)
+        logger.debug(f"Token {idx + 1} 进入冷却 {backoff:.1f}s")
+
+    def _reward_token(self, idx: int):
+        """调用成功：退避时长折半，逐步恢复到基准"""
+        backoff = self._token_backoff.get(idx)
+        if backoff is not None and backoff > self.BACKOFF_BASE:
+            self._token_backoff[idx] = max(self.BACKOFF_BASE, backoff / 2)
+
+    def pick_token(self) -> float:
+        """
+        切换到最早可用的token
+
+        优先选已过冷却期的token（立即可用）；全部都在冷却时选剩余
+        冷却最短的一个。
+
+        Returns:
+            使用所选token前还需等待的秒数（0表示立即可用）
+        """
+        now = time.monotonic()
+        best_idx, best_wait = self.current_token_index, float('inf')
+        for offset in range(len(self.tokens)):
+            idx = (self.current_token_index + offset) % len(self.tokens)
+            wait = self._token_cooldown.get(idx, 0.0) - now
+            if wait <= 0:
+                best_idx, best_wait = idx, 0.0
+                break
+            if wait < best_wait:
+                best_idx, best_wait = idx, wait
+
+        if best_idx != self.current_token_index:
+            self.current_token_index = best_idx
+            self.init_api()
+            logger.info(f"切换到Token {best_idx + 1}")
+        return max(0.0, best_wait)
+
+    def _pe_cache_conn(self) -> sqlite3.Connection:
+        """打开daily_basic快照缓存库（必要时建表）"""
+        cache_dir = os.path.dirname(self.PE_CACHE_PATH)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        conn = sqlite3.connect(self.PE_CACHE_PATH)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_basic (
+                trade_date TEXT,
+                ts_code TEXT,
+                pe_ttm REAL,
+                pb REAL,
+                dv_ttm REAL,
+                PRIMARY KEY (trade_date, ts_code)
+            )
+        ''')
+        return conn
+
+    def prefetch_daily_basic(self, trade_date: str = None) -> bool:
+        """
+        一次拉取全市场daily_basic快照并建立ts_code→PE映射
+
+        逐股调用daily_basic(ts_code=...)是每股一次HTTP往返；同一接口按
+        trade_date查询可一次返回整个市场。快照按交易日落盘到本地SQLite，
+        同一天内重复运行直接读库，一次HTTP都不用发。
+
+        Returns:
+            是否成功建立快照映射
+        """
+        if self._pe_map is not None and (trade_date is None or trade_date == self._pe_trade_date):
+            return True
+
+        # 冷缓存时多个评估线程同时走到这里：持锁后二次检查，
+        # 保证整市场拉取只发出一次，其余线程等着直接用结果
+        with self._prefetch_lock:
+            if self._pe_map is not None and (
+                    trade_date is None or trade_date == self._pe_trade_date):
+                return True
+            return self._prefetch_daily_basic_locked(trade_date)
+
+    def _prefetch_daily_basic_locked(self, trade_date: str = None) -> bool:
+        """prefetch_daily_basic的持锁主体（勿直接调用）"""
+        # 未指定交易日则从今天往前找最近有数据的一天（覆盖节假日）
+        if trade_date:
+            candidates = [trade_date]
+        else:
+            today = datetime.now()
+            candidates = [(today - timedelta(days=i)).strftime('%Y%m%d') for i in range(10)]
+
+        # 先查本地落盘的快照
+        conn = self._pe_cache_conn()
+        try:
+            for td in candidates:
+                rows = conn.execute(
+                    "SELECT ts_code, pe_ttm FROM daily_basic WHERE trade_date = ?",
+                    (td,)).fetchall()
+                if rows:
+                    self._pe_map = dict(rows)
+                    self._pe_trade_date = td
+                    logger.info(f"从本地缓存加载 {td} 全市场PE快照（{len(rows)} 只）")
+                    return True
+        finally:
+            conn.close()
+
+        if not self.pro:
+            return False
+
+        for td in candidates:
+            try:
+                df = self.pro.daily_basic(trade_date=td, fields='ts_code,pe_ttm,pb,dv_ttm')
+            except Exception as e:
+                logger.warning(f"拉取 {td} 全市场daily_basic失败: {e}")
+                if any(keyword in str(e).lower() for keyword in ['limit', 'timeout', 'rate', '限制']):
+                    # 当前token冷却，轮换到最早可用的token；
+                    # 只有全部token都在冷却时才真正睡眠
+                    self._penalize_token(self.current_token_index)
+                    wait = self.pick_token()
+                    if wait > 0:
+                        time.sleep(wait)
+                continue
+
+            self._reward_token(self.current_token_index)
+
+            if df is not None and not df.empty:
+                self._pe_map = dict(zip(df['ts_code'], df['pe_ttm']))
+                self._pe_trade_date = td
+
+                conn = self._pe_cache_conn()
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO daily_basic (trade_date, ts_code, pe_ttm, pb, dv_ttm) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(td, row.ts_code,
+                          None if pd.isna(row.pe_ttm) else float(row.pe_ttm),
+                          None if pd.isna(row.pb) else float(row.pb),
+                          None if pd.isna(row.dv_ttm) else float(row.dv_ttm))
+                         for row in df.itertuples(index=False)])
+                    conn.commit()
+                finally:
+                    conn.close()
+
+                logger.info(f"已拉取 {td} 全市场PE快照（{len(df)} 只）")
+                return True
+
+        return False
+
     def get_realtime_pe(self, ts_code: str, max_retries: int = 3) -> Optional[float]:
         """获取实时PE数据"""
         if not self.pro:
             return None
-            
+
+        # 优先查全市场快照：首次调用惰性预取，之后O(1)命中
+        if self._pe_map is None:
+            self.prefetch_daily_basic()
+        if self._pe_map is not None and ts_code in self._pe_map:
+            pe = self._pe_map[ts_code]
+            if pe is not None and pd.notna(pe) and pe > 0:
+                logger.debug(f"获取{ts_code}实时PE(快照): {pe:.2f}")
+                return float(pe)
+            return None
+
+        # 快照未覆盖该代码时退回单股查询
         for attempt in range(max_retries):
             try:
                 # 获取基本信息，包含PE_TTM
                 df = self.pro.daily_basic(ts_code=ts_code, trade_date='', fields='ts_code,pe_ttm')
-                
+
+                self._reward_token(self.current_token_index)
                 if not df.empty and pd.notna(df.iloc[0]['pe_ttm']):
                     pe = float(df.iloc[0]['pe_ttm'])
                     if pe > 0:  # 确保PE为正数
                         logger.debug(f"获取{ts_code}实时PE: {pe:.2f}")
                         return pe
-                
+
                 return None
-                
+
             except Exception as e:
                 logger.warning(f"获取{ts_code}实时PE失败 (尝试{attempt+1}/{max_retries}): {e}")
-                
-                # 如果是API限制相关错误，尝试切换token
+
+                # 如果是API限制相关错误：当前token冷却并轮换，
+                # 只有全部token都在冷却时才真正睡眠
                 if any(keyword in str(e).lower() for keyword in ['limit', 'timeout', 'rate', '限制']):
-                    if self.switch_token():
-                        time.sleep(1)  # 切换后稍作等待
-                        continue
-                
+                    self._penalize_token(self.current_token_index)
+                    wait = self.pick_token()
+                    if wait > 0:
+                        time.sleep(wait)
+                    continue
+
                 # 否则等待后重试
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 2 + random.uniform(0.5, 1.5)
                     time.sleep(wait_time)
-        
+
         return None
 
 class ValueInvestmentAgent:
@@ -247,6 +1177,24 @@ class ValueInvestmentAgent:
         self.db_path = db_path
         self.tushare_manager = None
         self.deepseek_analyzer = None
+        # 复用的分析连接：惰性打开、按线程隔离，批量筛选不再逐股connect
+        self._tls = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        # preload_metrics填充的宽表缓存：命中后get_stock_metrics零SQL
+        self._metrics_wide: Optional[pd.DataFrame] = None
+        self._basic_cache: Dict[str, Dict] = {}
+        self._preloaded_codes: Optional[set] = None
+        # SoA指标矩阵：每股一个(指标×年份)的float32矩阵，打分走C层nan归约
+        self._metric_matrix: Dict[str, np.ndarray] = {}
+        # 整张stocks表的代码→基本信息映射（惰性整表读入，替代N次单行SELECT）
+        self._stocks: Optional[Dict[str, Dict]] = None
+        # 逐股查询结果缓存：同一股票在初筛/潜力/综合评估间只落一次SQL
+        self._metrics_cache: Dict[str, Dict] = {}
+        self._metrics_cache_lock = threading.Lock()
+        # numba核后台预热：编译/缓存加载与后续数据加载重叠
+        if NUMBA_AVAILABLE:
+            threading.Thread(target=_warm_numba_kernels, daemon=True).start()
         self.setup_logger()
         self.load_tushare_config(tushare_config_path)
         self.load_deepseek_config(tushare_config_path)
@@ -263,11 +1211,10 @@ class ValueInvestmentAgent:
         """加载Tushare配置"""
         tokens = []
         
-        # 尝试从JSON配置文件加载
+        # 尝试从JSON配置文件加载（按mtime缓存，两处load_*_config共享一次IO）
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                tokens = config.get('tushare_tokens', [])
+            config = _read_json_config(config_path)
+            tokens = config.get('tushare_tokens', [])
         except FileNotFoundError:
             logger.debug(f"未找到JSON配置文件{config_path}")
         except Exception as e:
@@ -296,14 +1243,17 @@ class ValueInvestmentAgent:
         deepseek_key = None
         api_url = "https://api.deepseek.com"  # 默认URL
         model_name = "deepseek-ai/DeepSeek-R1"  # 默认模型名称
-        
-        # 尝试从JSON配置文件加载
+        rpm = 60  # 默认限速：每分钟请求数
+        max_concurrent = 8  # 默认在途并发上限
+
+        # 尝试从JSON配置文件加载（与load_tushare_config共享mtime缓存）
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                deepseek_key = config.get('deepseek_api_key')
-                api_url = config.get('api_url', api_url)
-                model_name = config.get('model_name', model_name)
+            config = _read_json_config(config_path)
+            deepseek_key = config.get('deepseek_api_key')
+            api_url = config.get('api_url', api_url)
+            model_name = config.get('model_name', model_name)
+            rpm = config.get('deepseek_rpm', rpm)
+            max_concurrent = config.get('deepseek_max_concurrent', max_concurrent)
         except FileNotFoundError:
             logger.debug(f"未找到JSON配置文件{config_path}")
         except Exception as e:
@@ -324,7 +1274,8 @@ class ValueInvestmentAgent:
                 logger.warning(f"从config.py加载配置失败: {e}")
         
         if deepseek_key:
-            self.deepseek_analyzer = DeepSeekAnalyzer(api_key=deepseek_key, base_url=api_url, model=model_name)
+            self.deepseek_analyzer = DeepSeekAnalyzer(api_key=deepseek_key, base_url=api_url, model=model_name,
+                                                      rpm=rpm, max_concurrent=max_concurrent)
             logger.info(f"已加载DeepSeek API配置 (URL: {api_url}, Model: {model_name})")
         else:
             logger.warning("未配置DeepSeek API key，将跳过AI分析")
@@ -348,10 +1299,44 @@ class ValueInvestmentAgent:
         """获取实时PE数据"""
         if not self.tushare_manager:
             return None
-            
+
         ts_code = self.normalize_stock_code(stock_code)
         return self.tushare_manager.get_realtime_pe(ts_code)
-    
+
+    def _db_conn(self) -> sqlite3.Connection:
+        """惰性打开并复用每线程查询连接（PRAGMA与索引只在建连时处理一次）
+
+        连接经threading.local按线程隔离：WAL下多读者互不阻塞，
+        线程池并发查询不再在同一个sqlite3连接上串行排队
+        """
+        conn = getattr(self._tls, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.executescript('''
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            ''')
+            with self._conns_lock:
+                # 按(代码,指标)取最近年份是全部热查询的形状，覆盖索引
+                # 幂等创建；加锁防止多线程同时真正建索引时争写锁
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_fm_code_metric
+                    ON financial_metrics (stock_code, metric_name, year DESC)
+                ''')
+                self._conns.append(conn)
+            self._tls.conn = conn
+        return conn
+
+    def __del__(self):
+        for conn in getattr(self, '_conns', []):
+            try:
+                conn.close()
+            except Exception:
+                pass
+
     def _should_skip_stock(self, stock_code: str, stock_name: str) -> Tuple[bool, str]:
         """
         判断是否应该跳过此股票
@@ -371,109 +1356,312 @@ class ValueInvestmentAgent:
         if stock_code.endswith('.BJ'):  # 北交所
             return True, "北交所股票流动性较低"
         
-        # 3. 检查连续亏损
-        conn = sqlite3.connect(self.db_path)
+        # 3-5. 三项基本面检查合并为一条SQL：复用连接取回所需行后
+        # 在Python里按指标分桶，免去每股三次查询+DataFrame装箱
         try:
-            # 获取最近3年的净利润数据
-            query = """
-            SELECT year, metric_value 
-            FROM financial_metrics 
-            WHERE stock_code = ? AND metric_name = 'net_profit'
-            ORDER BY year DESC
-            LIMIT 3
-            """
-            df = pd.read_sql_query(query, conn, params=[stock_code])
-            
-            if len(df) >= 3:
-                # 检查是否连续3年亏损
-                recent_profits = df['metric_value'].tolist()
-                if all(profit <= 0 for profit in recent_profits if pd.notna(profit)):
+            rows = self._db_conn().execute("""
+                SELECT metric_name, metric_value
+                FROM financial_metrics
+                WHERE stock_code = ?
+                  AND metric_name IN ('net_profit', 'roe', 'pe', 'pb')
+                ORDER BY year DESC
+            """, (stock_code,)).fetchall()
+
+            by_metric = {}
+            for metric_name, value in rows:
+                by_metric.setdefault(metric_name, []).append(value)
+
+            # 检查连续亏损（最近3年）
+            recent_profits = by_metric.get('net_profit', [])[:3]
+            if len(recent_profits) >= 3:
+                if all(profit <= 0 for profit in recent_profits if profit is not None):
                     return True, "连续3年亏损"
-            
-            # 4. 检查是否有基本财务数据
-            basic_metrics_query = """
-            SELECT COUNT(DISTINCT metric_name) as metric_count
-            FROM financial_metrics 
-            WHERE stock_code = ? AND metric_name IN ('roe', 'pe', 'pb')
-            """
-            metric_count_df = pd.read_sql_query(basic_metrics_query, conn, params=[stock_code])
-            
-            if metric_count_df.iloc[0]['metric_count'] < 2:  # 至少要有2个基本指标
+
+            # 检查是否有基本财务数据（至少要有2个基本指标）
+            if sum(1 for m in ('roe', 'pe', 'pb') if m in by_metric) < 2:
                 return True, "缺乏基本财务数据"
-            
-            # 5. 检查ROE数据质量
-            roe_query = """
-            SELECT metric_value 
-            FROM financial_metrics 
-            WHERE stock_code = ? AND metric_name = 'roe'
-            ORDER BY year DESC
-            LIMIT 3
-            """
-            roe_df = pd.read_sql_query(roe_query, conn, params=[stock_code])
-            
-            if len(roe_df) >= 2:
-                # 如果最近2年ROE都是负数，跳过
-                recent_roe = roe_df['metric_value'].tolist()
-                valid_roe = [roe for roe in recent_roe if pd.notna(roe)]
+
+            # 检查ROE数据质量：最近2年ROE都是负数则跳过
+            recent_roe = by_metric.get('roe', [])[:3]
+            if len(recent_roe) >= 2:
+                valid_roe = [roe for roe in recent_roe if roe is not None]
                 if len(valid_roe) >= 2 and all(roe < 0 for roe in valid_roe):
                     return True, "近年ROE持续为负"
-            
+
             return False, ""
-            
+
         except Exception as e:
             logger.warning(f"筛选股票{stock_code}时出错: {e}")
             return False, ""
-        finally:
-            conn.close()
-    
+
+    def build_skip_mask(self, stocks_df: pd.DataFrame) -> pd.Series:
+        """
+        整表向量化的名称/交易所过滤掩码
+
+        逐股的'ST' in name / endswith('.BJ')是N次Python层判断；
+        Series.str在pandas内部一次C循环完成全表匹配。
+
+        Args:
+            stocks_df: 含stock_code/stock_name两列的DataFrame
+
+        Returns:
+            布尔掩码Series，True表示应跳过
+        """
+        names = stocks_df['stock_name'].fillna('')
+        return (names.str.contains('ST|PT', regex=True, na=False)
+                | stocks_df['stock_code'].str.endswith('.BJ'))
+
+    def screen_all(self, codes: List[str], names: Dict[str, str] = None) -> Dict[str, Tuple[bool, str]]:
+        """
+        批量基本筛选：一条SQL代替逐股查询
+
+        逐股调用_should_skip_stock是N次小查询的往返开销；这里把待查代码
+        写入临时表后JOIN一次取回全部所需指标，再用分组聚合一次性算出
+        "连续3年亏损"、"缺乏基本财务数据"、"近年ROE持续为负"三项判定。
+
+        Args:
+            codes: 股票代码列表
+            names: 股票代码到名称的映射（用于ST/PT判定）
+
+        Returns:
+            {股票代码: (是否跳过, 跳过原因)}
+        """
+        names = names or {}
+        decisions: Dict[str, Tuple[bool, str]] = {}
+
+        # 名称/交易所规则整列向量化，先行过滤（基本面检查只跑幸存者）
+        stocks_df = pd.DataFrame({
+            'stock_code': codes,
+            'stock_name': [names.get(code, '') for code in codes],
+        })
+        skip_mask = self.build_skip_mask(stocks_df)
+        st_mask = stocks_df['stock_name'].str.contains('ST|PT', regex=True, na=False)
+
+        db_codes = []
+        for code, skip, is_st in zip(codes, skip_mask.values, st_mask.values):
+            if skip:
+                decisions[code] = (True, "ST股票风险过高" if is_st else "北交所股票流动性较低")
+            else:
+                db_codes.append(code)
+
+        if not db_codes:
+            return decisions
+
+        try:
+            conn = self._db_conn()
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS t_codes(code TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM t_codes")
+            conn.executemany("INSERT OR IGNORE INTO t_codes(code) VALUES (?)",
+                             [(code,) for code in db_codes])
+
+            df = pd.read_sql_query("""
+                SELECT fm.stock_code, fm.metric_name, fm.year, fm.metric_value
+                FROM financial_metrics fm
+                JOIN t_codes t ON fm.stock_code = t.code
+                WHERE fm.metric_name IN ('net_profit', 'roe', 'pe', 'pb')
+            """, conn)
+            conn.execute("DELETE FROM t_codes")
+
+            # 每(股票,指标)只留最近3年，后续聚合都基于这份切片
+            recent = (df.sort_values('year', ascending=False)
+                        .groupby(['stock_code', 'metric_name'], sort=False)
+                        .head(3))
+
+            # 连续3年亏损：有3条净利润记录且非空值全部<=0
+            profits = recent[recent['metric_name'] == 'net_profit']
+            p_stats = profits.groupby('stock_code')['metric_value'].agg(['size', 'max'])
+            loss_codes = set(p_stats[(p_stats['size'] >= 3) &
+                                     (p_stats['max'].isna() | (p_stats['max'] <= 0))].index)
+
+            # 基本指标覆盖数：roe/pe/pb至少要有2个
+            present = (df[df['metric_name'].isin(('roe', 'pe', 'pb'))]
+                       .groupby('stock_code')['metric_name'].nunique())
+            sparse_codes = {code for code in db_codes if present.get(code, 0) < 2}
+
+            # ROE质量：最近记录>=2条且非空值>=2个并全为负
+            roe = recent[recent['metric_name'] == 'roe']
+            r_stats = roe.groupby('stock_code')['metric_value'].agg(['size', 'count', 'max'])
+            bad_roe_codes = set(r_stats[(r_stats['size'] >= 2) &
+                                        (r_stats['count'] >= 2) &
+                                        (r_stats['max'] < 0)].index)
+
+            # 与逐股路径保持相同的判定优先级
+            for code in db_codes:
+                if code in loss_codes:
+                    decisions[code] = (True, "连续3年亏损")
+                elif code in sparse_codes:
+                    decisions[code] = (True, "缺乏基本财务数据")
+                elif code in bad_roe_codes:
+                    decisions[code] = (True, "近年ROE持续为负")
+                else:
+                    decisions[code] = (False, "")
+
+        except Exception as e:
+            logger.warning(f"批量筛选出错，回退为不跳过: {e}")
+            for code in db_codes:
+                decisions.setdefault(code, (False, ""))
+
+        return decisions
+
+    def preload_metrics(self, codes: List[str] = None, min_year: int = None) -> pd.DataFrame:
+        """
+        一次性加载财务指标长表并透视成宽表缓存
+
+        逐股调用get_stock_metrics是N次SQL+N次iterrows重建字典；这里单条
+        查询取回目标股票池的全部指标行，pivot_table在C层完成长转宽，
+        之后get_stock_metrics直接从缓存切片，不再触库。
+
+        Args:
+            codes: 限定的股票代码列表，None表示全表
+            min_year: 只加载该年份及之后的数据，None表示不限
+
+        Returns:
+            以(stock_code, year)为索引、指标名为列的宽表
+        """
+        conn = self._db_conn()
+        join = ""
+        if codes is not None:
+            codes = [self.normalize_stock_code(code) for code in codes]
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS t_codes(code TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM t_codes")
+            conn.executemany("INSERT OR IGNORE INTO t_codes(code) VALUES (?)",
+                             [(code,) for code in codes])
+            join = "JOIN t_codes t ON fm.stock_code = t.code"
+
+        year_clause = "" if min_year is None else f"WHERE fm.year >= {int(min_year)}"
+        df = pd.read_sql_query(f"""
+            SELECT fm.stock_code, fm.year, fm.metric_name, fm.metric_value
+            FROM financial_metrics fm
+            {join}
+            {year_clause}
+        """, conn)
+        basic = pd.read_sql_query(f"""
+            SELECT s.* FROM stocks s
+            {join.replace('fm.', 's.')}
+        """, conn)
+        if codes is not None:
+            conn.execute("DELETE FROM t_codes")
+
+        self._metrics_wide = df.pivot_table(
+            index=['stock_code', 'year'], columns='metric_name', values='metric_value')
+        self._basic_cache = basic.set_index('stock_code', drop=False).to_dict('index')
+        self._preloaded_codes = None if codes is None else set(codes)
+        # 数据已刷新，作废逐股查询缓存
+        with self._metrics_cache_lock:
+            self._metrics_cache.clear()
+
+        # 顺带物化SoA矩阵：行按METRIC_INDEX、列按年份升序，float32足够
+        # 展示/比较精度且带宽减半；打分路径从dict过滤变为nan切片归约
+        self._metric_matrix = {}
+        wide = self._metrics_wide.reindex(columns=list(self._SCORE_METRICS))
+        mat = wide.to_numpy(dtype=np.float32)
+        code_index = wide.index.get_level_values(0).to_numpy()
+        if len(code_index):
+            boundaries = np.flatnonzero(code_index[1:] != code_index[:-1]) + 1
+            for code_block, rows in zip(np.split(code_index, boundaries),
+                                        np.split(mat, boundaries)):
+                self._metric_matrix[code_block[0]] = rows.T
+        logger.info(f"已预加载 {len(self._basic_cache)} 只股票的财务指标缓存")
+        return self._metrics_wide
+
+    def _stocks_map(self) -> Dict[str, Dict]:
+        """惰性一次读入整张stocks表，之后basic_info查询只是字典取值"""
+        if self._stocks is None:
+            cur = self._db_conn().execute("SELECT * FROM stocks")
+            columns = [col[0] for col in cur.description]
+            code_idx = columns.index('stock_code')
+            self._stocks = {row[code_idx]: dict(zip(columns, row))
+                            for row in cur.fetchall()}
+        return self._stocks
+
+    def _metrics_from_cache(self, normalized_code: str) -> Dict:
+        """从预加载的宽表缓存切出单股的{metric: {year: value}}结构"""
+        basic_info = self._basic_cache.get(normalized_code)
+        if basic_info is None:
+            return {}
+
+        try:
+            sub = self._metrics_wide.xs(normalized_code)
+        except KeyError:
+            return {}
+
+        metrics = {}
+        for metric, by_year in sub.to_dict().items():
+            # 与SQL回退路径同口径：只保留真实有数的年份，
+            # data[max(keys)]取到的才是最新有数年份而非NaN
+            values = {int(year): value for year, value in by_year.items()
+                      if pd.notna(value)}
+            if values:
+                metrics[metric] = values
+
+        if not metrics:
+            return {}
+
+        return {'basic_info': dict(basic_info), 'metrics': metrics}
+
     def get_stock_metrics(self, stock_code: str, years: List[int] = None) -> Dict:
         """获取单个股票的财务指标"""
         if years is None:
             years = [2020, 2021, 2022, 2023, 2024]
-        
+
         # 标准化股票代码
         normalized_code = self.normalize_stock_code(stock_code)
-        
-        conn = sqlite3.connect(self.db_path)
-        
-        # 获取基本信息
-        basic_info = pd.read_sql_query(
-            "SELECT * FROM stocks WHERE stock_code = ?", 
-            conn, params=[normalized_code]
-        )
-        
-        if basic_info.empty:
-            conn.close()
+
+        # 逐股缓存命中：同一股票流水线内多次取数只做一次SQL/宽表切片
+        # （返回副本，调用方写入current PE不会污染缓存）
+        with self._metrics_cache_lock:
+            cached = self._metrics_cache.get(normalized_code)
+        if cached is not None:
+            return self._copy_stock_data(cached)
+
+        # 宽表缓存命中则零SQL返回（None表示预加载覆盖了全表），
+        # 切片结果同样记入逐股缓存，后续取数只剩字典复制
+        if self._metrics_wide is not None and (
+                self._preloaded_codes is None or normalized_code in self._preloaded_codes):
+            result = self._metrics_from_cache(normalized_code)
+            if result:
+                with self._metrics_cache_lock:
+                    self._metrics_cache[normalized_code] = result
+                return self._copy_stock_data(result)
+            return result
+
+        # 基本信息从整表映射取：全市场跑批不再发N次单行SELECT
+        basic_info = self._stocks_map().get(normalized_code)
+
+        if basic_info is None:
             return {}
-        
+
         # 获取财务指标
-        metrics_data = pd.read_sql_query(
+        metric_rows = self._db_conn().execute(
             "SELECT year, metric_name, metric_value FROM financial_metrics WHERE stock_code = ?",
-            conn, params=[normalized_code]
-        )
-        
-        conn.close()
-        
-        if metrics_data.empty:
+            (normalized_code,)
+        ).fetchall()
+
+        if not metric_rows:
             return {}
-        
+
         # 重构数据格式
         result = {
-            'basic_info': basic_info.iloc[0].to_dict(),
+            'basic_info': dict(basic_info),
             'metrics': {}
         }
-        
-        for _, row in metrics_data.iterrows():
-            year = int(row['year'])
-            metric = row['metric_name']
-            value = row['metric_value']
-            
-            if metric not in result['metrics']:
-                result['metrics'][metric] = {}
-            result['metrics'][metric][year] = value
-            
-        return result
-    
+
+        for year, metric, value in metric_rows:
+            result['metrics'].setdefault(metric, {})[int(year)] = value
+
+        with self._metrics_cache_lock:
+            self._metrics_cache[normalized_code] = result
+
+        return self._copy_stock_data(result)
+
+    @staticmethod
+    def _copy_stock_data(data: Dict) -> Dict:
+        """浅两层复制股票数据，隔离缓存与调用方的就地修改"""
+        return {
+            'basic_info': dict(data['basic_info']),
+            'metrics': {metric: dict(years) for metric, years in data['metrics'].items()}
+        }
+
     def buffett_criteria(self, stock_data: Dict, include_pe_evaluation: bool = False, realtime_pe: Optional[float] = None) -> Dict:
         """
         巴菲特选股标准
@@ -487,88 +1675,147 @@ class ValueInvestmentAgent:
             include_pe_evaluation: 是否包含PE评估
             realtime_pe: 实时PE数据（优先使用）
         """
+        return self._score_buffett(self._gather_intermediates(stock_data, realtime_pe),
+                                   include_pe_evaluation)
+
+    def _gather_intermediates(self, stock_data: Dict, realtime_pe: Optional[float]) -> Dict:
+        """
+        一次扫描metrics，产出三套大师标准共享的全部中间量
+
+        三个criteria各自重复抽取roe/pe/current_ratio等并重算均值是
+        同样的计算跑三遍；这里把均值/标准差/趋势/最新值集中算一次，
+        _score_*只做纯标量比较。
+        """
+        metrics = stock_data.get('metrics', {})
+        code = stock_data.get('basic_info', {}).get('stock_code')
+        arr = self._metric_matrix.get(code) if self._metric_matrix else None
+
+        if arr is not None:
+            # SoA快路径：行切片+布尔掩码都是C层操作，零Python过滤
+            def valid(metric: str, positive: bool = False) -> np.ndarray:
+                row = arr[self.METRIC_INDEX[metric]]
+                mask = ~np.isnan(row)
+                if positive:
+                    mask &= row > 0
+                return row[mask]
+
+            def latest(metric: str):
+                # 向前找最近有数的年份，与字典路径data[max(keys)]口径一致
+                row = arr[self.METRIC_INDEX[metric]]
+                idx = np.flatnonzero(~np.isnan(row))
+                return float(row[idx[-1]]) if len(idx) else None
+        else:
+            def valid(metric: str, positive: bool = False) -> np.ndarray:
+                data = metrics.get(metric, {})
+                if positive:
+                    it = (v for v in data.values() if v is not None and v > 0)
+                else:
+                    it = (v for v in data.values() if v is not None)
+                # fromiter边迭代边写numpy缓冲，不经过中间Python列表
+                return np.fromiter(it, dtype=np.float64)
+
+            def latest(metric: str):
+                data = metrics.get(metric, {})
+                return data[max(data.keys())] if data else None
+
+        # PE解析三套标准完全一致：实时优先，退回最新历史
+        current_pe = realtime_pe
+        pe_source = "实时"
+        if current_pe is None:
+            current_pe = latest('pe') if arr is not None else (
+                metrics['pe'][max(metrics['pe'].keys())] if metrics.get('pe') else None)
+            if current_pe is not None:
+                pe_source = "历史"
+
+        roe_values = valid('roe', positive=True)
+        debt_values = valid('debt_ratio')
+        margin_values = valid('net_margin')
+        positive_margins = margin_values[margin_values > 0]
+        cr_values = valid('current_ratio')
+        at_values = valid('asset_turnover', positive=True)
+        gm_values = valid('gross_margin', positive=True)
+        ta_values = valid('total_assets', positive=True)
+
+        return {
+            'industry': stock_data.get('basic_info', {}).get('industry', ''),
+            'current_pe': current_pe,
+            'pe_source': pe_source,
+            'roe_n': len(roe_values),
+            'avg_roe': np.mean(roe_values) if len(roe_values) else None,
+            'roe_std': np.std(roe_values) if len(roe_values) else None,
+            'debt_n': len(debt_values),
+            'avg_debt': np.mean(debt_values) / 100.0 if len(debt_values) else None,
+            'margin_n': len(margin_values),
+            'margin_pos_n': len(positive_margins),
+            'avg_margin': np.mean(positive_margins) if len(positive_margins) else None,
+            'cr_n': len(cr_values),
+            'avg_cr': np.mean(cr_values) if len(cr_values) else None,
+            'at_n': len(at_values),
+            'avg_at': np.mean(at_values) if len(at_values) else None,
+            'gm_n': len(gm_values),
+            'avg_gm': np.mean(gm_values) if len(gm_values) else None,
+            'gm_trend': self._calculate_trend(gm_values) if len(gm_values) else 0,
+            'ta_n': len(ta_values),
+            'asset_growth': self._calculate_growth_rate(ta_values) if len(ta_values) >= 2 else 0,
+            'latest_pb': latest('pb'),
+            'latest_div': latest('dividend'),
+        }
+
+    def _score_buffett(self, shared: Dict, include_pe_evaluation: bool) -> Dict:
+        """基于共享中间量的巴菲特标准打分（纯标量比较）"""
         score = 0
         details = []
-        
-        metrics = stock_data.get('metrics', {})
-        
+
         # 1. ROE分析 - 巴菲特最看重的指标
-        roe_data = metrics.get('roe', {})
-        if roe_data:
-            roe_values = [v for v in roe_data.values() if v is not None and v > 0]
-            if len(roe_values) >= 3:
-                avg_roe = np.mean(roe_values)  # 保持百分比形式用于显示
-                # 转换为小数进行比较
-                avg_roe_decimal = avg_roe / 100.0
-                if avg_roe_decimal > 0.20:
-                    score += 25
-                    details.append(f"🌟 卓越ROE: {avg_roe:.1f}% (>20%)")
-                elif avg_roe_decimal > 0.15:
-                    score += 15
-                    details.append(f"✅ 优秀ROE: {avg_roe:.1f}% (>15%)")
-                elif avg_roe_decimal > 0.10:
-                    score += 5
-                    details.append(f"📊 一般ROE: {avg_roe:.1f}% (>10%)")
-                
-                # ROE稳定性
-                roe_std = np.std(roe_values)
-                if roe_std < 5:
-                    score += 10
-                    details.append(f"🎯 ROE稳定性良好 (标准差: {roe_std:.1f})")
-        
+        if shared['roe_n'] >= 3:
+            avg_roe = shared['avg_roe']  # 保持百分比形式用于显示
+            avg_roe_decimal = avg_roe / 100.0
+            if avg_roe_decimal > 0.20:
+                score += 25
+                details.append(f"🌟 卓越ROE: {avg_roe:.1f}% (>20%)")
+            elif avg_roe_decimal > 0.15:
+                score += 15
+                details.append(f"✅ 优秀ROE: {avg_roe:.1f}% (>15%)")
+            elif avg_roe_decimal > 0.10:
+                score += 5
+                details.append(f"📊 一般ROE: {avg_roe:.1f}% (>10%)")
+
+            # ROE稳定性
+            if shared['roe_std'] < 5:
+                score += 10
+                details.append(f"🎯 ROE稳定性良好 (标准差: {shared['roe_std']:.1f})")
+
         # 2. 债务比率分析
-        debt_data = metrics.get('debt_ratio', {})
-        if debt_data:
-            debt_values = [v for v in debt_data.values() if v is not None]
-            if debt_values:
-                avg_debt = np.mean(debt_values) / 100.0
-                if avg_debt < 0.2:
-                    score += 20
-                    details.append(f"💪 低债务负担: {avg_debt:.1%} (<20%)")
-                elif avg_debt < 0.3:
-                    score += 10
-                    details.append(f"✅ 适度债务: {avg_debt:.1%} (<30%)")
-                elif avg_debt > 0.6:
-                    score -= 10
-                    details.append(f"⚠️ 高债务风险: {avg_debt:.1%} (>60%)")
-        
+        if shared['debt_n'] > 0:
+            avg_debt = shared['avg_debt']
+            if avg_debt < 0.2:
+                score += 20
+                details.append(f"💪 低债务负担: {avg_debt:.1%} (<20%)")
+            elif avg_debt < 0.3:
+                score += 10
+                details.append(f"✅ 适度债务: {avg_debt:.1%} (<30%)")
+            elif avg_debt > 0.6:
+                score -= 10
+                details.append(f"⚠️ 高债务风险: {avg_debt:.1%} (>60%)")
+
         # 3. 盈利稳定性（净利率）
-        net_margin_data = metrics.get('net_margin', {})
-        if net_margin_data:
-            margin_values = [v for v in net_margin_data.values() if v is not None]
-            positive_margins = [v for v in margin_values if v > 0]
-            
-            if len(positive_margins) == len(margin_values) and len(margin_values) >= 3:
-                score += 15
-                avg_margin = np.mean(positive_margins)
-                details.append(f"📈 持续盈利: 净利率 {avg_margin:.1f}%")
-        
+        if shared['margin_n'] >= 3 and shared['margin_pos_n'] == shared['margin_n']:
+            score += 15
+            details.append(f"📈 持续盈利: 净利率 {shared['avg_margin']:.1f}%")
+
         # 4. 流动性分析
-        current_ratio_data = metrics.get('current_ratio', {})
-        if current_ratio_data:
-            cr_values = [v for v in current_ratio_data.values() if v is not None]
-            if cr_values:
-                avg_cr = np.mean(cr_values)
-                if avg_cr > 2:
-                    score += 10
-                    details.append(f"💰 流动性充裕: {avg_cr:.1f}")
-                elif avg_cr > 1.5:
-                    score += 5
-                    details.append(f"✅ 流动性良好: {avg_cr:.1f}")
-        
+        if shared['cr_n'] > 0:
+            avg_cr = shared['avg_cr']
+            if avg_cr > 2:
+                score += 10
+                details.append(f"💰 流动性充裕: {avg_cr:.1f}")
+            elif avg_cr > 1.5:
+                score += 5
+                details.append(f"✅ 流动性良好: {avg_cr:.1f}")
+
         # 5. PE估值分析（可选）
         if include_pe_evaluation:
-            current_pe = realtime_pe
-            pe_source = "实时"
-            
-            # 如果没有实时PE，使用历史PE
-            if current_pe is None:
-                pe_data = metrics.get('pe', {})
-                if pe_data:
-                    latest_year = max(pe_data.keys())
-                    current_pe = pe_data[latest_year]
-                    pe_source = "历史"
-            
+            current_pe, pe_source = shared['current_pe'], shared['pe_source']
             if current_pe is not None and 0 < current_pe < 100:
                 if current_pe < 15:
                     score += 25
@@ -582,13 +1829,13 @@ class ValueInvestmentAgent:
                 elif current_pe > 50:
                     score -= 10
                     details.append(f"⚠️ 估值偏高: PE {current_pe:.1f}x (>50, {pe_source})")
-        
+
         return {
             'score': min(score, 100),
             'details': details,
             'methodology': '巴菲特标准：护城河、持续盈利、低债务' + ('、合理估值' if include_pe_evaluation else '')
         }
-    
+
     def munger_criteria(self, stock_data: Dict, include_pe_evaluation: bool = False, realtime_pe: Optional[float] = None) -> Dict:
         """
         芒格选股标准
@@ -601,71 +1848,48 @@ class ValueInvestmentAgent:
             include_pe_evaluation: 是否包含PE评估
             realtime_pe: 实时PE数据（优先使用）
         """
+        return self._score_munger(self._gather_intermediates(stock_data, realtime_pe),
+                                  include_pe_evaluation)
+
+    def _score_munger(self, shared: Dict, include_pe_evaluation: bool) -> Dict:
+        """基于共享中间量的芒格标准打分（纯标量比较）"""
         score = 0
         details = []
-        
-        metrics = stock_data.get('metrics', {})
-        industry = stock_data.get('basic_info', {}).get('industry', '')
-        
-        # 1. 行业质量评估（芒格偏好的行业）
-        quality_industries = [
-            '银行', '保险', '食品饮料', '白酒', '医药生物', '公用事业',
-            '消费服务', '商业贸易', '家用电器', '餐饮', '乳制品', 
-            '调味品', '软饮料', '酿酒', '中药', '生物制药', '医疗器械',
-            '电力', '燃气', '水务', '机场', '高速公路', '港口'
-        ]
-        
-        if any(keyword in industry for keyword in quality_industries):
+
+        # 1. 行业质量评估（芒格偏好的行业，预编译正则单次匹配）
+        industry = shared['industry']
+        if industry and _QUALITY_RE.search(industry):
             score += 15
             details.append(f"🎯 优质行业: {industry}")
-        
+
         # 2. 资产周转率（经营效率）
-        asset_turnover_data = metrics.get('asset_turnover', {})
-        if asset_turnover_data:
-            at_values = [v for v in asset_turnover_data.values() if v is not None and v > 0]
-            if at_values:
-                avg_turnover = np.mean(at_values)
-                if avg_turnover > 0.8:
-                    score += 15
-                    details.append(f"⚡ 高效运营: 资产周转率 {avg_turnover:.2f}")
-                elif avg_turnover > 0.5:
-                    score += 10
-                    details.append(f"✅ 运营良好: 资产周转率 {avg_turnover:.2f}")
-        
+        if shared['at_n'] > 0:
+            avg_turnover = shared['avg_at']
+            if avg_turnover > 0.8:
+                score += 15
+                details.append(f"⚡ 高效运营: 资产周转率 {avg_turnover:.2f}")
+            elif avg_turnover > 0.5:
+                score += 10
+                details.append(f"✅ 运营良好: 资产周转率 {avg_turnover:.2f}")
+
         # 3. 毛利率稳定性（产品定价权）
-        gross_margin_data = metrics.get('gross_margin', {})
-        if gross_margin_data:
-            gm_values = [v for v in gross_margin_data.values() if v is not None and v > 0]
-            if len(gm_values) >= 3:
-                avg_gm = np.mean(gm_values)  # 保持百分比形式用于显示
-                gm_trend = self._calculate_trend(gm_values)
-                
-                # 转换为小数进行比较
-                avg_gm_decimal = avg_gm / 100.0
-                if avg_gm_decimal > 0.40:
-                    score += 20
-                    details.append(f"💎 高毛利率: {avg_gm:.1f}% (强定价权)")
-                elif avg_gm_decimal > 0.25:
-                    score += 10
-                    details.append(f"✅ 良好毛利率: {avg_gm:.1f}%")
-                
-                if gm_trend > 0:
-                    score += 10
-                    details.append("📈 毛利率呈上升趋势")
-        
+        if shared['gm_n'] >= 3:
+            avg_gm = shared['avg_gm']  # 保持百分比形式用于显示
+            avg_gm_decimal = avg_gm / 100.0
+            if avg_gm_decimal > 0.40:
+                score += 20
+                details.append(f"💎 高毛利率: {avg_gm:.1f}% (强定价权)")
+            elif avg_gm_decimal > 0.25:
+                score += 10
+                details.append(f"✅ 良好毛利率: {avg_gm:.1f}%")
+
+            if shared['gm_trend'] > 0:
+                score += 10
+                details.append("📈 毛利率呈上升趋势")
+
         # 4. 反向思维：避开高估值陷阱（可选）
         if include_pe_evaluation:
-            current_pe = realtime_pe
-            pe_source = "实时"
-            
-            # 如果没有实时PE，使用历史PE
-            if current_pe is None:
-                pe_data = metrics.get('pe', {})
-                if pe_data:
-                    latest_year = max(pe_data.keys())
-                    current_pe = pe_data[latest_year]
-                    pe_source = "历史"
-            
+            current_pe, pe_source = shared['current_pe'], shared['pe_source']
             if current_pe is not None and 0 < current_pe < 100:
                 if current_pe < 20:
                     score += 15
@@ -676,13 +1900,13 @@ class ValueInvestmentAgent:
                 elif current_pe > 60:
                     score -= 10
                     details.append(f"⚠️ 估值偏高: PE {current_pe:.1f}x (>60, {pe_source})")
-        
+
         return {
             'score': min(score, 100),
             'details': details,
             'methodology': '芒格标准：质量优先、理性分析、长期视角' + ('、反向思维' if include_pe_evaluation else '')
         }
-    
+
     def graham_criteria(self, stock_data: Dict, include_pe_evaluation: bool = True, realtime_pe: Optional[float] = None) -> Dict:
         """
         格雷厄姆选股标准
@@ -695,24 +1919,17 @@ class ValueInvestmentAgent:
             include_pe_evaluation: 是否包含PE评估（格雷厄姆默认包含）
             realtime_pe: 实时PE数据（优先使用）
         """
+        return self._score_graham(self._gather_intermediates(stock_data, realtime_pe),
+                                  include_pe_evaluation)
+
+    def _score_graham(self, shared: Dict, include_pe_evaluation: bool) -> Dict:
+        """基于共享中间量的格雷厄姆标准打分（纯标量比较）"""
         score = 0
         details = []
-        
-        metrics = stock_data.get('metrics', {})
-        
+
         # 1. PE比率（格雷厄姆经典指标）
         if include_pe_evaluation:
-            current_pe = realtime_pe
-            pe_source = "实时"
-            
-            # 如果没有实时PE，使用历史PE
-            if current_pe is None:
-                pe_data = metrics.get('pe', {})
-                if pe_data:
-                    latest_year = max(pe_data.keys())
-                    current_pe = pe_data[latest_year]
-                    pe_source = "历史"
-            
+            current_pe, pe_source = shared['current_pe'], shared['pe_source']
             if current_pe is not None and 0 < current_pe < 100:
                 if current_pe < 12:
                     score += 25
@@ -726,180 +1943,519 @@ class ValueInvestmentAgent:
                 elif current_pe > 40:
                     score -= 5
                     details.append(f"⚠️ 估值偏高: PE {current_pe:.1f}x (>40, {pe_source})")
-        
-        # 2. PB比率（资产价值）
-        pb_data = metrics.get('pb', {})
-        if pb_data:
-            # 使用最新年份的PB数据
-            latest_year = max(pb_data.keys())
-            current_pb = pb_data[latest_year]
-            
-            if current_pb is not None and current_pb > 0:
-                if current_pb < 1:
-                    score += 20
-                    details.append(f"💎 破净股: PB {current_pb:.2f}x (<1)")
-                elif current_pb < 2:
-                    score += 10
-                    details.append(f"✅ 低PB: {current_pb:.2f}x (<2)")
-                elif current_pb < 3:
-                    score += 5
-                    details.append(f"📊 合理PB: {current_pb:.2f}x (<3)")
-        
-        # 3. 股息率（价值回报）
-        dividend_data = metrics.get('dividend', {})
-        if dividend_data:
-            # 使用最新年份的股息率数据
-            latest_year = max(dividend_data.keys())
-            current_dividend = dividend_data[latest_year]
-            
-            if current_dividend is not None and current_dividend > 0:
-                # 转换为小数进行比较
-                current_dividend_decimal = current_dividend / 100.0
-                if current_dividend_decimal > 0.04:
-                    score += 15
-                    details.append(f"💰 高股息: {current_dividend:.1f}% (>4%)")
-                elif current_dividend_decimal > 0.02:
-                    score += 10
-                    details.append(f"✅ 良好股息: {current_dividend:.1f}% (>2%)")
-        
+
+        # 2. PB比率（资产价值，取最新年份）
+        current_pb = shared['latest_pb']
+        if current_pb is not None and current_pb > 0:
+            if current_pb < 1:
+                score += 20
+                details.append(f"💎 破净股: PB {current_pb:.2f}x (<1)")
+            elif current_pb < 2:
+                score += 10
+                details.append(f"✅ 低PB: {current_pb:.2f}x (<2)")
+            elif current_pb < 3:
+                score += 5
+                details.append(f"📊 合理PB: {current_pb:.2f}x (<3)")
+
+        # 3. 股息率（价值回报，取最新年份）
+        current_dividend = shared['latest_div']
+        if current_dividend is not None and current_dividend > 0:
+            # 转换为小数进行比较
+            current_dividend_decimal = current_dividend / 100.0
+            if current_dividend_decimal > 0.04:
+                score += 15
+                details.append(f"💰 高股息: {current_dividend:.1f}% (>4%)")
+            elif current_dividend_decimal > 0.02:
+                score += 10
+                details.append(f"✅ 良好股息: {current_dividend:.1f}% (>2%)")
+
         # 4. 流动比率（安全边际）
-        current_ratio_data = metrics.get('current_ratio', {})
-        if current_ratio_data:
-            cr_values = [v for v in current_ratio_data.values() if v is not None]
-            if cr_values:
-                avg_cr = np.mean(cr_values)
-                if avg_cr > 2:
-                    score += 15
-                    details.append(f"🛡️ 安全边际高: 流动比率 {avg_cr:.1f}")
-                elif avg_cr > 1.5:
-                    score += 10
-                    details.append(f"✅ 安全边际适中: 流动比率 {avg_cr:.1f}")
-        
+        if shared['cr_n'] > 0:
+            avg_cr = shared['avg_cr']
+            if avg_cr > 2:
+                score += 15
+                details.append(f"🛡️ 安全边际高: 流动比率 {avg_cr:.1f}")
+            elif avg_cr > 1.5:
+                score += 10
+                details.append(f"✅ 安全边际适中: 流动比率 {avg_cr:.1f}")
+
         # 5. 总资产增长（企业发展）
-        total_assets_data = metrics.get('total_assets', {})
-        if total_assets_data:
-            asset_values = [v for v in total_assets_data.values() if v is not None and v > 0]
-            if len(asset_values) >= 3:
-                asset_growth = self._calculate_growth_rate(asset_values)
-                if asset_growth > 0.1:
-                    score += 10
-                    details.append(f"📈 资产稳健增长: {asset_growth:.1%}")
-                elif asset_growth > 0:
-                    score += 5
-                    details.append(f"✅ 资产正增长: {asset_growth:.1%}")
-        
+        if shared['ta_n'] >= 3:
+            asset_growth = shared['asset_growth']
+            if asset_growth > 0.1:
+                score += 10
+                details.append(f"📈 资产稳健增长: {asset_growth:.1%}")
+            elif asset_growth > 0:
+                score += 5
+                details.append(f"✅ 资产正增长: {asset_growth:.1%}")
+
         return {
             'score': min(score, 100),
             'details': details,
             'methodology': '格雷厄姆标准：安全边际、价值发现、基本面分析' + ('、PE估值' if include_pe_evaluation else '')
         }
-    
-    def preliminary_screening(self, stock_code: str) -> Dict:
+
+    def score_all(self, stock_data: Dict, realtime_pe: Optional[float] = None,
+                  include_pe: bool = True) -> Dict[str, Dict]:
+        """
+        三套大师标准共享一次中间量计算的融合打分
+
+        Args:
+            stock_data: 股票数据
+            realtime_pe: 实时PE数据（优先使用）
+            include_pe: 是否包含PE评估
+
+        Returns:
+            {'buffett': ..., 'munger': ..., 'graham': ...}，各项结构与
+            对应criteria方法的返回值一致
+        """
+        shared = self._gather_intermediates(stock_data, realtime_pe)
+        return {
+            'buffett': self._score_buffett(shared, include_pe),
+            'munger': self._score_munger(shared, include_pe),
+            'graham': self._score_graham(shared, include_pe),
+        }
+
+    def score_all_batch(self, codes: List[str] = None, include_pe: bool = True) -> pd.DataFrame:
+        """
+        整池三套标准打分（需先preload_metrics建好SoA矩阵）
+
+        numba可用时把逐股打分JIT成机器码并用prange跨核并行；
+        不可用时退回逐股的融合打分路径，结果一致。
+
+        Args:
+            codes: 限定的股票代码列表，None表示全部已预加载股票
+            include_pe: 是否包含PE评估（用矩阵中的最新历史PE）
+
+        Returns:
+            以stock_code为索引、buffett/munger/graham三列得分的DataFrame
+        """
+        if codes is None:
+            codes = list(self._metric_matrix)
+        codes = [code for code in codes if code in self._metric_matrix]
+        columns = ['buffett', 'munger', 'graham']
+        if not codes:
+            return pd.DataFrame(columns=columns)
+
+        quality = np.array([
+            bool(_QUALITY_RE.search(str(self._basic_cache.get(code, {}).get('industry') or '')))
+            for code in codes])
+
+        if NUMBA_AVAILABLE:
+            # 变长年份补NaN对齐成三维数组，一次性交给并行核
+            max_years = max(self._metric_matrix[code].shape[1] for code in codes)
+            mat = np.full((len(codes), len(self._SCORE_METRICS), max_years),
+                          np.nan, dtype=np.float32)
+            n_years = np.empty(len(codes), dtype=np.int64)
+            for i, code in enumerate(codes):
+                arr = self._metric_matrix[code]
+                mat[i, :, :arr.shape[1]] = arr
+                n_years[i] = arr.shape[1]
+            out = np.empty((len(codes), 3), dtype=np.float32)
+            _nb_score_batch(mat, n_years, quality, include_pe, out)
+            return pd.DataFrame(out, index=pd.Index(codes, name='stock_code'),
+                                columns=columns)
+
+        # numba不可用：逐股走融合打分（矩阵快路径）
+        rows = []
+        for code in codes:
+            data = {'basic_info': self._basic_cache.get(code, {'stock_code': code}),
+                    'metrics': {}}
+            scores = self.score_all(data, realtime_pe=None, include_pe=include_pe)
+            rows.append((scores['buffett']['score'], scores['munger']['score'],
+                         scores['graham']['score']))
+        return pd.DataFrame(rows, index=pd.Index(codes, name='stock_code'),
+                            columns=columns)
+
+    # 批量打分涉及的指标（一次查询全部取回；行序由模块级SCORE_METRICS固定）
+    _SCORE_METRICS = SCORE_METRICS
+
+    # SoA矩阵的行索引：指标名→行号
+    METRIC_INDEX = {name: i for i, name in enumerate(SCORE_METRICS)}
+
+    # preliminary_screening的分档阈值：searchsorted选桶代替if/elif级联，
+    # 档位边界与原判断逐一对应
+    _PRE_ROE_T = np.array([0.15, 0.10, 0.05])
+    _PRE_ROE_S = np.array([15, 10, 5, 0])
+    _PRE_CF_T = np.array([4, 3, 2])
+    _PRE_CF_S = np.array([10, 7, 3, 0])
+    _PRE_GROWTH_T = np.array([0.10, 0.05, 0.0])
+    _PRE_GROWTH_S = np.array([10, 7, 3, 0])
+    _PRE_DEBT_T = np.array([0.3, 0.5])
+    _PRE_DEBT_S = np.array([5, 3, 0])
+    _PRE_CR_T = np.array([1.5, 1.0])
+    _PRE_CR_S = np.array([5, 3, 0])
+    _PRE_PE_T = np.array([10.0, 15.0, 20.0, 30.0])
+    _PRE_PE_S = np.array([15, 12, 8, 5, 0])
+
+    # _assess_potential的分档阈值（增长一致性与ROE趋势的阈值随年数
+    # 变化，仍走分支判断）
+    _POT_STD_T = np.array([2.0, 5.0, 8.0])
+    _POT_STD_S = np.array([8, 5, 2, 0])
+    _POT_CF_T = np.array([0.8, 0.6, 0.4])
+    _POT_CF_S = np.array([8, 5, 2, 0])
+    _POT_DEBT_T = np.array([0.2, 0.4])
+    _POT_DEBT_S = np.array([4, 2, 0])
+    _POT_CR_T = np.array([2.0, 1.5])
+    _POT_CR_S = np.array([3, 1, 0])
+    _POT_PE_T = np.array([12.0, 18.0, 25.0])
+    _POT_PE_S = np.array([5, 3, 1, 0])
+
+    # 投资等级查表：searchsorted落档替代逐级if/elif
+    _GRADE_BINS = np.array([50.0, 60.0, 70.0, 80.0])
+    _GRADES = ("C 暂不推荐", "B 谨慎观察", "B+ 值得关注", "A 推荐买入", "A+ 强烈推荐")
+
+    # 初筛/潜力评分用到的全部指标键（快速拒绝无数据股票时查询）
+    _PRELIM_METRIC_KEYS = ('roe', 'operating_cash_flow', 'revenue',
+                           'debt_ratio', 'current_ratio', 'pe')
+
+    @staticmethod
+    def _bucket_high(value, thresholds: np.ndarray, scores: np.ndarray,
+                     strict: bool = False) -> int:
+        """降序阈值选桶：取第一个value≥阈值（strict时>）的档位分"""
+        side = 'right' if strict else 'left'
+        return int(scores[np.searchsorted(-thresholds, -value, side=side)])
+
+    @staticmethod
+    def _bucket_low(value, thresholds: np.ndarray, scores: np.ndarray,
+                    strict: bool = True) -> int:
+        """升序阈值选桶：取第一个value<阈值（非strict时≤）的档位分"""
+        side = 'right' if strict else 'left'
+        return int(scores[np.searchsorted(thresholds, value, side=side)])
+
+    def build_score_frame(self, codes: List[str] = None) -> pd.DataFrame:
+        """
+        把financial_metrics一次性聚合成批量打分用的宽表
+
+        每只股票一行，列为各指标的预聚合统计量（均值/计数/标准差/最新值/
+        趋势斜率/复合增长率）。三个score_*_batch方法只做纯numpy比较，
+        不再逐股重建列表和小数组。
+
+        Args:
+            codes: 限定的股票代码列表，None表示全表
+
+        Returns:
+            以stock_code为索引的聚合DataFrame
+        """
+        conn = self._db_conn()
+        join = ""
+        if codes is not None:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS t_codes(code TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM t_codes")
+            conn.executemany("INSERT OR IGNORE INTO t_codes(code) VALUES (?)",
+                             [(code,) for code in codes])
+            join = "JOIN t_codes t ON fm.stock_code = t.code"
+
+        placeholders = ', '.join('?' * len(self._SCORE_METRICS))
+        df = pd.read_sql_query(f"""
+            SELECT fm.stock_code, fm.metric_name, fm.year, fm.metric_value
+            FROM financial_metrics fm
+            {join}
+            WHERE fm.metric_name IN ({placeholders})
+        """, conn, params=list(self._SCORE_METRICS))
+        industry = pd.read_sql_query(f"""
+            SELECT s.stock_code, s.industry
+            FROM stocks s
+            {join.replace('fm.', 's.')}
+        """, conn)
+        if codes is not None:
+            conn.execute("DELETE FROM t_codes")
+
+        base = df.dropna(subset=['metric_value'])
+        out = pd.DataFrame(index=pd.Index(sorted(df['stock_code'].unique()), name='stock_code'))
+
+        def grouped(metric: str, positive_only: bool = False):
+            sub = base[base['metric_name'] == metric]
+            if positive_only:
+                sub = sub[sub['metric_value'] > 0]
+            return sub, sub.groupby('stock_code')['metric_value']
+
+        def last_by_year(metric: str) -> pd.Series:
+            # 最新年份的原始值（保留NaN，与单股路径"最新年为空则不计分"一致）
+            sub = df[df['metric_name'] == metric]
+            return (sub.sort_values('year')
+                       .drop_duplicates('stock_code', keep='last')
+                       .set_index('stock_code')['metric_value'])
+
+        # ROE：正值序列的计数/均值/总体标准差（np.std口径，ddof=0）
+        roe, g = grouped('roe', positive_only=True)
+        out['roe_pos_n'] = g.size()
+        out['roe_pos_mean'] = g.mean()
+        m2 = roe.assign(sq=roe['metric_value'] ** 2).groupby('stock_code')['sq'].mean()
+        out['roe_pos_std'] = np.sqrt((m2 - out['roe_pos_mean'] ** 2).clip(lower=0))
+
+        _, g = grouped('debt_ratio')
+        out['debt_n'] = g.size()
+        out['debt_mean'] = g.mean()
+
+        _, g = grouped('net_margin')
+        out['margin_n'] = g.size()
+        _, g = grouped('net_margin', positive_only=True)
+        out['margin_pos_n'] = g.size()
+
+        _, g = grouped('current_ratio')
+        out['cr_n'] = g.size()
+        out['cr_mean'] = g.mean()
+
+        _, g = grouped('asset_turnover', positive_only=True)
+        out['at_pos_n'] = g.size()
+        out['at_pos_mean'] = g.mean()
+
+        # 毛利率：正值序列的均值与最小二乘斜率（与np.polyfit一阶拟合等价）
+        gm, g = grouped('gross_margin', positive_only=True)
+        out['gm_pos_n'] = g.size()
+        out['gm_pos_mean'] = g.mean()
+        gm = gm.sort_values(['stock_code', 'year'])
+        x = gm.groupby('stock_code').cumcount().astype(float)
+        y = gm['metric_value']
+        terms = pd.DataFrame({
+            'stock_code': gm['stock_code'].values,
+            'x': x.values, 'y': y.values,
+            'xy': (x * y).values, 'x2': (x ** 2).values,
+        })
+        agg = terms.groupby('stock_code').agg(
+            n=('x', 'size'), sx=('x', 'sum'), sy=('y', 'sum'),
+            sxy=('xy', 'sum'), sx2=('x2', 'sum'))
+        denom = agg['n'] * agg['sx2'] - agg['sx'] ** 2
+        out['gm_slope'] = ((agg['n'] * agg['sxy'] - agg['sx'] * agg['sy'])
+                           / denom.where(denom != 0))
+
+        # 总资产：正值序列的复合增长率（首末值口径同_calculate_growth_rate）
+        ta, g = grouped('total_assets', positive_only=True)
+        ta = ta.sort_values(['stock_code', 'year'])
+        first = ta.drop_duplicates('stock_code').set_index('stock_code')['metric_value']
+        last = ta.drop_duplicates('stock_code', keep='last').set_index('stock_code')['metric_value']
+        n = ta.groupby('stock_code').size()
+        out['ta_pos_n'] = n
+        out['ta_growth'] = (last / first) ** (1.0 / (n - 1).clip(lower=1)) - 1
+
+        out['pe_last'] = last_by_year('pe')
+        out['pb_last'] = last_by_year('pb')
+        out['div_last'] = last_by_year('dividend')
+        out = out.join(industry.set_index('stock_code')['industry'])
+
+        # 计数列缺失补0，统计量保持NaN（NaN比较恒为False，自然不计分）
+        count_cols = [c for c in out.columns if c.endswith('_n')]
+        out[count_cols] = out[count_cols].fillna(0).astype(int)
+        return out
+
+    def score_buffett_batch(self, frame: pd.DataFrame,
+                            include_pe_evaluation: bool = False) -> np.ndarray:
+        """巴菲特标准的批量版：对build_score_frame的结果整列打分"""
+        score = np.zeros(len(frame))
+
+        has_roe = (frame['roe_pos_n'] >= 3).values
+        avg_roe = (frame['roe_pos_mean'] / 100.0).values
+        score += np.where(has_roe & (avg_roe > 0.20), 25,
+                 np.where(has_roe & (avg_roe > 0.15), 15,
+                 np.where(has_roe & (avg_roe > 0.10), 5, 0)))
+        score += np.where(has_roe & (frame['roe_pos_std'].values < 5), 10, 0)
+
+        has_debt = (frame['debt_n'] > 0).values
+        avg_debt = (frame['debt_mean'] / 100.0).values
+        score += np.where(has_debt & (avg_debt < 0.2), 20,
+                 np.where(has_debt & (avg_debt < 0.3), 10,
+                 np.where(has_debt & (avg_debt > 0.6), -10, 0)))
+
+        margin_ok = ((frame['margin_n'] >= 3) &
+                     (frame['margin_pos_n'] == frame['margin_n'])).values
+        score += np.where(margin_ok, 15, 0)
+
+        has_cr = (frame['cr_n'] > 0).values
+        avg_cr = frame['cr_mean'].values
+        score += np.where(has_cr & (avg_cr > 2), 10,
+                 np.where(has_cr & (avg_cr > 1.5), 5, 0))
+
+        if include_pe_evaluation:
+            pe = frame['pe_last'].values
+            pe_ok = (pe > 0) & (pe < 100)
+            score += np.where(pe_ok & (pe < 15), 25,
+                     np.where(pe_ok & (pe < 25), 15,
+                     np.where(pe_ok & (pe < 35), 5,
+                     np.where(pe_ok & (pe > 50), -10, 0))))
+
+        return np.minimum(score, 100)
+
+    def score_munger_batch(self, frame: pd.DataFrame,
+                           include_pe_evaluation: bool = False) -> np.ndarray:
+        """芒格标准的批量版：对build_score_frame的结果整列打分"""
+        score = np.zeros(len(frame))
+
+        industry = frame['industry'].fillna('')
+        quality = industry.str.contains(_QUALITY_RE, na=False).values
+        score += np.where(quality, 15, 0)
+
+        has_at = (frame['at_pos_n'] > 0).values
+        avg_at = frame['at_pos_mean'].values
+        score += np.where(has_at & (avg_at > 0.8), 15,
+                 np.where(has_at & (avg_at > 0.5), 10, 0))
+
+        has_gm = (frame['gm_pos_n'] >= 3).values
+        avg_gm = (frame['gm_pos_mean'] / 100.0).values
+        score += np.where(has_gm & (avg_gm > 0.40), 20,
+                 np.where(has_gm & (avg_gm > 0.25), 10, 0))
+        score += np.where(has_gm & (frame['gm_slope'].values > 0), 10, 0)
+
+        if include_pe_evaluation:
+            pe = frame['pe_last'].values
+            pe_ok = (pe > 0) & (pe < 100)
+            score += np.where(pe_ok & (pe < 20), 15,
+                     np.where(pe_ok & (pe < 30), 5,
+                     np.where(pe_ok & (pe > 60), -10, 0)))
+
+        return np.minimum(score, 100)
+
+    def score_graham_batch(self, frame: pd.DataFrame,
+                           include_pe_evaluation: bool = True) -> np.ndarray:
+        """格雷厄姆标准的批量版：对build_score_frame的结果整列打分"""
+        score = np.zeros(len(frame))
+
+        if include_pe_evaluation:
+            pe = frame['pe_last'].values
+            pe_ok = (pe > 0) & (pe < 100)
+            score += np.where(pe_ok & (pe < 12), 25,
+                     np.where(pe_ok & (pe < 20), 15,
+                     np.where(pe_ok & (pe < 30), 5,
+                     np.where(pe_ok & (pe > 40), -5, 0))))
+
+        pb = frame['pb_last'].values
+        pb_ok = pb > 0
+        score += np.where(pb_ok & (pb < 1), 20,
+                 np.where(pb_ok & (pb < 2), 10,
+                 np.where(pb_ok & (pb < 3), 5, 0)))
+
+        dividend = (frame['div_last'] / 100.0).values
+        score += np.where(dividend > 0.04, 15,
+                 np.where(dividend > 0.02, 10, 0))
+
+        has_cr = (frame['cr_n'] > 0).values
+        avg_cr = frame['cr_mean'].values
+        score += np.where(has_cr & (avg_cr > 2), 15,
+                 np.where(has_cr & (avg_cr > 1.5), 10, 0))
+
+        has_ta = (frame['ta_pos_n'] >= 3).values
+        growth = frame['ta_growth'].values
+        score += np.where(has_ta & (growth > 0.1), 10,
+                 np.where(has_ta & (growth > 0), 5, 0))
+
+        return np.minimum(score, 100)
+
+
+    @staticmethod
+    def _metric_arr(metrics: Dict, name: str) -> np.ndarray:
+        """指标字典→去NaN的连续float64数组（每个指标只转换一次）"""
+        data = metrics.get(name, {})
+        if not data:
+            return np.empty(0)
+        # fromiter边迭代边写numpy缓冲，不经过中间Python列表
+        arr = np.fromiter((v for v in data.values() if v is not None),
+                          dtype=np.float64)
+        return arr[~np.isnan(arr)]
+
+    def _candidate_arrays(self, metrics: Dict) -> Dict[str, np.ndarray]:
+        """一次构建初筛与潜力评分共享的全部指标数组
+
+        两套评分各自过滤roe/revenue/现金流等字典是同样的抽取跑两遍；
+        这里集中构建后两边共享，每个候选只扫一遍metrics
+        """
+        revenue = self._metric_arr(metrics, 'revenue')
+        pe = self._metric_arr(metrics, 'pe')
+        return {
+            'roe': self._metric_arr(metrics, 'roe'),
+            'cf': self._metric_arr(metrics, 'operating_cash_flow'),
+            'revenue': revenue[revenue > 0],
+            'debt': self._metric_arr(metrics, 'debt_ratio'),
+            'current': self._metric_arr(metrics, 'current_ratio'),
+            'pe': pe[pe > 0],
+        }
+
+    def preliminary_screening(self, stock_code: str, stock_data: Optional[Dict] = None,
+                              arrays: Optional[Dict[str, np.ndarray]] = None) -> Dict:
         """
         基于历史数据的初步筛选评分（不使用实时PE）
         主要用于第一阶段快速筛选
+
+        stock_data/arrays可由调用方传入已取好的数据和指标数组，
+        避免重复查询与重复构建
         """
         try:
-            stock_data = self.get_stock_metrics(stock_code)
-            
+            if stock_data is None:
+                stock_data = self.get_stock_metrics(stock_code)
+
             if not stock_data:
                 return {'error': f'无法获取股票 {stock_code} 的数据'}
-            
+
             metrics = stock_data.get('metrics', {})
+
+            # 评分指标全缺的股票直接快速拒绝，不再构建数组走打分流程
+            if not any(metrics.get(key) for key in self._PRELIM_METRIC_KEYS):
+                return {'error': f'股票 {stock_code} 缺少可评分指标'}
+
             preliminary_score = 0
-            
-            # ROE评分 (15分)
-            roe_data = metrics.get('roe', {})
-            if roe_data:
-                roe_values = [v for v in roe_data.values() if v is not None]
-                if roe_values:
-                    roe_avg = np.mean(roe_values) / 100.0  # 转换为小数
-                    if roe_avg >= 0.15:  # ≥15%
-                        preliminary_score += 15
-                    elif roe_avg >= 0.10:  # 10-15%
-                        preliminary_score += 10
-                    elif roe_avg >= 0.05:  # 5-10%
-                        preliminary_score += 5
-            
-            # 现金流评分 (10分)
-            cf_data = metrics.get('operating_cash_flow', {})
-            if cf_data:
-                cf_count = sum(1 for v in cf_data.values() if v and v > 0)
-                if cf_count >= 4:  # 4年都为正
-                    preliminary_score += 10
-                elif cf_count >= 3:  # 3年为正
-                    preliminary_score += 7
-                elif cf_count >= 2:  # 2年为正
-                    preliminary_score += 3
-            
-            # 营收增长评分 (10分)
-            revenue_data = metrics.get('revenue', {})
-            avg_growth = None
-            if revenue_data:
-                revenue_values = [v for v in revenue_data.values() if v is not None and v > 0]
-                if len(revenue_values) >= 3:
-                    growth_rates = []
-                    for i in range(1, len(revenue_values)):
-                        if revenue_values[i-1] > 0:
-                            growth = (revenue_values[i] - revenue_values[i-1]) / revenue_values[i-1]
-                            growth_rates.append(growth)
-                    
-                    if growth_rates:
-                        avg_growth = np.mean(growth_rates)
-                        if avg_growth >= 0.10:  # ≥10%
-                            preliminary_score += 10
-                        elif avg_growth >= 0.05:  # 5-10%
-                            preliminary_score += 7
-                        elif avg_growth >= 0:  # 正增长
-                            preliminary_score += 3
-            
-            # 财务稳定性评分 (10分)
-            debt_data = metrics.get('debt_ratio', {})
-            current_data = metrics.get('current_ratio', {})
-            
-            debt_ratio = None
-            current_ratio = None
-            
-            if debt_data:
-                debt_values = [v for v in debt_data.values() if v is not None]
-                if debt_values:
-                    debt_ratio = np.mean(debt_values) / 100.0  # 转换为小数
-                    if debt_ratio < 0.3:  # 负债率<30%
-                        preliminary_score += 5
-                    elif debt_ratio < 0.5:  # 负债率<50%
-                        preliminary_score += 3
-            
-            if current_data:
-                current_values = [v for v in current_data.values() if v is not None]
-                if current_values:
-                    current_ratio = np.mean(current_values)
-                    if current_ratio > 1.5:  # 流动比率>1.5
-                        preliminary_score += 5
-                    elif current_ratio > 1.0:  # 流动比率>1.0
-                        preliminary_score += 3
-            
-            # 历史PE评分 (使用数据库中的历史PE，不调用API)
-            pe_data = metrics.get('pe', {})
-            historical_pe = None
-            if pe_data:
-                pe_values = [v for v in pe_data.values() if v is not None and v > 0]
-                if pe_values:
-                    historical_pe = np.mean(pe_values)  # 取平均历史PE
-                    if historical_pe <= 10:
-                        preliminary_score += 15
-                    elif historical_pe <= 15:
-                        preliminary_score += 12
-                    elif historical_pe <= 20:
-                        preliminary_score += 8
-                    elif historical_pe <= 30:
-                        preliminary_score += 5
-            
+
+            if arrays is None:
+                arrays = self._candidate_arrays(metrics)
+            roe_arr = arrays['roe']
+            cf_arr = arrays['cf']
+            revenue_arr = arrays['revenue']
+            debt_arr = arrays['debt']
+            current_arr = arrays['current']
+            pe_arr = arrays['pe']
+
+            if NUMBA_AVAILABLE:
+                # JIT核心一次算完全部阶梯分与中间量（NaN表示缺数）
+                (preliminary_score, roe_avg, avg_growth, debt_ratio,
+                 current_ratio, historical_pe) = _nb_prelim_score(
+                    roe_arr, cf_arr, revenue_arr, debt_arr, current_arr, pe_arr)
+                roe_avg = None if math.isnan(roe_avg) else roe_avg
+                avg_growth = None if math.isnan(avg_growth) else avg_growth
+                debt_ratio = None if math.isnan(debt_ratio) else debt_ratio
+                current_ratio = None if math.isnan(current_ratio) else current_ratio
+                historical_pe = None if math.isnan(historical_pe) else historical_pe
+            else:
+                # ROE评分 (15分)
+                roe_avg = None
+                if len(roe_arr):
+                    roe_avg = float(roe_arr.mean()) / 100.0  # 转换为小数
+                    preliminary_score += self._bucket_high(roe_avg, self._PRE_ROE_T, self._PRE_ROE_S)
+
+                # 现金流评分 (10分)
+                if len(cf_arr):
+                    cf_count = int(np.count_nonzero(cf_arr > 0))
+                    preliminary_score += self._bucket_high(cf_count, self._PRE_CF_T, self._PRE_CF_S)
+
+                # 营收增长评分 (10分)
+                avg_growth = None
+                if len(revenue_arr) >= 3:
+                    growth_rates = np.diff(revenue_arr) / revenue_arr[:-1]
+                    avg_growth = float(growth_rates.mean())
+                    preliminary_score += self._bucket_high(avg_growth, self._PRE_GROWTH_T, self._PRE_GROWTH_S)
+
+                # 财务稳定性评分 (10分)
+                debt_ratio = None
+                if len(debt_arr):
+                    debt_ratio = float(debt_arr.mean()) / 100.0  # 转换为小数
+                    preliminary_score += self._bucket_low(debt_ratio, self._PRE_DEBT_T, self._PRE_DEBT_S)
+
+                current_ratio = None
+                if len(current_arr):
+                    current_ratio = float(current_arr.mean())
+                    preliminary_score += self._bucket_high(current_ratio, self._PRE_CR_T, self._PRE_CR_S,
+                                                          strict=True)
+
+                # 历史PE评分 (使用数据库中的历史PE，不调用API)
+                historical_pe = None
+                if len(pe_arr):
+                    historical_pe = float(pe_arr.mean())  # 取平均历史PE
+                    preliminary_score += self._bucket_low(historical_pe, self._PRE_PE_T, self._PRE_PE_S,
+                                                          strict=False)
+
             return {
                 'stock_code': stock_code,
                 'stock_name': stock_data['basic_info'].get('stock_name', ''),
                 'preliminary_score': preliminary_score,
                 'historical_pe': historical_pe,
-                'roe_avg': roe_avg * 100 if 'roe_avg' in locals() and roe_avg else None,
+                'roe_avg': roe_avg * 100 if roe_avg else None,
                 'revenue_growth': avg_growth,
                 'debt_ratio': debt_ratio * 100 if debt_ratio else None,
                 'current_ratio': current_ratio
@@ -909,113 +2465,88 @@ class ValueInvestmentAgent:
             logger.error(f"初步筛选股票 {stock_code} 时出错: {e}")
             return {'error': str(e)}
     
-    def _assess_potential(self, stock_code: str, preliminary_result: Dict) -> float:
+    def _assess_potential(self, stock_code: str, preliminary_result: Dict,
+                          stock_data: Optional[Dict] = None,
+                          arrays: Optional[Dict[str, np.ndarray]] = None) -> float:
         """
         评估股票潜力分数
         基于多个维度给出潜力评估，用于优先级排序
+
+        stock_data/arrays可由调用方传入已取好的数据和指标数组，
+        避免重复查询与重复构建
         """
         potential_score = 0
-        
+
         try:
-            # ROE稳定性和趋势 (最高15分)
-            stock_data = self.get_stock_metrics(stock_code)
+            if stock_data is None:
+                stock_data = self.get_stock_metrics(stock_code)
             if not stock_data:
                 return 0
-                
-            metrics = stock_data.get('metrics', {})
-            roe_data = metrics.get('roe', {})
-            
-            if roe_data:
-                roe_values = [v for v in roe_data.values() if v is not None]
-                
-                if len(roe_values) >= 3:
-                    # ROE稳定性 (前面几年的ROE波动)
-                    roe_std = np.std(roe_values)
-                    if roe_std < 2:  # 标准差<2%，非常稳定
-                        potential_score += 8
-                    elif roe_std < 5:  # 标准差<5%，较稳定
-                        potential_score += 5
-                    elif roe_std < 8:  # 标准差<8%，一般稳定
-                        potential_score += 2
-                    
-                    # ROE趋势 (是否上升趋势)
-                    if len(roe_values) >= 3:
-                        recent_roe = np.mean(roe_values[-2:])  # 最近2年平均
-                        early_roe = np.mean(roe_values[:2])   # 早期2年平均
-                        if recent_roe > early_roe * 1.1:  # 最近比早期高10%+
-                            potential_score += 7
-                        elif recent_roe > early_roe:  # 上升趋势
-                            potential_score += 4
-            
+
+            if arrays is None:
+                arrays = self._candidate_arrays(stock_data.get('metrics', {}))
+
+            if NUMBA_AVAILABLE:
+                # JIT核心一次算完全部阶梯分（封顶50分）
+                historical_pe = preliminary_result.get('historical_pe')
+                return float(_nb_potential_score(
+                    arrays['roe'], arrays['cf'], arrays['revenue'],
+                    arrays['debt'], arrays['current'],
+                    float(historical_pe) if historical_pe else math.nan))
+
+            # ROE稳定性和趋势 (最高15分)
+            roe_arr = arrays['roe']
+            if len(roe_arr) >= 3:
+                # ROE稳定性 (前面几年的ROE波动)
+                roe_std = float(np.std(roe_arr))
+                potential_score += self._bucket_low(roe_std, self._POT_STD_T, self._POT_STD_S)
+
+                # ROE趋势 (是否上升趋势)
+                recent_roe = float(roe_arr[-2:].mean())  # 最近2年平均
+                early_roe = float(roe_arr[:2].mean())    # 早期2年平均
+                if recent_roe > early_roe * 1.1:  # 最近比早期高10%+
+                    potential_score += 7
+                elif recent_roe > early_roe:  # 上升趋势
+                    potential_score += 4
+
             # 营收质量和增长一致性 (最高10分)
-            revenue_data = metrics.get('revenue', {})
-            if revenue_data:
-                revenue_values = [v for v in revenue_data.values() if v is not None and v > 0]
-                if len(revenue_values) >= 3:
-                    # 营收增长一致性 (连续增长年数)
-                    growth_count = 0
-                    for i in range(1, len(revenue_values)):
-                        if revenue_values[i] > revenue_values[i-1]:
-                            growth_count += 1
-                    
-                    if growth_count == len(revenue_values) - 1:  # 连续增长
-                        potential_score += 8
-                    elif growth_count >= len(revenue_values) * 0.7:  # 70%年份增长
-                        potential_score += 5
-                    elif growth_count >= len(revenue_values) * 0.5:  # 50%年份增长
-                        potential_score += 2
-            
+            revenue_arr = arrays['revenue']
+            if len(revenue_arr) >= 3:
+                # 营收增长一致性 (连续增长年数)：diff>0整列归约代替逐年循环
+                growth_count = int(np.count_nonzero(np.diff(revenue_arr) > 0))
+
+                if growth_count == len(revenue_arr) - 1:  # 连续增长
+                    potential_score += 8
+                elif growth_count >= len(revenue_arr) * 0.7:  # 70%年份增长
+                    potential_score += 5
+                elif growth_count >= len(revenue_arr) * 0.5:  # 50%年份增长
+                    potential_score += 2
+
             # 现金流质量 (最高8分)
-            cf_data = metrics.get('operating_cash_flow', {})
-            if cf_data:
-                cf_values = [v for v in cf_data.values() if v is not None]
-                if cf_values:
-                    positive_cf_ratio = sum(1 for v in cf_values if v > 0) / len(cf_values)
-                    if positive_cf_ratio >= 0.8:  # 80%以上年份为正
-                        potential_score += 8
-                    elif positive_cf_ratio >= 0.6:  # 60%以上年份为正
-                        potential_score += 5
-                    elif positive_cf_ratio >= 0.4:  # 40%以上年份为正
-                        potential_score += 2
-            
+            cf_arr = arrays['cf']
+            if len(cf_arr):
+                positive_cf_ratio = float((cf_arr > 0).mean())
+                potential_score += self._bucket_high(positive_cf_ratio,
+                                                     self._POT_CF_T, self._POT_CF_S)
+
             # 财务安全边际 (最高7分)
-            debt_data = metrics.get('debt_ratio', {})
-            current_data = metrics.get('current_ratio', {})
-            
-            debt_ratio = 1.0  # 默认值
-            current_ratio = 0.5  # 默认值
-            
-            if debt_data:
-                debt_values = [v for v in debt_data.values() if v is not None]
-                if debt_values:
-                    debt_ratio = np.mean(debt_values) / 100.0
-            
-            if current_data:
-                current_values = [v for v in current_data.values() if v is not None]
-                if current_values:
-                    current_ratio = np.mean(current_values)
-            
+            debt_arr = arrays['debt']
+            current_arr = arrays['current']
+            debt_ratio = float(debt_arr.mean()) / 100.0 if len(debt_arr) else 1.0
+            current_ratio = float(current_arr.mean()) if len(current_arr) else 0.5
+
             # 极低债务率额外加分
-            if debt_ratio < 0.2:
-                potential_score += 4
-            elif debt_ratio < 0.4:
-                potential_score += 2
-            
+            potential_score += self._bucket_low(debt_ratio, self._POT_DEBT_T, self._POT_DEBT_S)
+
             # 优秀流动性额外加分
-            if current_ratio > 2.0:
-                potential_score += 3
-            elif current_ratio > 1.5:
-                potential_score += 1
-            
+            potential_score += self._bucket_high(current_ratio, self._POT_CR_T, self._POT_CR_S,
+                                                 strict=True)
+
             # 行业相对优势 (基于历史PE的合理性，最高5分)
             historical_pe = preliminary_result.get('historical_pe')
             if historical_pe and 5 <= historical_pe <= 25:  # 合理PE范围
-                if historical_pe <= 12:
-                    potential_score += 5
-                elif historical_pe <= 18:
-                    potential_score += 3
-                elif historical_pe <= 25:
-                    potential_score += 1
+                potential_score += self._bucket_low(historical_pe, self._POT_PE_T, self._POT_PE_S,
+                                                    strict=False)
             
             return min(potential_score, 50)  # 潜力分数上限50分
             
@@ -1023,17 +2554,22 @@ class ValueInvestmentAgent:
             logger.error(f"评估股票 {stock_code} 潜力时出错: {e}")
             return 0
     
-    def comprehensive_evaluation(self, stock_code: str, use_realtime_pe: bool = True) -> Dict:
+    def comprehensive_evaluation(self, stock_code: str, use_realtime_pe: bool = True,
+                                 stock_data: Optional[Dict] = None,
+                                 eval_ts: Optional[str] = None) -> Dict:
         """
         综合评估股票
-        
+
         Args:
             stock_code: 股票代码
             use_realtime_pe: 是否使用实时PE（调用Tushare API）
+            stock_data: 已取好的股票数据，None则内部查询
+            eval_ts: 评估时间戳字符串，跑批时传入同一份避免逐股strftime
         """
         try:
-            stock_data = self.get_stock_metrics(stock_code)
-            
+            if stock_data is None:
+                stock_data = self.get_stock_metrics(stock_code)
+
             if not stock_data:
                 return {'error': f'未找到股票 {stock_code} 的数据'}
             
@@ -1058,11 +2594,12 @@ class ValueInvestmentAgent:
                 except Exception as e:
                     logger.warning(f"获取实时PE失败 {stock_code}: {e}，使用历史PE")
             
-            # 三位大师的评分
-            buffett_result = self.buffett_criteria(stock_data, include_pe_evaluation=True, realtime_pe=realtime_pe)
-            munger_result = self.munger_criteria(stock_data, include_pe_evaluation=True, realtime_pe=realtime_pe)
-            graham_result = self.graham_criteria(stock_data, include_pe_evaluation=True, realtime_pe=realtime_pe)
-            
+            # 三位大师的评分（共享一次中间量计算）
+            scores = self.score_all(stock_data, realtime_pe=realtime_pe, include_pe=True)
+            buffett_result = scores['buffett']
+            munger_result = scores['munger']
+            graham_result = scores['graham']
+
             # 综合评分
             total_score = (
                 buffett_result['score'] * 0.4 +  # 巴菲特权重40%
@@ -1070,17 +2607,8 @@ class ValueInvestmentAgent:
                 graham_result['score'] * 0.3     # 格雷厄姆权重30%
             )
             
-            # 投资等级
-            if total_score >= 80:
-                grade = "A+ 强烈推荐"
-            elif total_score >= 70:
-                grade = "A 推荐买入"
-            elif total_score >= 60:
-                grade = "B+ 值得关注"
-            elif total_score >= 50:
-                grade = "B 谨慎观察"
-            else:
-                grade = "C 暂不推荐"
+            # 投资等级（50/60/70/80分界，side='right'使边界值落入高档）
+            grade = self._GRADES[np.searchsorted(self._GRADE_BINS, total_score, side='right')]
             
             evaluation_result = {
                 'stock_code': stock_code,
@@ -1092,7 +2620,7 @@ class ValueInvestmentAgent:
                 'munger_analysis': munger_result,
                 'graham_analysis': graham_result,
                 'pe_api_used': pe_api_used,  # 标记是否使用了API
-                'evaluation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'evaluation_date': eval_ts or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
             # 添加PE信息
@@ -1103,9 +2631,10 @@ class ValueInvestmentAgent:
             metrics = stock_data.get('metrics', {})
             pe_data = metrics.get('pe', {})
             if pe_data:
-                pe_values = [v for v in pe_data.values() if v is not None and v > 0]
-                if pe_values:
-                    evaluation_result['pe_ratio'] = np.mean(pe_values)
+                pe_values = np.fromiter((v for v in pe_data.values() if v is not None and v > 0),
+                                        dtype=np.float64)
+                if len(pe_values):
+                    evaluation_result['pe_ratio'] = float(pe_values.mean())
             
             return evaluation_result
             
@@ -1129,62 +2658,92 @@ class ValueInvestmentAgent:
         else:
             logger.info(f"🔍 开始智能筛选所有股票（两阶段策略）")
         
-        # 获取所有股票代码和名称
-        conn = sqlite3.connect(self.db_path)
-        stocks = pd.read_sql_query("SELECT stock_code, stock_name FROM stocks", conn)
-        conn.close()
-        
+        # 获取所有股票代码和名称（测试模式把LIMIT下推到SQL，不取整表再丢弃）
+        # 只需两列字符串：裸游标取元组即可，不值得为此装箱一个DataFrame
+        conn = self._db_conn()
         if test_mode:
-            stocks = stocks.head(test_count)
+            stocks = conn.execute(
+                "SELECT stock_code, stock_name FROM stocks LIMIT ?",
+                (test_count,)
+            ).fetchall()
             logger.info(f"测试模式：限制分析 {len(stocks)} 只股票")
-        
+        else:
+            stocks = conn.execute("SELECT stock_code, stock_name FROM stocks").fetchall()
+        stock_codes = [stock_code for stock_code, _ in stocks]
+
         # 第一阶段：基本筛选 + 历史数据初步评分
         logger.info("🔍 第一阶段：基本筛选 + 历史数据初步评分")
         preliminary_candidates = []
         skipped_count = 0
         skip_reasons = {}
         processed = 0
-        
-        for _, row in stocks.iterrows():
-            stock_code = row['stock_code']
-            stock_name = row['stock_name']
-            
-            # 基本筛选
-            should_skip, skip_reason = self._should_skip_stock(stock_code, stock_name)
-            
+
+        # 基本筛选整批一次完成，循环内只查表
+        skip_map = self.screen_all(stock_codes, dict(stocks))
+
+        # 指标宽表整批预加载，后续get_stock_metrics全部命中缓存
+        self.preload_metrics(stock_codes)
+
+        # 基本筛选只是查表，先串行走完统计跳过原因
+        survivors = []
+        for stock_code, stock_name in stocks:
+            should_skip, skip_reason = skip_map[stock_code]
+
             if should_skip:
                 skipped_count += 1
                 skip_reasons[skip_reason] = skip_reasons.get(skip_reason, 0) + 1
                 logger.debug(f"跳过股票: {stock_code} {stock_name} - {skip_reason}")
-                continue
-            
-            # 历史数据初步评分（不使用实时PE）
-            try:
-                preliminary_result = self.preliminary_screening(stock_code)
-                
-                if 'error' not in preliminary_result:
-                    # 添加潜力评估
-                    potential_score = self._assess_potential(stock_code, preliminary_result)
-                    preliminary_result['potential_score'] = potential_score
-                    preliminary_result['combined_score'] = preliminary_result['preliminary_score'] + potential_score
-                    
+            else:
+                survivors.append(stock_code)
+
+        def prelim_one(code: str) -> Optional[Dict]:
+            """历史数据初步评分（不使用实时PE）"""
+            # 取一次数据、建一次指标数组，供初筛和潜力评估共用
+            stock_data = self.get_stock_metrics(code)
+            arrays = self._candidate_arrays(stock_data.get('metrics', {})) if stock_data else None
+            preliminary_result = self.preliminary_screening(code, stock_data=stock_data,
+                                                            arrays=arrays)
+            if 'error' in preliminary_result:
+                return None
+            # 添加潜力评估
+            potential_score = self._assess_potential(code, preliminary_result,
+                                                     stock_data=stock_data, arrays=arrays)
+            preliminary_result['potential_score'] = potential_score
+            preliminary_result['combined_score'] = preliminary_result['preliminary_score'] + potential_score
+            return preliminary_result
+
+        # 初筛是DB/缓存读取为主的IO型任务，线程池重叠等待
+        prelim_workers = min(32, (os.cpu_count() or 4) * 4)
+        with ThreadPoolExecutor(max_workers=prelim_workers) as pool:
+            futures = {pool.submit(prelim_one, code): code for code in survivors}
+            for future in as_completed(futures):
+                stock_code = futures[future]
+                try:
+                    preliminary_result = future.result()
+                except Exception as e:
+                    logger.error(f"初步评估股票 {stock_code} 时出错: {e}")
+                    continue
+
+                if preliminary_result is not None:
                     preliminary_candidates.append(preliminary_result)
                     logger.debug(f"初步候选: {stock_code} {preliminary_result['stock_name']} - "
                                f"基础: {preliminary_result['preliminary_score']:.1f}, "
-                               f"潜力: {potential_score:.1f}, "
+                               f"潜力: {preliminary_result['potential_score']:.1f}, "
                                f"综合: {preliminary_result['combined_score']:.1f}")
-                
+
                 processed += 1
                 if processed % 100 == 0:
                     logger.info(f"已初筛 {processed}/{len(stocks)} 只股票，发现 {len(preliminary_candidates)} 只候选")
-                    
-            except Exception as e:
-                logger.error(f"初步评估股票 {stock_code} 时出错: {e}")
-                continue
-        
-        # 按综合得分排序
-        preliminary_candidates.sort(key=lambda x: x['combined_score'], reverse=True)
-        
+
+        # 按综合得分排序：分数抽成连续数组后argsort（SoA），替代
+        # dict列表上key=lambda排序的逐元素属性查找
+        scores = np.fromiter((c['combined_score'] for c in preliminary_candidates),
+                             dtype=np.float64, count=len(preliminary_candidates))
+        order = np.argsort(-scores, kind='stable')
+        preliminary_candidates = [preliminary_candidates[i] for i in order]
+        sorted_scores = scores[order]
+
+
         logger.info(f"第一阶段完成:")
         logger.info(f"  - 原始股票: {len(stocks)} 只")
         logger.info(f"  - 跳过股票: {skipped_count} 只")
@@ -1202,9 +2761,13 @@ class ValueInvestmentAgent:
         logger.info("📡 第二阶段：智能实时PE评估")
         
         # 分层策略：优先级越高，越需要准确的实时PE
-        high_priority = [c for c in preliminary_candidates if c['combined_score'] >= 65]  # 高潜力股票
-        medium_priority = [c for c in preliminary_candidates if 50 <= c['combined_score'] < 65]  # 中等股票
-        low_priority = [c for c in preliminary_candidates if c['combined_score'] < 50]  # 低分股票
+        # 降序分数数组上二分出65/50分界，三个层级是连续切片，
+        # 免去三趟线性过滤
+        hi_end = int(np.searchsorted(-sorted_scores, -65.0, side='right'))
+        mid_end = int(np.searchsorted(-sorted_scores, -50.0, side='right'))
+        high_priority = preliminary_candidates[:hi_end]      # 高潜力股票(≥65)
+        medium_priority = preliminary_candidates[hi_end:mid_end]  # 中等股票(50-64)
+        low_priority = preliminary_candidates[mid_end:]      # 低分股票(<50)
         
         logger.info(f"候选股票分层:")
         logger.info(f"  - 高优先级(≥65分): {len(high_priority)} 只 (全部使用实时PE)")
@@ -1214,145 +2777,94 @@ class ValueInvestmentAgent:
         final_results = []
         api_calls = 0
         api_success = 0
-        
-        # 处理高优先级股票（全部使用实时PE）
-        for candidate in high_priority:
-            stock_code = candidate['stock_code']
-            try:
-                final_evaluation = self.comprehensive_evaluation(stock_code, use_realtime_pe=True)
-                
-                if final_evaluation.get('pe_api_used', False):
-                    api_calls += 1
-                    api_success += 1
-                
-                if 'error' not in final_evaluation:
-                    final_results.append(final_evaluation)
-                    logger.debug(f"✅ 高优先级: {stock_code} - 评分: {final_evaluation['total_score']:.1f}")
-                
-                # API调用间隔
-                if api_calls % 10 == 0:
-                    time.sleep(0.5)
-                    
-            except Exception as e:
-                logger.error(f"分析高优先级股票 {stock_code} 时出错: {e}")
-                continue
-        
+        # 整轮筛选共用一份评估时间戳，省去逐股datetime.now().strftime
+        eval_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        def evaluate_batch(candidates: List[Dict], use_realtime_pe: bool, label: str):
+            """一批候选并发综合评估：评估是IO型任务，线程池重叠等待
+
+            限流交给TushareManager的token冷却与DeepSeek限速器，
+            不再按调用次数插固定sleep。
+            """
+            nonlocal api_calls, api_success
+            if not candidates:
+                return
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                futures = {
+                    pool.submit(self.comprehensive_evaluation, c['stock_code'],
+                                use_realtime_pe, eval_ts=eval_ts):
+                    c['stock_code'] for c in candidates
+                }
+                for future in as_completed(futures):
+                    stock_code = futures[future]
+                    try:
+                        final_evaluation = future.result()
+                    except Exception as e:
+                        logger.error(f"分析{label}股票 {stock_code} 时出错: {e}")
+                        continue
+
+                    if final_evaluation.get('pe_api_used', False):
+                        api_calls += 1
+                        api_success += 1
+
+                    if 'error' not in final_evaluation:
+                        final_results.append(final_evaluation)
+                        logger.debug(f"✅ {label}: {stock_code} - 评分: {final_evaluation['total_score']:.1f}")
+
+        # 处理高优先级股票（全部使用实时PE）
+        evaluate_batch(high_priority, True, "高优先级")
+
         # 处理中优先级股票（选择性使用实时PE）
         medium_with_api = medium_priority[:min(len(medium_priority), 200)]  # 最多200只使用API
         medium_without_api = medium_priority[len(medium_with_api):]
-        
+
         logger.info(f"中优先级处理策略: {len(medium_with_api)} 只使用实时PE, {len(medium_without_api)} 只使用历史PE")
-        
-        # 有API的中优先级股票
-        for candidate in medium_with_api:
-            stock_code = candidate['stock_code']
-            try:
-                final_evaluation = self.comprehensive_evaluation(stock_code, use_realtime_pe=True)
-                
-                if final_evaluation.get('pe_api_used', False):
-                    api_calls += 1
-                    api_success += 1
-                
-                if 'error' not in final_evaluation:
-                    final_results.append(final_evaluation)
-                
-                # API调用间隔
-                if api_calls % 20 == 0:
-                    time.sleep(1)
-                    
-            except Exception as e:
-                logger.error(f"分析中优先级股票 {stock_code} 时出错: {e}")
-                continue
-        
-        # 无API的中优先级股票
-        for candidate in medium_without_api:
-            stock_code = candidate['stock_code']
-            try:
-                final_evaluation = self.comprehensive_evaluation(stock_code, use_realtime_pe=False)
-                
-                if 'error' not in final_evaluation:
-                    final_results.append(final_evaluation)
-                    
-            except Exception as e:
-                logger.error(f"分析中优先级股票 {stock_code} 时出错: {e}")
-                continue
-        
+
+        evaluate_batch(medium_with_api, True, "中优先级")
+        evaluate_batch(medium_without_api, False, "中优先级")
+
         # 处理低优先级股票（主要使用历史PE，少量使用实时PE）
         low_with_api = low_priority[:min(len(low_priority), 50)]  # 最多50只使用API
         low_without_api = low_priority[len(low_with_api):]
-        
+
         logger.info(f"低优先级处理策略: {len(low_with_api)} 只使用实时PE, {len(low_without_api)} 只使用历史PE")
-        
-        # 有API的低优先级股票
-        for candidate in low_with_api:
-            stock_code = candidate['stock_code']
-            try:
-                final_evaluation = self.comprehensive_evaluation(stock_code, use_realtime_pe=True)
-                
-                if final_evaluation.get('pe_api_used', False):
-                    api_calls += 1
-                    api_success += 1
-                
-                if 'error' not in final_evaluation:
-                    final_results.append(final_evaluation)
-                
-                # API调用间隔
-                if api_calls % 30 == 0:
-                    time.sleep(1.5)
-                    
-            except Exception as e:
-                logger.error(f"分析低优先级股票 {stock_code} 时出错: {e}")
-                continue
-        
-        # 无API的低优先级股票
-        for candidate in low_without_api:
-            stock_code = candidate['stock_code']
-            try:
-                final_evaluation = self.comprehensive_evaluation(stock_code, use_realtime_pe=False)
-                
-                if 'error' not in final_evaluation:
-                    final_results.append(final_evaluation)
-                    
-            except Exception as e:
-                logger.error(f"分析低优先级股票 {stock_code} 时出错: {e}")
-                continue
-        
+
+        evaluate_batch(low_with_api, True, "低优先级")
+        evaluate_batch(low_without_api, False, "低优先级")
+
         # 按最终得分排序
         final_results.sort(key=lambda x: x['total_score'], reverse=True)
         
         # 可选：DeepSeek AI分析（只对高分股票）
         if self.deepseek_analyzer and final_results:
-            top_for_ai = final_results[:min(50, len(final_results))]
+            # 结果已按分数降序，取前50中60分以上的部分
+            top_for_ai = [r for r in final_results[:min(50, len(final_results))]
+                          if r['total_score'] >= 60]
             logger.info(f"🤖 DeepSeek AI分析（分析前{len(top_for_ai)}名）")
-            
-            for i, result in enumerate(top_for_ai):
-                if result['total_score'] < 60:  # 只对60分以上的股票进行AI分析
-                    break
-                    
-                stock_code = result['stock_code']
-                try:
-                    stock_data = self.get_stock_metrics(stock_code)
-                    score_details = {
+
+            items = []
+            for result in top_for_ai:
+                items.append((
+                    result['stock_code'],
+                    self.get_stock_metrics(result['stock_code']),
+                    {
                         'total_score': result['total_score'],
                         'buffett': result['buffett_analysis'],
                         'munger': result['munger_analysis'],
                         'graham': result['graham_analysis']
                     }
-                    
-                    ai_analysis = self.deepseek_analyzer.analyze_stock(stock_code, stock_data, score_details)
-                    
+                ))
+
+            # aiohttp并发批跑替代逐股串行+固定sleep(2)：N只股票的模型
+            # 延迟相互重叠，限流交给信号量和自适应限速器
+            if items:
+                analyses = self.deepseek_analyzer.analyze_batch(items, concurrency=5)
+                for result, ai_analysis in zip(top_for_ai, analyses):
                     if ai_analysis:
                         result['ai_analysis'] = ai_analysis
-                        logger.info(f"✅ AI分析完成: {stock_code}")
+                        logger.info(f"✅ AI分析完成: {result['stock_code']}")
                     else:
                         result['ai_analysis'] = "AI分析暂不可用"
-                        
-                    if i < len(top_for_ai) - 1:
-                        time.sleep(2)
-                        
-                except Exception as e:
-                    logger.error(f"AI分析股票 {stock_code} 时出错: {e}")
-                    result['ai_analysis'] = f"AI分析出错: {str(e)}"
         
         # 统计信息
         api_success_rate = (api_success / api_calls * 100) if api_calls > 0 else 0
@@ -1407,116 +2919,134 @@ class ValueInvestmentAgent:
         return md_file
     
     def _generate_markdown_report(self, value_stocks: List[Dict], output_file: str):
-        """生成Markdown格式报告"""
-        report_lines = [
-            "# 🎯 价值投资分析报告",
-            f"**生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            f"**筛选数量**: {len(value_stocks)} 只股票",
-            "",
-            "## 📊 投资大师评分体系",
-            "",
-            "### 🏆 巴菲特标准 (权重40%)",
-            "- 持续高ROE (>15%)",
-            "- 低债务比率 (<30%)",
-            "- 稳定盈利能力",
-            "- 强劲现金流",
-            "",
-            "### 🧠 查理芒格标准 (权重30%)",
-            "- 优质行业选择",
-            "- 高经营效率",
-            "- 强定价权（高毛利率）",
-            "- 合理估值",
-            "",
-            "### 📚 格雷厄姆标准 (权重30%)",
-            "- 低PE估值 (<12x)",
-            "- 低PB比率 (<2x)",
-            "- 安全边际充足",
-            "- 稳定股息回报",
-            "",
-            "## 🌟 精选价值股票",
-            ""
-        ]
-        
-        for i, stock in enumerate(value_stocks, 1):
-            report_lines.extend([
-                f"### {i}. {stock['stock_name']} ({stock['stock_code']})",
-                f"**综合评分**: {stock['total_score']}/100 - {stock['grade']}",
-                f"**所属行业**: {stock['industry']}",
-                "",
-                "#### 🏆 巴菲特分析",
-                f"**得分**: {stock['buffett_analysis']['score']}/100",
-                *[f"- {detail}" for detail in stock['buffett_analysis']['details']],
-                "",
-                "#### 🧠 芒格分析", 
-                f"**得分**: {stock['munger_analysis']['score']}/100",
-                *[f"- {detail}" for detail in stock['munger_analysis']['details']],
-                "",
-                "#### 📚 格雷厄姆分析",
-                f"**得分**: {stock['graham_analysis']['score']}/100", 
-                *[f"- {detail}" for detail in stock['graham_analysis']['details']],
-                ""
-            ])
-            
-            # 添加AI分析部分
-            if 'ai_analysis' in stock and stock['ai_analysis']:
-                if 'AI分析暂不可用' in stock['ai_analysis'] or 'AI分析出错' in stock['ai_analysis']:
-                    report_lines.extend([
-                        "#### 🤖 AI深度分析",
-                        f"**状态**: {stock['ai_analysis']}",
-                        ""
-                    ])
-                else:
-                    report_lines.extend([
-                        "#### 🤖 AI深度分析",
-                        "",
-                        stock['ai_analysis'],
-                        ""
-                    ])
-            
-            report_lines.extend([
-                "---",
-                ""
-            ])
-        
-        report_lines.extend([
-            "",
-            "## ⚠️ 重要声明",
-            "",
-            "1. 本报告仅基于历史财务数据分析，不构成投资建议",
-            "2. 投资有风险，入市需谨慎",
-            "3. 建议结合实时市场信息和个人风险承受能力做出投资决策",
-            "4. 价值投资需要长期持有，避免短期投机",
-            "",
-            f"---",
-            f"*报告由价值投资Agent生成于 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*"
-        ])
-        
-        report_content = '\n'.join(report_lines)
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(report_content)
+        """生成Markdown格式报告
+
+        逐段直写大缓冲文件句柄：不再攒整份report_lines列表再join，
+        省去数万个中间str对象和最后一次O(N)整体拷贝
+        """
+        generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            w = f.write
+            w(
+                "# 🎯 价值投资分析报告\n"
+                f"**生成时间**: {generated_at}\n"
+                f"**筛选数量**: {len(value_stocks)} 只股票\n"
+                "\n"
+                "## 📊 投资大师评分体系\n"
+                "\n"
+                "### 🏆 巴菲特标准 (权重40%)\n"
+                "- 持续高ROE (>15%)\n"
+                "- 低债务比率 (<30%)\n"
+                "- 稳定盈利能力\n"
+                "- 强劲现金流\n"
+                "\n"
+                "### 🧠 查理芒格标准 (权重30%)\n"
+                "- 优质行业选择\n"
+                "- 高经营效率\n"
+                "- 强定价权（高毛利率）\n"
+                "- 合理估值\n"
+                "\n"
+                "### 📚 格雷厄姆标准 (权重30%)\n"
+                "- 低PE估值 (<12x)\n"
+                "- 低PB比率 (<2x)\n"
+                "- 安全边际充足\n"
+                "- 稳定股息回报\n"
+                "\n"
+                "## 🌟 精选价值股票\n"
+                "\n"
+            )
+
+            for i, stock in enumerate(value_stocks, 1):
+                w(
+                    f"### {i}. {stock['stock_name']} ({stock['stock_code']})\n"
+                    f"**综合评分**: {stock['total_score']}/100 - {stock['grade']}\n"
+                    f"**所属行业**: {stock['industry']}\n"
+                    "\n"
+                    "#### 🏆 巴菲特分析\n"
+                    f"**得分**: {stock['buffett_analysis']['score']}/100\n"
+                )
+                w('\n'.join(f"- {detail}" for detail in stock['buffett_analysis']['details']))
+                w(
+                    "\n\n"
+                    "#### 🧠 芒格分析\n"
+                    f"**得分**: {stock['munger_analysis']['score']}/100\n"
+                )
+                w('\n'.join(f"- {detail}" for detail in stock['munger_analysis']['details']))
+                w(
+                    "\n\n"
+                    "#### 📚 格雷厄姆分析\n"
+                    f"**得分**: {stock['graham_analysis']['score']}/100\n"
+                )
+                w('\n'.join(f"- {detail}" for detail in stock['graham_analysis']['details']))
+                w("\n\n")
+
+                # 添加AI分析部分
+                if 'ai_analysis' in stock and stock['ai_analysis']:
+                    if 'AI分析暂不可用' in stock['ai_analysis'] or 'AI分析出错' in stock['ai_analysis']:
+                        w(
+                            "#### 🤖 AI深度分析\n"
+                            f"**状态**: {stock['ai_analysis']}\n"
+                            "\n"
+                        )
+                    else:
+                        w(
+                            "#### 🤖 AI深度分析\n"
+                            "\n"
+                            f"{stock['ai_analysis']}\n"
+                            "\n"
+                        )
+
+                w("---\n\n")
+
+            w(
+                "\n"
+                "## ⚠️ 重要声明\n"
+                "\n"
+                "1. 本报告仅基于历史财务数据分析，不构成投资建议\n"
+                "2. 投资有风险，入市需谨慎\n"
+                "3. 建议结合实时市场信息和个人风险承受能力做出投资决策\n"
+                "4. 价值投资需要长期持有，避免短期投机\n"
+                "\n"
+                "---\n"
+                f"*报告由价值投资Agent生成于 {generated_at}*"
+            )
     
+    # 概览表的最新值指标：键为指标名，与表头"值/年份"列对成对出现
+    _OVERVIEW_METRICS = ('roe', 'debt_ratio', 'current_ratio', 'gross_margin',
+                         'net_margin', 'pb', 'pe')
+
     def _generate_excel_report(self, value_stocks: List[Dict], output_file: str):
-        """生成Excel格式报告"""
+        """生成Excel格式报告
+
+        优先用xlsxwriter常量内存模式流式写出（行写完即刷盘，峰值内存
+        与报告规模无关），未安装时退回openpyxl整簿构建
+        """
+        if XLSXWRITER_AVAILABLE:
+            try:
+                self._generate_excel_report_streaming(value_stocks, output_file)
+                logger.info(f"Excel报告已保存到: {output_file}")
+                return
+            except Exception as e:
+                logger.error(f"生成Excel报告失败: {e}")
+                return
         try:
             # 创建工作簿
             from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-            from openpyxl.utils.dataframe import dataframe_to_rows
-            
-            wb = Workbook()
-            
-            # 删除默认工作表
-            wb.remove(wb.active)
-            
+
+            # write_only模式逐行序列化到磁盘，不在内存保留整棵单元格树
+            wb = Workbook(write_only=True)
+
+            metrics_map = self._metrics_for_report(value_stocks)
+
             # 1. 创建概览表
-            self._create_overview_sheet(wb, value_stocks)
-            
+            self._create_overview_sheet(wb, value_stocks, metrics_map)
+
             # 2. 创建详细评分表
             self._create_detailed_scores_sheet(wb, value_stocks)
-            
+
             # 3. 创建财务指标表
-            self._create_financial_metrics_sheet(wb, value_stocks)
+            self._create_financial_metrics_sheet(wb, value_stocks, metrics_map)
             
             # 保存文件
             wb.save(output_file)
@@ -1527,219 +3057,353 @@ class ValueInvestmentAgent:
         except Exception as e:
             logger.error(f"生成Excel报告失败: {e}")
     
-    def _create_overview_sheet(self, wb, value_stocks):
-        """创建概览工作表"""
-        from openpyxl.styles import Font, Alignment, PatternFill
-        
-        ws = wb.create_sheet("📊 股票概览", 0)
-        
+    @staticmethod
+    def _latest_entry(metric_data: Dict) -> Tuple:
+        """取指标的最新(年份, 值)：按年份求最大项，一趟扫描免二次查键"""
+        return max(metric_data.items())
+
+    def _metrics_for_report(self, value_stocks: List[Dict]) -> Dict[str, Dict]:
+        """一次取齐报告所需的全部指标，概览表与财务指标表共享
+
+        两张表对同一股票各查一遍get_stock_metrics时，即使命中内存
+        缓存也要做两层拷贝；这里每只股票只取一次。加载走线程池：
+        每线程持独立SQLite连接，WAL下读操作可真正并行，行组装
+        本身拿到数据后是纯内存操作，保持单线程顺序写出
+        """
+        codes = list(dict.fromkeys(stock['stock_code'] for stock in value_stocks))
+        if not codes:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(8, len(codes))) as pool:
+            results = list(pool.map(self.get_stock_metrics, codes))
+
+        return {code: (data.get('metrics', {}) if data else {})
+                for code, data in zip(codes, results)}
+
+    def _generate_excel_report_streaming(self, value_stocks: List[Dict], output_file: str):
+        """xlsxwriter常量内存模式的三表报告
+
+        工作表内容与openpyxl版一致；write_row按行顺序写出后立即可被
+        刷盘，列宽在写入时顺带统计，免去openpyxl的整簿二次遍历
+        """
+        import xlsxwriter
+
+        wb = xlsxwriter.Workbook(output_file, {'constant_memory': True,
+                                               'strings_to_urls': False})
+        try:
+            header_fmt = wb.add_format({
+                'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#366092',
+                'align': 'center', 'valign': 'vcenter'})
+            green_fmt = wb.add_format({'bg_color': '#E8F5E8'})
+            yellow_fmt = wb.add_format({'bg_color': '#FFF2CC'})
+
+            def track_widths(widths: List[int], row_values: List) -> None:
+                for i, value in enumerate(row_values):
+                    if value is not None:
+                        widths[i] = max(widths[i], len(str(value)))
+
+            def apply_widths(ws, widths: List[int], cap: int) -> None:
+                for i, width in enumerate(widths):
+                    ws.set_column(i, i, min(width + 2, cap))
+
+            metrics_map = self._metrics_for_report(value_stocks)
+
+            # 1. 概览表
+            ws = wb.add_worksheet("📊 股票概览")
+            headers = [
+                "排名", "股票代码", "股票名称", "所属行业",
+                "综合评分", "投资等级",
+                "ROE(%)", "ROE年份", "债务比率(%)", "债务年份",
+                "流动比率", "流动年份", "毛利率(%)", "毛利年份",
+                "净利率(%)", "净利年份", "市净率", "市净年份",
+                "历史PE(年报)", "PE年份", "实时PE(当前)",
+                "巴菲特得分", "芒格得分", "格雷厄姆得分",
+                "分析时间"
+            ]
+            widths = [len(h) for h in headers]
+            ws.write_row(0, 0, headers, header_fmt)
+
+            for rank, stock in enumerate(value_stocks, 1):
+                metrics = metrics_map.get(stock['stock_code'], {})
+
+                row_values = [
+                    rank, stock['stock_code'], stock['stock_name'],
+                    stock['industry'], round(stock['total_score'], 1),
+                    stock['grade'],
+                ]
+                # 各指标取最新年份的(值, 年份)对
+                for metric_key in self._OVERVIEW_METRICS:
+                    data = metrics.get(metric_key, {})
+                    if data:
+                        latest_year, value = self._latest_entry(data)
+                        row_values.append(round(value, 2) if _is_num(value) else None)
+                        row_values.append(latest_year)
+                    else:
+                        row_values.extend((None, None))
+
+                realtime_pe = stock.get('realtime_pe')
+                row_values.append(round(realtime_pe, 2) if realtime_pe else None)
+                row_values.extend((
+                    stock['buffett_analysis']['score'],
+                    stock['munger_analysis']['score'],
+                    stock['graham_analysis']['score'],
+                    stock.get('evaluation_date', ''),
+                ))
+
+                ws.write_row(rank, 0, row_values)
+                track_widths(widths, row_values)
+            apply_widths(ws, widths, 20)
+
+            # 行底色改由两条条件格式规则表达：O(1)条规则代替O(N·列)次
+            # 带格式写入，Excel打开时才惰性求值；E列为综合评分
+            if value_stocks:
+                last_row = len(value_stocks)
+                last_col = len(headers) - 1
+                ws.conditional_format(1, 0, last_row, last_col, {
+                    'type': 'formula', 'criteria': '=$E2>=80',
+                    'format': green_fmt, 'stop_if_true': True})
+                ws.conditional_format(1, 0, last_row, last_col, {
+                    'type': 'formula', 'criteria': '=$E2>=70',
+                    'format': yellow_fmt})
+
+            # 2. 详细评分表
+            ws = wb.add_worksheet("📈 详细评分")
+            headers = ["股票代码", "股票名称", "评分项目", "得分详情", "评分说明"]
+            widths = [len(h) for h in headers]
+            ws.write_row(0, 0, headers, header_fmt)
+
+            current_row = 1
+            sections = (("🏆 巴菲特分析", 'buffett_analysis'),
+                        ("🧠 芒格分析", 'munger_analysis'),
+                        ("📚 格雷厄姆分析", 'graham_analysis'))
+            for stock in value_stocks:
+                for label, key in sections:
+                    analysis = stock[key]
+                    for detail in analysis['details']:
+                        row_values = [stock['stock_code'], stock['stock_name'],
+                                      label, detail, analysis['methodology']]
+                        ws.write_row(current_row, 0, row_values)
+                        track_widths(widths, row_values)
+                        current_row += 1
+                # 添加分隔行
+                current_row += 1
+            apply_widths(ws, widths, 50)
+
+            # 3. 多年财务指标表
+            ws = wb.add_worksheet("💰 多年财务指标")
+            years = [2020, 2021, 2022, 2023, 2024]
+            metrics_names = {
+                'roe': 'ROE(%)',
+                'debt_ratio': '债务比率(%)',
+                'current_ratio': '流动比率',
+                'gross_margin': '毛利率(%)',
+                'net_margin': '净利率(%)',
+                'pb': '市净率',
+                'pe': 'PE',
+                'asset_turnover': '资产周转率',
+                'dividend': '股息率(%)'
+            }
+            headers = ["股票代码", "股票名称", "指标"]
+            headers.extend(f"{year}年" for year in years)
+            headers.extend(("平均值", "趋势", "评价"))
+            widths = [len(h) for h in headers]
+            ws.write_row(0, 0, headers, header_fmt)
+
+            current_row = 1
+            for stock in value_stocks:
+                metrics = metrics_map.get(stock['stock_code'], {})
+
+                for metric_key, metric_name in metrics_names.items():
+                    if metric_key not in metrics:
+                        continue
+                    metric_data = metrics[metric_key]
+                    row_values = [stock['stock_code'], stock['stock_name'], metric_name]
+
+                    values = []
+                    for year in years:
+                        value = metric_data.get(year)
+                        if _is_num(value):
+                            row_values.append(round(value, 2))
+                            values.append(value)
+                        else:
+                            row_values.append(None)
+
+                    if values:
+                        avg_value = sum(values) / len(values)  # 至多5个数，sum比np.mean免去数组封装
+                        trend = self._calculate_trend(values)
+                        if trend > 0.1:
+                            trend_str = "上升📈"
+                        elif trend < -0.1:
+                            trend_str = "下降📉"
+                        else:
+                            trend_str = "稳定➡️"
+                        row_values.extend((round(avg_value, 2), trend_str,
+                                           self._evaluate_metric(metric_key, avg_value, trend)))
+
+                    ws.write_row(current_row, 0, row_values)
+                    track_widths(widths, row_values)
+                    current_row += 1
+                # 添加分隔行
+                current_row += 1
+            apply_widths(ws, widths, 20)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _track_row_widths(widths: List[int], row_values: List) -> None:
+        """按行更新各列最大内容宽度（write_only模式下列宽须先于数据行写入）"""
+        for i, value in enumerate(row_values):
+            if value is not None:
+                width = len(str(value))
+                if width > widths[i]:
+                    widths[i] = width
+
+    @staticmethod
+    def _apply_column_widths(ws, widths: List[int], cap: int) -> None:
+        """把统计好的列宽一次性写入工作表（+2边距，封顶cap）"""
+        from openpyxl.utils import get_column_letter
+
+        for i, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = min(width + 2, cap)
+
+    @staticmethod
+    def _header_row(ws, headers: List[str]) -> List:
+        """构造带样式的表头WriteOnlyCell行"""
+        from openpyxl.cell import WriteOnlyCell
+
+        header_font, header_fill, header_align = _excel_header_styles()
+        row = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_align
+            row.append(cell)
+        return row
+
+    def _create_overview_sheet(self, wb, value_stocks, metrics_map):
+        """创建概览工作表（write_only：先组装行并统计列宽，再顺序append）"""
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import NamedStyle
+
+        # 每档行底色注册为一个命名样式：单元格按名字引用同一个
+        # 样式表条目，省去逐单元格样式去重，也缩小styles.xml
+        for name, color in (('row_high', 'E8F5E8'),
+                            ('row_mid', 'FFF2CC'),
+                            ('row_low', 'FFFFFF')):
+            style = NamedStyle(name=name)
+            style.fill = _excel_fill(color)
+            wb.add_named_style(style)
+
         # 设置标题 - 重新设计为更实用的结构
         headers = [
-            "排名", "股票代码", "股票名称", "所属行业", 
+            "排名", "股票代码", "股票名称", "所属行业",
             "综合评分", "投资等级",
-            "ROE(%)", "ROE年份", "债务比率(%)", "债务年份", 
-            "流动比率", "流动年份", "毛利率(%)", "毛利年份", 
+            "ROE(%)", "ROE年份", "债务比率(%)", "债务年份",
+            "流动比率", "流动年份", "毛利率(%)", "毛利年份",
             "净利率(%)", "净利年份", "市净率", "市净年份",
             "历史PE(年报)", "PE年份", "实时PE(当前)",
-            "巴菲特得分", "芒格得分", "格雷厄姆得分", 
+            "巴菲特得分", "芒格得分", "格雷厄姆得分",
             "分析时间"
         ]
-        
-        # 写入标题行
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # 写入数据行
-        for row, stock in enumerate(value_stocks, 2):
-            # 获取详细财务数据
-            stock_data = self.get_stock_metrics(stock['stock_code'])
-            metrics = stock_data.get('metrics', {}) if stock_data else {}
-            
-            # 基本信息
-            ws.cell(row=row, column=1, value=row-1)  # 排名
-            ws.cell(row=row, column=2, value=stock['stock_code'])
-            ws.cell(row=row, column=3, value=stock['stock_name'])
-            ws.cell(row=row, column=4, value=stock['industry'])
-            ws.cell(row=row, column=5, value=round(stock['total_score'], 1))
-            ws.cell(row=row, column=6, value=stock['grade'])
-            
+
+        widths = [len(str(h)) for h in headers]
+        rows = []  # (row_values, fill_color)
+
+        for rank, stock in enumerate(value_stocks, 1):
+            metrics = metrics_map.get(stock['stock_code'], {})
+
+            row_values = [
+                rank, stock['stock_code'], stock['stock_name'],
+                stock['industry'], round(stock['total_score'], 1),
+                stock['grade'],
+            ]
+
             # 财务指标（取最新年份数据）
-            col_idx = 7
-            
-            # ROE
-            roe_data = metrics.get('roe', {})
-            if roe_data:
-                latest_year = max(roe_data.keys())
-                roe_value = roe_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(roe_value, 2) if pd.notna(roe_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 债务比率
-            debt_data = metrics.get('debt_ratio', {})
-            if debt_data:
-                latest_year = max(debt_data.keys())
-                debt_value = debt_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(debt_value, 2) if pd.notna(debt_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 流动比率
-            current_data = metrics.get('current_ratio', {})
-            if current_data:
-                latest_year = max(current_data.keys())
-                current_value = current_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(current_value, 2) if pd.notna(current_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 毛利率
-            gross_data = metrics.get('gross_margin', {})
-            if gross_data:
-                latest_year = max(gross_data.keys())
-                gross_value = gross_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(gross_value, 2) if pd.notna(gross_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 净利率
-            net_data = metrics.get('net_margin', {})
-            if net_data:
-                latest_year = max(net_data.keys())
-                net_value = net_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(net_value, 2) if pd.notna(net_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 市净率
-            pb_data = metrics.get('pb', {})
-            if pb_data:
-                latest_year = max(pb_data.keys())
-                pb_value = pb_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(pb_value, 2) if pd.notna(pb_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
-            # 历史PE(年报)
-            pe_data = metrics.get('pe', {})
-            if pe_data:
-                latest_year = max(pe_data.keys())
-                pe_value = pe_data[latest_year]
-                ws.cell(row=row, column=col_idx, value=round(pe_value, 2) if pd.notna(pe_value) else None)
-                ws.cell(row=row, column=col_idx+1, value=latest_year)
-            col_idx += 2
-            
+            for metric_key in self._OVERVIEW_METRICS:
+                metric_data = metrics.get(metric_key, {})
+                if metric_data:
+                    latest_year, value = self._latest_entry(metric_data)
+                    row_values.append(round(value, 2) if _is_num(value) else None)
+                    row_values.append(latest_year)
+                else:
+                    row_values.extend((None, None))
+
             # 实时PE(当前)
             realtime_pe = stock.get('realtime_pe')
-            ws.cell(row=row, column=col_idx, value=round(realtime_pe, 2) if realtime_pe else None)
-            col_idx += 1
-            
+            row_values.append(round(realtime_pe, 2) if realtime_pe else None)
+
             # 评分信息
-            ws.cell(row=row, column=col_idx, value=stock['buffett_analysis']['score'])
-            ws.cell(row=row, column=col_idx+1, value=stock['munger_analysis']['score'])
-            ws.cell(row=row, column=col_idx+2, value=stock['graham_analysis']['score'])
-            ws.cell(row=row, column=col_idx+3, value=stock.get('evaluation_date', ''))
-            
+            row_values.extend((
+                stock['buffett_analysis']['score'],
+                stock['munger_analysis']['score'],
+                stock['graham_analysis']['score'],
+                stock.get('evaluation_date', ''),
+            ))
+
             # 根据评分设置行颜色
             if stock['total_score'] >= 80:
-                fill_color = "E8F5E8"  # 浅绿色
+                style_name = 'row_high'  # 浅绿色
             elif stock['total_score'] >= 70:
-                fill_color = "FFF2CC"  # 浅黄色
+                style_name = 'row_mid'   # 浅黄色
             else:
-                fill_color = "FFFFFF"  # 白色
-                
-            for col in range(1, len(headers) + 1):
-                ws.cell(row=row, column=col).fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-        
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 20)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
+                style_name = 'row_low'   # 白色
+
+            self._track_row_widths(widths, row_values)
+            rows.append((row_values, style_name))
+
+        ws = wb.create_sheet("📊 股票概览")
+        self._apply_column_widths(ws, widths, cap=20)
+        ws.append(self._header_row(ws, headers))
+
+        for row_values, style_name in rows:
+            styled = []
+            for value in row_values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = style_name
+                styled.append(cell)
+            ws.append(styled)
+
     def _create_detailed_scores_sheet(self, wb, value_stocks):
-        """创建详细评分工作表"""
-        from openpyxl.styles import Font, Alignment, PatternFill
-        
-        ws = wb.create_sheet("📈 详细评分", 1)
-        
+        """创建详细评分工作表（write_only：先组装行并统计列宽，再顺序append）"""
         # 设置标题
         headers = ["股票代码", "股票名称", "评分项目", "得分详情", "评分说明"]
-        
-        # 写入标题行
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        current_row = 2
+
+        widths = [len(str(h)) for h in headers]
+        rows = []
+
+        sections = (
+            ("🏆 巴菲特分析", 'buffett_analysis'),
+            ("🧠 芒格分析", 'munger_analysis'),
+            ("📚 格雷厄姆分析", 'graham_analysis'),
+        )
+
         for stock in value_stocks:
             stock_code = stock['stock_code']
             stock_name = stock['stock_name']
-            
-            # 巴菲特评分详情
-            for detail in stock['buffett_analysis']['details']:
-                ws.cell(row=current_row, column=1, value=stock_code)
-                ws.cell(row=current_row, column=2, value=stock_name)
-                ws.cell(row=current_row, column=3, value="🏆 巴菲特分析")
-                ws.cell(row=current_row, column=4, value=detail)
-                ws.cell(row=current_row, column=5, value=stock['buffett_analysis']['methodology'])
-                current_row += 1
-            
-            # 芒格评分详情
-            for detail in stock['munger_analysis']['details']:
-                ws.cell(row=current_row, column=1, value=stock_code)
-                ws.cell(row=current_row, column=2, value=stock_name)
-                ws.cell(row=current_row, column=3, value="🧠 芒格分析")
-                ws.cell(row=current_row, column=4, value=detail)
-                ws.cell(row=current_row, column=5, value=stock['munger_analysis']['methodology'])
-                current_row += 1
-            
-            # 格雷厄姆评分详情
-            for detail in stock['graham_analysis']['details']:
-                ws.cell(row=current_row, column=1, value=stock_code)
-                ws.cell(row=current_row, column=2, value=stock_name)
-                ws.cell(row=current_row, column=3, value="📚 格雷厄姆分析")
-                ws.cell(row=current_row, column=4, value=detail)
-                ws.cell(row=current_row, column=5, value=stock['graham_analysis']['methodology'])
-                current_row += 1
-            
+
+            for label, key in sections:
+                analysis = stock[key]
+                for detail in analysis['details']:
+                    row_values = [stock_code, stock_name, label,
+                                  detail, analysis['methodology']]
+                    self._track_row_widths(widths, row_values)
+                    rows.append(row_values)
+
             # 添加分隔行
-            current_row += 1
-        
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    def _create_financial_metrics_sheet(self, wb, value_stocks):
-        """创建财务指标工作表 - 多年数据对比"""
-        from openpyxl.styles import Font, Alignment, PatternFill
-        
-        ws = wb.create_sheet("💰 多年财务指标", 2)
-        
+            rows.append([])
+
+        ws = wb.create_sheet("📈 详细评分")
+        self._apply_column_widths(ws, widths, cap=50)
+        ws.append(self._header_row(ws, headers))
+        for row_values in rows:
+            ws.append(row_values)
+
+    def _create_financial_metrics_sheet(self, wb, value_stocks, metrics_map):
+        """创建财务指标工作表 - 多年数据对比（write_only模式）"""
         if not value_stocks:
             return
-        
+
         # 构建多年数据表格
         years = [2020, 2021, 2022, 2023, 2024]
         metrics_names = {
@@ -1753,201 +3417,148 @@ class ValueInvestmentAgent:
             'asset_turnover': '资产周转率',
             'dividend': '股息率(%)'
         }
-        
+
         # 设置标题行
         headers = ["股票代码", "股票名称", "指标"]
         for year in years:
             headers.append(f"{year}年")
         headers.extend(["平均值", "趋势", "评价"])
-        
-        # 写入标题行
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        current_row = 2
-        
+
+        widths = [len(str(h)) for h in headers]
+        rows = []
+
         for stock in value_stocks:
             stock_code = stock['stock_code']
             stock_name = stock['stock_name']
-            
-            # 获取财务数据
-            stock_data = self.get_stock_metrics(stock_code)
-            metrics = stock_data.get('metrics', {}) if stock_data else {}
-            
+
+            metrics = metrics_map.get(stock_code, {})
+
             for metric_key, metric_name in metrics_names.items():
                 if metric_key in metrics:
                     metric_data = metrics[metric_key]
-                    
-                    # 基本信息
-                    ws.cell(row=current_row, column=1, value=stock_code)
-                    ws.cell(row=current_row, column=2, value=stock_name)
-                    ws.cell(row=current_row, column=3, value=metric_name)
-                    
+
+                    row_values = [stock_code, stock_name, metric_name]
+
                     # 各年数据
                     values = []
-                    col_idx = 4
                     for year in years:
                         value = metric_data.get(year)
-                        if value is not None and pd.notna(value):
-                            ws.cell(row=current_row, column=col_idx, value=round(value, 2))
+                        if _is_num(value):
+                            row_values.append(round(value, 2))
                             values.append(value)
                         else:
-                            ws.cell(row=current_row, column=col_idx, value=None)
-                        col_idx += 1
-                    
+                            row_values.append(None)
+
                     # 计算统计信息
                     if values:
-                        avg_value = np.mean(values)
+                        avg_value = sum(values) / len(values)  # 至多5个数，sum比np.mean免去数组封装
                         trend = self._calculate_trend(values)
-                        
-                        # 平均值
-                        ws.cell(row=current_row, column=col_idx, value=round(avg_value, 2))
-                        col_idx += 1
-                        
-                        # 趋势
+
                         if trend > 0.1:
                             trend_str = "上升📈"
                         elif trend < -0.1:
                             trend_str = "下降📉"
                         else:
                             trend_str = "稳定➡️"
-                        ws.cell(row=current_row, column=col_idx, value=trend_str)
-                        col_idx += 1
-                        
-                        # 评价
+
                         evaluation = self._evaluate_metric(metric_key, avg_value, trend)
-                        ws.cell(row=current_row, column=col_idx, value=evaluation)
-                    
-                    current_row += 1
-            
+                        row_values.extend((round(avg_value, 2), trend_str, evaluation))
+
+                    self._track_row_widths(widths, row_values)
+                    rows.append(row_values)
+
             # 添加分隔行
-            current_row += 1
-        
-        # 自动调整列宽
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 15)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
+            rows.append([])
+
+        ws = wb.create_sheet("💰 多年财务指标")
+        self._apply_column_widths(ws, widths, cap=15)
+        ws.append(self._header_row(ws, headers))
+        for row_values in rows:
+            ws.append(row_values)
+
+    # 指标评价标准：(优秀, 良好, 一般, 是否越低越好)；
+    # 每次调用重建字典的开销挪到类加载期
+    _METRIC_STANDARDS = {
+        'roe': (20, 15, 10, False),
+        'debt_ratio': (30, 50, 70, True),     # 低于30%为优秀
+        'current_ratio': (2.0, 1.5, 1.0, False),
+        'gross_margin': (30, 20, 10, False),
+        'net_margin': (10, 5, 2, False),
+        'pb': (2.0, 3.0, 5.0, True),          # 越低越好
+        'pe': (15, 25, 40, True),             # 越低越好
+    }
+
+    # 4档质量×3档趋势的全部组合预先拼好，逐单元格只做索引取现成串
+    _EVAL_LABELS = tuple(
+        tuple(f"{quality}{trend}" for trend in ("", " 向好", " 走弱"))
+        for quality in ("优秀✨", "良好✅", "一般📊", "较差⚠️")
+    )
+
     def _evaluate_metric(self, metric_key: str, avg_value: float, trend: float) -> str:
-        """评价财务指标"""
-        evaluations = {
-            'roe': {
-                'excellent': 20,
-                'good': 15,
-                'fair': 10,
-                'unit': '%'
-            },
-            'debt_ratio': {
-                'excellent': 30,  # 低于30%为优秀
-                'good': 50,
-                'fair': 70,
-                'unit': '%',
-                'reverse': True  # 越低越好
-            },
-            'current_ratio': {
-                'excellent': 2.0,
-                'good': 1.5,
-                'fair': 1.0,
-                'unit': ''
-            },
-            'gross_margin': {
-                'excellent': 30,
-                'good': 20,
-                'fair': 10,
-                'unit': '%'
-            },
-            'net_margin': {
-                'excellent': 10,
-                'good': 5,
-                'fair': 2,
-                'unit': '%'
-            },
-            'pb': {
-                'excellent': 2.0,
-                'good': 3.0,
-                'fair': 5.0,
-                'unit': '',
-                'reverse': True  # 越低越好
-            },
-            'pe': {
-                'excellent': 15,
-                'good': 25,
-                'fair': 40,
-                'unit': '',
-                'reverse': True  # 越低越好
-            }
-        }
-        
-        if metric_key not in evaluations:
+        """评价财务指标（标准与标签均为类级常量，调用不再拼接字符串）"""
+        standards = self._METRIC_STANDARDS.get(metric_key)
+        if standards is None:
             return "无评价标准"
-        
-        standards = evaluations[metric_key]
-        is_reverse = standards.get('reverse', False)
-        
-        if is_reverse:
+
+        excellent, good, fair, reverse = standards
+
+        if reverse:
             # 越低越好的指标
-            if avg_value <= standards['excellent']:
-                quality = "优秀✨"
-            elif avg_value <= standards['good']:
-                quality = "良好✅"
-            elif avg_value <= standards['fair']:
-                quality = "一般📊"
+            if avg_value <= excellent:
+                quality_idx = 0
+            elif avg_value <= good:
+                quality_idx = 1
+            elif avg_value <= fair:
+                quality_idx = 2
             else:
-                quality = "较差⚠️"
+                quality_idx = 3
         else:
             # 越高越好的指标
-            if avg_value >= standards['excellent']:
-                quality = "优秀✨"
-            elif avg_value >= standards['good']:
-                quality = "良好✅"
-            elif avg_value >= standards['fair']:
-                quality = "一般📊"
+            if avg_value >= excellent:
+                quality_idx = 0
+            elif avg_value >= good:
+                quality_idx = 1
+            elif avg_value >= fair:
+                quality_idx = 2
             else:
-                quality = "较差⚠️"
-        
-        # 添加趋势信息
-        if trend > 0.1:
-            trend_desc = " 向好"
-        elif trend < -0.1:
-            trend_desc = " 走弱"
-        else:
-            trend_desc = ""
-        
-        return f"{quality}{trend_desc}"
-    
-    def _calculate_trend(self, values: List[float]) -> float:
+                quality_idx = 3
+
+        # 趋势档位
+        trend_idx = 1 if trend > 0.1 else 2 if trend < -0.1 else 0
+
+        return self._EVAL_LABELS[quality_idx][trend_idx]
+
+    @staticmethod
+    def _calculate_trend(values) -> float:
         """计算趋势（正值表示上升，负值表示下降）"""
-        if len(values) < 2:
-            return 0
-        
-        x = np.arange(len(values))
-        coeffs = np.polyfit(x, values, 1)
-        return coeffs[0]  # 返回斜率
-    
-    def _calculate_growth_rate(self, values: List[float]) -> float:
-        """计算增长率"""
-        if len(values) < 2:
-            return 0
-        
-        start_value = values[0]
-        end_value = values[-1]
-        years = len(values) - 1
-        
-        if start_value <= 0:
-            return 0
-        
-        return (end_value / start_value) ** (1/years) - 1
+        arr = np.asarray(values, dtype=float)
+        if NUMBA_AVAILABLE:
+            # JIT核内单趟扫描即可跳过NaN并累加各求和项
+            return float(_nb_trend(arr))
+
+        arr = arr[~np.isnan(arr)]
+        n = len(arr)
+        if n < 2:
+            return 0.0
+
+        # 闭式OLS斜率：x=arange(n)时分母恒为n(n²-1)/12，
+        # 免去polyfit的Vandermonde矩阵与最小二乘求解
+        x = np.arange(n, dtype=float)
+        return float(((x - x.mean()) * (arr - arr.mean())).sum()
+                     / ((n * n * n - n) / 12.0))
+
+    @staticmethod
+    def _calculate_growth_rate(values) -> float:
+        """计算复合增长率（首末值口径）"""
+        arr = np.asarray(values, dtype=float)
+        if NUMBA_AVAILABLE:
+            return float(_nb_cagr(arr))
+
+        arr = arr[~np.isnan(arr)]
+        if len(arr) < 2 or arr[0] <= 0:
+            return 0.0
+
+        return float((arr[-1] / arr[0]) ** (1.0 / (len(arr) - 1)) - 1.0)
     
     def analyze_single_stock(self, stock_code: str) -> Dict:
         """分析单个股票"""
@@ -2030,31 +3641,34 @@ def main():
             if results:
                 logger.info(f"✅ 成功分析 {len(results)} 只股票")
                 
-                # 显示分析摘要
-                print("\n" + "="*100)
-                print("📊 价值投资分析摘要")
-                print("="*100)
-                
                 # 统计信息
                 high_score = [r for r in results if r['total_score'] >= 70]
                 medium_score = [r for r in results if 50 <= r['total_score'] < 70]
-                
-                print(f"总分析股票: {len(results)} 只")
-                print(f"高分股票(≥70分): {len(high_score)} 只")
-                print(f"中等股票(50-69分): {len(medium_score)} 只")
-                print(f"API调用统计: {sum(1 for r in results if r.get('pe_api_used', False))} 次")
-                
-                # 显示前10名
-                print(f"\n🏆 前10名优质股票:")
-                print("-"*100)
-                print(f"{'排名':<4} {'股票代码':<10} {'股票名称':<20} {'综合评分':<8} {'实时PE':<8} {'行业':<20}")
-                print("-"*100)
-                
+
+                # 整屏摘要拼好后一次写出，免去逐行print的加锁与系统调用
+                lines = [
+                    "",
+                    "=" * 100,
+                    "📊 价值投资分析摘要",
+                    "=" * 100,
+                    f"总分析股票: {len(results)} 只",
+                    f"高分股票(≥70分): {len(high_score)} 只",
+                    f"中等股票(50-69分): {len(medium_score)} 只",
+                    f"API调用统计: {sum(1 for r in results if r.get('pe_api_used', False))} 次",
+                    "",
+                    "🏆 前10名优质股票:",
+                    "-" * 100,
+                    f"{'排名':<4} {'股票代码':<10} {'股票名称':<20} {'综合评分':<8} {'实时PE':<8} {'行业':<20}",
+                    "-" * 100,
+                ]
+
                 for i, stock in enumerate(results[:10], 1):
                     realtime_pe = stock.get('realtime_pe', stock.get('pe_ratio', 'N/A'))
                     pe_str = f"{realtime_pe:.1f}" if isinstance(realtime_pe, (int, float)) else str(realtime_pe)
-                    print(f"{i:<4} {stock['stock_code']:<10} {stock['stock_name'][:18]:<20} "
-                          f"{stock['total_score']:<8.1f} {pe_str:<8} {stock['industry'][:18]:<20}")
+                    lines.append(f"{i:<4} {stock['stock_code']:<10} {stock['stock_name'][:18]:<20} "
+                                 f"{stock['total_score']:<8.1f} {pe_str:<8} {stock['industry'][:18]:<20}")
+
+                sys.stdout.write('\n'.join(lines) + '\n')
                 
                 # 输出Excel
                 if args.output_excel or not args.test:  # 非测试模式默认输出Excel
@@ -2065,12 +3679,12 @@ def main():
                 # 输出Markdown
                 agent.generate_analysis_report(results)
                 
-                print("\n" + "="*100)
-                print("📈 分析完成！")
+                lines = ["", "=" * 100, "📈 分析完成！"]
                 if args.output_excel or not args.test:
-                    print("📊 Excel报告: value_stocks_analysis.xlsx")
-                print("📝 Markdown报告: 价值投资分析报告.md")
-                print("="*100)
+                    lines.append("📊 Excel报告: value_stocks_analysis.xlsx")
+                lines.append("📝 Markdown报告: 价值投资分析报告.md")
+                lines.append("=" * 100)
+                sys.stdout.write('\n'.join(lines) + '\n')
                 
             else:
                 logger.warning("⚠️  没有找到符合条件的股票")